@@ -2,6 +2,7 @@
 import numpy as np
 import matplotlib.pyplot as plt
 from scipy.stats import linregress
+from stage_profile import stage
 
 # Theta arrays (N=23)
 x_theta = np.array([
@@ -56,6 +57,7 @@ zeta_df = pd.DataFrame({'ln_delta_NCPV': x_zeta, 'ln_delta_CAC': y_zeta})
 beta_df = pd.concat([theta_df, eta_df], ignore_index=True)
 
 # Function to compute regression if valid points exist
+@stage('regression fit')
 def get_regression(x, y):
     mask = (x > 0) & (y > 0)
     x_valid = x[mask]
@@ -100,4 +102,5 @@ plt.ylabel('ln(ΔCAC + 1)')
 plt.title('Combined Delta Regressions: Zeta, Theta, Eta')
 plt.legend()
 plt.grid(True)
-plt.show()
\ No newline at end of file
+with stage('matplotlib draw'):
+    plt.show()
\ No newline at end of file
@@ -1,6 +1,5 @@
 import numpy as np
-import matplotlib.pyplot as plt
-from PIL import Image
+from stereo_render import Scene, StereoCamera, render_stereo, save_stereo, stereo_coordinates
 
 # Data from your document (unmasked, including zeros for boundaries)
 # Zeta
@@ -18,46 +17,21 @@ ratio0_eta = np.array([0.8688607994125579, 1.0630901185378252, 0.996173054249224
 ratio1_eta = np.array([0.8408890290104237, 0.8983622221657899, 0.8586308679540858, 0.7681527424747342, 0.9330379097641369, 0.8989095019787317, 1.033377601382106, 0.664608080850563, 0.9191112554962112, 0.8835428801490052, 0.7832104228023535, 1.130087818908135, 0.8919864268699415, 1.0594671601894434, 0.9933697952812031, 1.1339433933635201, 0.842936576767417])
 ln_cac1_eta = np.array([3.7376696182833684, 4.663439094112067, 4.584967478670572, 4.6443908991413725, 4.584967478670572, 5.389071729816501, 5.5053315359323625, 3.58351893845611, 5.537334267018537, 5.541263545158426, 4.61512051684126, 5.993961427306569, 5.442417710521793, 6.645090969505644, 5.777652323222656, 5.60947179518496, 5.54907608489522])
 
-# Function to plot 2D regression view
-def plot_view(ratio, ln_cac1, color, marker, label, ax, offset=0):
-    ax.scatter(ratio + offset, ln_cac1, c=color, marker=marker, label=label)
-    ax.set_xlim(-0.1, 1.4)
-    ax.set_ylim(-0.1, 7)
-    ax.axis('off')
-
-# Create left view (ratio0 vs. ln_cac1)
-fig_left, ax_left = plt.subplots()
-plot_view(ratio0_zeta, ln_cac1_zeta, 'orange', 'D', 'Zeta', ax_left)
-plot_view(ratio0_theta, ln_cac1_theta, 'purple', 'o', 'Theta', ax_left)
-plot_view(ratio0_eta, ln_cac1_eta, 'green', 's', 'Eta', ax_left)
-fig_left.savefig('left.png', bbox_inches='tight', pad_inches=0)
-plt.close(fig_left)
-
-# Create right view (ratio1 vs. ln_cac1, with disparity offset)
-disparity_scale = 0.05  # Adjust for depth effect (smaller = subtler stereo)
-fig_right, ax_right = plt.subplots()
-plot_view(ratio1_zeta, ln_cac1_zeta, 'orange', 'D', 'Zeta', ax_right, offset=-disparity_scale)
-plot_view(ratio1_theta, ln_cac1_theta, 'purple', 'o', 'Theta', ax_right, offset=-disparity_scale)
-plot_view(ratio1_eta, ln_cac1_eta, 'green', 's', 'Eta', ax_right, offset=-disparity_scale)
-fig_right.savefig('right.png', bbox_inches='tight', pad_inches=0)
-plt.close(fig_right)
-
-# Create anaglyph (red-cyan)
-left_img = Image.open('left.png').convert('RGB')
-right_img = Image.open('right.png').convert('RGB')
-left_img = left_img.resize(right_img.size)  # Ensure same size
-anaglyph = Image.new('RGB', left_img.size)
-for i in range(left_img.size[0]):
-    for j in range(left_img.size[1]):
-        r, g, b = left_img.getpixel((i, j))
-        _, g2, b2 = right_img.getpixel((i, j))
-        anaglyph.putpixel((i, j), (r, g2, b2))
-anaglyph.save('anaglyph.png')
-
-# Create cross-eyed pair (side-by-side)
-cross_eyed = Image.new('RGB', (left_img.size[0] * 2, left_img.size[1]))
-cross_eyed.paste(right_img, (0, 0))
-cross_eyed.paste(left_img, (left_img.size[0], 0))
-cross_eyed.save('cross_eyed.png')
-
-print("Generated 'anaglyph.png' (view with red-cyan glasses) and 'cross_eyed.png' (cross your eyes to merge).")
\ No newline at end of file
+# One 3D scene: x = mean ratio, depth = ratio0 - ratio1 (disparity), z = ln_cac1
+depth_scale = 1.0  # Depth exaggeration relative to the other axes
+scene = Scene()
+for ratio0, ratio1, ln_cac1, color, marker, label in [
+    (ratio0_zeta, ratio1_zeta, ln_cac1_zeta, 'orange', 'D', 'Zeta'),
+    (ratio0_theta, ratio1_theta, ln_cac1_theta, 'purple', 'o', 'Theta'),
+    (ratio0_eta, ratio1_eta, ln_cac1_eta, 'green', 's', 'Eta'),
+]:
+    x_3d, y_3d, z_3d = stereo_coordinates(ratio0, ratio1, ln_cac1, depth_scale)
+    scene.add_points(x_3d, z_3d, y_3d, color=color, marker=marker, radius=4, label=label)
+
+# Looking straight down the depth axis; eye separation and convergence set the stereo strength
+camera = StereoCamera(azimuth=-90, elevation=0, distance=4.0, convergence=4.0, eye_separation=0.15)
+frames = render_stereo(scene, camera, width=640, height=480, box_aspect=(1.0, 0.5, 1.0))
+save_stereo(frames, formats=('left', 'right', 'anaglyph', 'cross_eyed', 'parallel'))
+
+print("Generated 'anaglyph.png' (view with red-cyan glasses), 'cross_eyed.png' (cross your eyes to merge) "
+      "and 'parallel.png' (parallel viewing).")
@@ -0,0 +1,368 @@
+"""
+Staged asyncio pipeline with bounded queues.
+
+DataMiner's QueueProcessor polls a ConcurrentQueue and sleeps when it is
+empty. Here every stage waits on an asyncio.Queue instead, so an idle
+stage costs nothing and a full queue holds its producer back
+(backpressure) instead of letting results pile up. Stages run their
+function inline on the event loop (cheap steps, coroutine functions), on
+a thread pool (NumPy and file I/O release the GIL) or on a process pool
+(pure-Python CPU work; the function and items must pickle).
+
+    pipeline = Pipeline([Stage('load', load, executor='thread'),
+                         Stage('fit', fit, workers=2),
+                         Stage('encode', encode, executor='thread')], queue_size=4)
+    results = pipeline.run(seeds)
+    print(pipeline.stats_table())
+
+With more than one worker a stage hands items on in completion order.
+Every stage reports items in and out, busy time, time starved for input,
+time blocked by a full downstream queue, throughput and the depth of its
+input queue. Thread-pool calls are also recorded with stage_profile.
+
+The batch job in main() runs replicate cohorts through
+load -> derive -> classify -> fit -> render -> encode:
+
+    python async_pipeline.py --replicates 8 --synthetic 50000 --out-dir pipeline_out
+"""
+import argparse
+import asyncio
+import functools
+import inspect
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import keto_data
+import regression_mine
+from stage_profile import stage
+
+# Marks the end of a stream; each stage forwards it once all its workers are done
+_END = object()
+
+
+class Stage:
+    """
+    One pipeline step. func(item) returns the item for the next stage; None
+    drops the item, and with fan_out the result is an iterable whose
+    elements are passed on one by one. executor is None (inline on the
+    event loop), 'thread', 'process' or an Executor instance.
+    """
+
+    def __init__(self, name, func, workers=1, executor='thread', fan_out=False, queue_size=None):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.executor = executor
+        self.fan_out = fan_out
+        self.queue_size = queue_size
+
+    def __repr__(self):
+        return f'Stage({self.name}, workers={self.workers}, executor={self.executor})'
+
+
+class StageStats:
+    """Counters for one stage; times are seconds summed over its workers."""
+
+    def __init__(self, name, workers, capacity):
+        self.name = name
+        self.workers = workers
+        self.capacity = capacity
+        self.items_in = 0
+        self.items_out = 0
+        self.busy = 0.0
+        self.starved = 0.0
+        self.blocked = 0.0
+        self.depth_sum = 0
+        self.depth_max = 0
+        self.first = None
+        self.last = None
+
+    @property
+    def wall(self):
+        return (self.last - self.first) if self.first is not None else 0.0
+
+    @property
+    def items_per_s(self):
+        return self.items_in / self.wall if self.wall > 0 else None
+
+    @property
+    def mean_depth(self):
+        return self.depth_sum / self.items_in if self.items_in else 0.0
+
+    @property
+    def utilization(self):
+        return self.busy / (self.wall * self.workers) if self.wall > 0 else None
+
+    def as_dict(self):
+        return {'stage': self.name, 'workers': self.workers, 'items_in': self.items_in,
+                'items_out': self.items_out, 'busy_s': self.busy, 'starved_s': self.starved,
+                'blocked_s': self.blocked, 'items_per_s': self.items_per_s, 'utilization': self.utilization,
+                'mean_depth': self.mean_depth, 'max_depth': self.depth_max, 'capacity': self.capacity}
+
+
+def _profiled(name, func, item):
+    """Runs func(item) under a stage_profile record (in a worker thread, with that thread's CPU clock)."""
+    with stage(name, 1):
+        return func(item)
+
+
+def _drain(func, item):
+    """A fan-out call materialized where it runs, so generators do not execute on the event loop."""
+    return list(func(item))
+
+
+class Pipeline:
+    """Stages connected by bounded asyncio queues (queue_size items each, unless a stage sets its own)."""
+
+    def __init__(self, stages, queue_size=4):
+        self.stages = list(stages)
+        self.queue_size = queue_size
+        self.stats = []
+        self.wall = 0.0
+
+    async def _call(self, st, executor, item):
+        func = st.func
+        if inspect.iscoroutinefunction(func):
+            result = await func(item)
+            return list(result) if st.fan_out else result
+        if st.fan_out:
+            func = functools.partial(_drain, func)
+        if executor is None:
+            return func(item)
+        if isinstance(executor, ThreadPoolExecutor):
+            func = functools.partial(_profiled, st.name, func)
+        return await asyncio.get_running_loop().run_in_executor(executor, func, item)
+
+    async def _worker(self, st, stats, executor, inbox, outbox):
+        while True:
+            depth = inbox.qsize()
+            t0 = time.perf_counter()
+            item = await inbox.get()
+            t1 = time.perf_counter()
+            if item is _END:
+                # Leave the marker for this stage's other workers
+                inbox.put_nowait(_END)
+                return
+            stats.starved += t1 - t0
+            stats.items_in += 1
+            stats.depth_sum += depth
+            stats.depth_max = max(stats.depth_max, depth)
+            stats.first = t1 if stats.first is None else stats.first
+            result = await self._call(st, executor, item)
+            t2 = time.perf_counter()
+            stats.busy += t2 - t1
+            for out in (result if st.fan_out else (result,)):
+                if out is None:
+                    continue
+                await outbox.put(out)
+                stats.items_out += 1
+            t3 = time.perf_counter()
+            stats.blocked += t3 - t2
+            stats.last = t3
+
+    async def _stage(self, st, stats, executor, inbox, outbox):
+        await asyncio.gather(*(self._worker(st, stats, executor, inbox, outbox) for _ in range(st.workers)))
+        await outbox.put(_END)
+
+    @staticmethod
+    async def _feed(source, outbox):
+        if hasattr(source, '__aiter__'):
+            async for item in source:
+                await outbox.put(item)
+        else:
+            for item in source:
+                await outbox.put(item)
+        await outbox.put(_END)
+
+    async def stream(self, source):
+        """Async generator of the last stage's outputs for the items of source (an iterable or async iterable)."""
+        queues = [asyncio.Queue(st.queue_size or self.queue_size) for st in self.stages]
+        queues.append(asyncio.Queue(self.queue_size))
+        self.stats = [StageStats(st.name, st.workers, q.maxsize) for st, q in zip(self.stages, queues)]
+        owned = []
+        executors = []
+        for st in self.stages:
+            executor = st.executor
+            if executor in ('thread', 'process'):
+                # One pool per stage, sized to its workers, so stages never queue behind each other's work
+                pool = ThreadPoolExecutor if executor == 'thread' else ProcessPoolExecutor
+                executor = pool(max_workers=st.workers)
+                owned.append(executor)
+            elif executor is not None and not isinstance(executor, Executor):
+                raise ValueError(f"executor must be None, 'thread', 'process' or an Executor, not {executor!r}")
+            executors.append(executor)
+
+        t0 = time.perf_counter()
+        tasks = [asyncio.ensure_future(self._feed(source, queues[0]))]
+        tasks += [asyncio.ensure_future(self._stage(st, stats, ex, queues[i], queues[i + 1]))
+                  for i, (st, stats, ex) in enumerate(zip(self.stages, self.stats, executors))]
+        running = asyncio.gather(*tasks)
+        try:
+            while True:
+                get = asyncio.ensure_future(queues[-1].get())
+                await asyncio.wait({get, running}, return_when=asyncio.FIRST_COMPLETED)
+                if not get.done():
+                    get.cancel()
+                    # A stage failed (or everything finished without an end marker); surface the error
+                    running.result()
+                    return
+                item = get.result()
+                if item is _END:
+                    break
+                yield item
+            await running
+        finally:
+            if not running.done():
+                running.cancel()
+                await asyncio.gather(running, return_exceptions=True)
+            for pool in owned:
+                pool.shutdown(wait=True, cancel_futures=True)
+            self.wall = time.perf_counter() - t0
+
+    def run(self, source, sink=None):
+        """
+        Runs the pipeline to completion. Without a sink the last stage's
+        outputs are returned as a list; with one, sink(output) is called for
+        each and the number of outputs is returned.
+        """
+        async def consume():
+            results = []
+            count = 0
+            async for item in self.stream(source):
+                count += 1
+                if sink is None:
+                    results.append(item)
+                else:
+                    sink(item)
+            return results if sink is None else count
+
+        with stage('pipeline'):
+            return asyncio.run(consume())
+
+    def stats_frame(self):
+        return pd.DataFrame([s.as_dict() for s in self.stats])
+
+    def stats_table(self):
+        if not self.stats:
+            return 'Pipeline has not run.'
+        width = max(len('Stage'), max(len(s.name) for s in self.stats))
+        lines = [f"{'Stage':<{width}}  {'Workers':>7}  {'In':>7}  {'Out':>7}  {'Busy s':>8}  {'Starved s':>9}  "
+                 f"{'Blocked s':>9}  {'Items/s':>9}  {'Util %':>6}  {'Queue mean/max/cap':>18}"]
+        lines.append('-' * len(lines[0]))
+        for s in self.stats:
+            rate = f'{s.items_per_s:9.2f}' if s.items_per_s else f"{'-':>9}"
+            util = f'{100 * s.utilization:6.1f}' if s.utilization is not None else f"{'-':>6}"
+            depth = f'{s.mean_depth:.1f}/{s.depth_max}/{s.capacity}'
+            lines.append(f'{s.name:<{width}}  {s.workers:>7}  {s.items_in:>7}  {s.items_out:>7}  {s.busy:8.2f}  '
+                         f'{s.starved:9.2f}  {s.blocked:9.2f}  {rate}  {util}  {depth:>18}')
+        lines.append(f'Pipeline wall time {self.wall:.2f} s')
+        return '\n'.join(lines)
+
+
+# The replicate batch job: one item per cohort, carried through the stages as a dict
+
+def _load(job, source, n):
+    store = keto_data.synthetic_cohort(n, seed=job['seed'], source=source) if n else source
+    return dict(job, store=store)
+
+
+def _derive(job, columns):
+    job['store'].materialize(columns)
+    return job
+
+
+def _classify(job, min_n):
+    sizes = job['store'].set_sizes()
+    return dict(job, sizes=sizes, sets=[s for s in keto_data.SET_NAMES if sizes[s] >= min_n])
+
+
+def _fit(job, columns, x, y, min_n):
+    store = job.pop('store')
+    job['results'] = regression_mine.mine(store, sets=job['sets'], dependents=columns, regressors=columns,
+                                          min_n=min_n)
+    # Only what render needs outlives this stage, not the whole store
+    job['points'] = {s: (store.view(s).column(x), store.view(s).column(y)) for s in keto_data.LEAF_ORDER}
+    return job
+
+
+def _render(job, x, y, dpi=100):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    from chart_build import SET_STYLES
+    fig = Figure(figsize=(8, 6), dpi=dpi)
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    fits = job['results'].set_index(['set', 'dependent', 'regressor'])
+    for set_name, (xs, ys) in job.pop('points').items():
+        color, marker = SET_STYLES[set_name]
+        ax.scatter(xs, ys, s=4, color=color, marker=marker, alpha=0.5, label=f'{set_name} (N={len(xs)})')
+        if (set_name, y, x) in fits.index:
+            fit = fits.loc[(set_name, y, x)]
+            grid = np.array([np.nanmin(xs), np.nanmax(xs)])
+            ax.plot(grid, fit['intercept'] + fit['slope'] * grid, color=color,
+                    label=f"{set_name} Slope: {fit['slope']:.3f}, R²: {fit['r2']:.3f}")
+    ax.set_xlabel(x)
+    ax.set_ylabel(y)
+    ax.set_title(f"Replicate {job['seed']}: {y} vs {x}")
+    ax.legend(fontsize=7)
+    ax.grid(True)
+    canvas.draw()
+    job['image'] = np.asarray(canvas.buffer_rgba())[..., :3].copy()
+    return job
+
+
+def _encode(job, out_dir):
+    from PIL import Image
+    stem = os.path.join(out_dir, f"replicate_{job['seed']:04d}")
+    Image.fromarray(job.pop('image')).save(stem + '.png', optimize=True)
+    job['results'].to_csv(stem + '.csv', index=False, float_format='%.10g')
+    return {'seed': job['seed'], 'rows': len(job.pop('results')), 'sizes': job['sizes'], 'path': stem}
+
+
+def replicate_pipeline(source, n, out_dir, columns, x='Cac0', y='Cac1', min_n=4, fit_workers=1, queue_size=2):
+    """The load -> derive -> classify -> fit -> render -> encode job for replicate cohorts of n participants."""
+    columns = list(dict.fromkeys(list(columns) + [x, y]))
+    return Pipeline([
+        Stage('load', functools.partial(_load, source=source, n=n)),
+        Stage('derive', functools.partial(_derive, columns=columns)),
+        Stage('classify', functools.partial(_classify, min_n=min_n), executor=None),
+        Stage('fit', functools.partial(_fit, columns=columns, x=x, y=y, min_n=min_n), workers=fit_workers),
+        Stage('render', functools.partial(_render, x=x, y=y)),
+        Stage('encode', functools.partial(_encode, out_dir=out_dir)),
+    ], queue_size=queue_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replicate cohorts through load, derive, classify, fit, render '
+                                                 'and encode, overlapped with bounded asyncio queues.')
+    parser.add_argument('--replicates', type=int, default=8)
+    parser.add_argument('--synthetic', type=int, default=50_000, help='participants per replicate (0 = real data)')
+    parser.add_argument('--families', nargs='*', default=['visit', 'ln_visit', 'delta'])
+    parser.add_argument('--x', default='Cac0')
+    parser.add_argument('--y', default='Cac1')
+    parser.add_argument('--fit-workers', type=int, default=1)
+    parser.add_argument('--queue-size', type=int, default=2)
+    parser.add_argument('--out-dir', default='pipeline_out')
+    args = parser.parse_args()
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    source = keto_data.load()
+    columns = regression_mine.all_columns(source.n_visits, args.families)
+    pipeline = replicate_pipeline(source, args.synthetic, args.out_dir, columns, args.x, args.y,
+                                  fit_workers=args.fit_workers, queue_size=args.queue_size)
+
+    def report(done):
+        sizes = ', '.join(f'{s} {done["sizes"][s]}' for s in keto_data.LEAF_ORDER)
+        print(f"replicate {done['seed']}: {done['rows']} regressions ({sizes}) -> {done['path']}.csv/.png")
+
+    count = pipeline.run(({'seed': seed} for seed in range(args.replicates)), sink=report)
+    print(f'\n{count} replicates written to {args.out_dir!r}')
+    print(pipeline.stats_table())
+
+
+if __name__ == '__main__':
+    main()
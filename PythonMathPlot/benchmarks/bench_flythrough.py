@@ -0,0 +1,52 @@
+"""
+Fly-through frame rate: the mplot3d FuncAnimation path against the raster
+backend (flythrough_render), same spec, same frames, same resolution.
+Both write the GIF, so the times include encoding.
+
+    python benchmarks/bench_flythrough.py --chart fly_through_enhanced --frames 60
+"""
+import argparse
+import copy
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import chart_build  # noqa: E402
+
+
+def timed(spec, store, path):
+    t0 = time.perf_counter()
+    chart_build.render_flythrough(spec, store, path)
+    return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chart', default='fly_through_enhanced')
+    parser.add_argument('--frames', type=int, default=60)
+    parser.add_argument('--specs', default=chart_build.DEFAULT_SPECS)
+    args = parser.parse_args()
+
+    base = chart_build.load_specs(args.specs)[args.chart]
+    store = chart_build.DataCache().store(base.get('data', 'keto'))
+    dpi = base.get('dpi', 100)
+    width, height = (int(round(v * dpi)) for v in base.get('figsize', (10, 8)))
+    print(f"{args.chart}: {args.frames} frames at {width}x{height}")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as work:
+        for backend in ('mplot3d', 'raster'):
+            spec = copy.deepcopy(base)
+            spec.setdefault('animation', {}).update(frames=args.frames, backend=backend)
+            path = os.path.join(work, f'{backend}.gif')
+            elapsed = timed(spec, store, path)
+            results[backend] = elapsed
+            print(f'{backend:<8} {elapsed:8.2f}s {args.frames / elapsed:8.1f} fps {os.path.getsize(path) / 1e6:8.2f} MB')
+    print(f"raster backend is {results['mplot3d'] / results['raster']:.1f}x faster")
+
+
+if __name__ == '__main__':
+    main()
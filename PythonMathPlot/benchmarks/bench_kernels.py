@@ -0,0 +1,135 @@
+"""
+Loop kernels (jit_kernels) against the NumPy paths they can replace:
+stereo splatting, frame compositing, the Theil-Sen inversion count and
+per-participant Gauss-Newton growth fits. Every case checks that both
+paths give the same result.
+
+With numba installed the loops are timed compiled (the first call, which
+compiles, is left out). Without it they are only checked, uncompiled, on
+a small input, and the NumPy times are reported.
+
+    python benchmarks/bench_kernels.py --points 200000 --participants 1000000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import growth_fit  # noqa: E402
+import jit_kernels  # noqa: E402
+import keto_data  # noqa: E402
+import robust_regression  # noqa: E402
+import stereo_render  # noqa: E402
+
+
+def run(backend, func, repeat=1):
+    """func() under a kernel backend: (result, best time of repeat calls)."""
+    jit_kernels.set_backend(backend)
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - t0)
+    jit_kernels.set_backend('auto')
+    return result, best
+
+
+def splat_case(n, width=1000, height=800):
+    rng = np.random.default_rng(0)
+    scene = stereo_render.Scene()
+    for marker, radius in (('o', 4), ('s', 3), ('D', 5), ('^', 4), ('.', 0)):
+        scene.add_points(*rng.normal(size=(3, n // 5)), marker=marker, radius=radius)
+    px, py, depth = stereo_render.project(scene, stereo_render.StereoCamera(), width, height)
+    # Coarse depths force ties, so tie-breaking is checked too
+    depth = np.round(depth, 2)
+
+    def func():
+        return stereo_render.splat(px, py, depth, scene.markers, scene.radii, width, height)
+    return func, np.array_equal
+
+
+def composite_case(frames, width=1000, height=800):
+    rng = np.random.default_rng(1)
+    winner = rng.integers(-1, 500, size=(frames, height, width)).astype(np.int32)
+    lut = rng.integers(0, 200, size=501).astype(np.uint8)
+    mask = rng.random((height, width)) < 0.1
+    overlay = rng.integers(200, 256, size=(height, width)).astype(np.uint8)
+
+    def func():
+        if jit_kernels.use_loops():
+            out = np.empty(winner.shape, dtype=np.uint8)
+            jit_kernels.composite(winner, lut, overlay, mask, out)
+            return out
+        out = lut[winner]
+        np.copyto(out, overlay, where=mask)
+        return out
+    return func, np.array_equal
+
+
+def theil_sen_case(n):
+    rng = np.random.default_rng(2)
+    x = np.round(rng.normal(size=n), 3)
+    y = 2 * x + rng.standard_t(2, size=n)
+
+    def func():
+        return robust_regression.theil_sen(x, y)
+    return func, np.array_equal
+
+
+def growth_case(n):
+    store = keto_data.synthetic_cohort(n, seed=3, waves=(0, 1, 2, 3.5))
+    values, years = store.visit('Ncpv'), store.years
+
+    def func():
+        fit = growth_fit.fit_gauss_newton(values, years)
+        return np.column_stack([fit['rate'], fit['amplitude'], fit['rss']])
+
+    def same(a, b):
+        # Both stop within the fit tolerance of the same minimum: equal RSS, parameters close to it
+        return (np.allclose(a[:, 2], b[:, 2], rtol=1e-9, atol=0, equal_nan=True)
+                and np.allclose(a[:, :2], b[:, :2], rtol=1e-4, atol=0, equal_nan=True))
+    return func, same
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--points', type=int, default=200_000, help='splatted points per eye')
+    parser.add_argument('--frames', type=int, default=16, help='composited frames')
+    parser.add_argument('--slopes', type=int, default=20_000, help='Theil-Sen sample size')
+    parser.add_argument('--participants', type=int, default=200_000, help='Gauss-Newton growth fits')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    compiled = jit_kernels.numba is not None
+    loops = 'numba' if compiled else 'python'
+    print('numba ' + (jit_kernels.numba.__version__ if compiled else 'not installed: loop kernels checked '
+                      'uncompiled on small inputs'))
+    cases = [
+        ('splat', splat_case, args.points, 2_000),
+        ('composite', composite_case, args.frames, 1),
+        ('theil-sen', theil_sen_case, args.slopes, 500),
+        ('gauss-newton', growth_case, args.participants, 2_000),
+    ]
+    print(f"{'kernel':<14}{'size':>10}{'numpy':>10}{loops:>10}{'speedup':>9}  same")
+    for name, case, size, small in cases:
+        if not compiled:
+            func, same = case(small)
+            ok = same(run('numpy', func)[0], run('python', func)[0])
+            func, _ = case(size)
+            _, t_numpy = run('numpy', func, args.repeat)
+            print(f'{name:<14}{size:>10}{t_numpy:>9.3f}s{"-":>10}{"-":>9}  {ok} (at {small})')
+            continue
+        func, same = case(size)
+        run('numba', func)  # compile
+        expected, t_numpy = run('numpy', func, args.repeat)
+        result, t_loops = run('numba', func, args.repeat)
+        print(f'{name:<14}{size:>10}{t_numpy:>9.3f}s{t_loops:>9.3f}s{t_numpy / t_loops:>8.1f}x  '
+              f'{same(expected, result)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Memory benchmark: ColumnStore (float64 and float32) against the pandas
+DataFrame layout the scripts use today (string Id/Set columns, one float64
+column per visit value and per derived Element column).
+
+    python benchmarks/bench_memory.py --rows 1000000
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import keto_data  # noqa: E402
+
+MB = 1024 * 1024
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result, resident = build()
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, resident, peak, elapsed
+
+
+def build_store(source, rows, dtype):
+    def build():
+        store = keto_data.synthetic_cohort(rows, seed=1, dtype=dtype, source=source)
+        store.materialize()
+        return store, store.nbytes
+    return build
+
+
+def build_frame(store64):
+    """The DataFrame approach: object Id and Set columns, float64 everything else."""
+    leaf_names = {v: k for k, v in keto_data.LEAF_SETS.items()}
+
+    def build():
+        frame = pd.DataFrame({name: store64.column(name).astype(np.float64, copy=True)
+                              for name in store64.column_names()})
+        frame.insert(0, 'Id', store64.ids.astype(str).astype(object))
+        frame.insert(1, 'Set', [leaf_names[code] for code in store64.leaf])
+        return frame, int(frame.memory_usage(deep=True).sum())
+    return build
+
+
+def per_set_views(store):
+    """Per-set selections: views share memory with the store, DataFrame masks copy."""
+    t0 = time.perf_counter()
+    shared = all(np.shares_memory(store.view(s).column('LnDCac'), store.column('LnDCac'))
+                 for s in keto_data.SET_NAMES)
+    return shared, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    source = keto_data.load()
+    columns = len(source.column_names())
+    print(f'{args.rows:,} participants, {columns} visit and derived columns')
+
+    store64, res64, peak64, t64 = measure(build_store(source, args.rows, np.float64))
+    frame, res_df, peak_df, t_df = measure(build_frame(store64))
+
+    t0 = time.perf_counter()
+    masked = {s: frame[frame['Set'].isin(keto_data.SET_LEAVES[s])] for s in keto_data.SET_NAMES}
+    t_mask = time.perf_counter() - t0
+    mask_bytes = sum(int(m.memory_usage(deep=True).sum()) for m in masked.values())
+    del masked, frame
+    shared64, t_view64 = per_set_views(store64)
+    del store64
+    gc.collect()
+
+    store32, res32, peak32, t32 = measure(build_store(source, args.rows, np.float32))
+    shared32, t_view32 = per_set_views(store32)
+
+    print(f"{'Layout':<22} {'Resident MB':>12} {'Peak MB':>10} {'Build s':>9} {'Set views':>22}")
+    print(f"{'DataFrame (float64)':<22} {res_df / MB:12.1f} {peak_df / MB:10.1f} {t_df:9.2f} "
+          f"{f'+{mask_bytes / MB:.0f} MB, {t_mask:.2f}s':>22}")
+    print(f"{'ColumnStore float64':<22} {res64 / MB:12.1f} {peak64 / MB:10.1f} {t64:9.2f} "
+          f"{f'zero-copy={shared64}, {t_view64 * 1e3:.2f}ms':>22}")
+    print(f"{'ColumnStore float32':<22} {res32 / MB:12.1f} {peak32 / MB:10.1f} {t32:9.2f} "
+          f"{f'zero-copy={shared32}, {t_view32 * 1e3:.2f}ms':>22}")
+    print(f'float32 store is {res_df / res32:.1f}x smaller than the DataFrame')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,490 @@
+"""
+Declarative chart specs and an incremental build.
+
+charts.json describes every chart as data: which dataset and sets, which
+columns (any ColumnStore column or ratio expression), the projection, the
+overlays and the output file. A spec can 'extends' another and override
+parts of it; dicts merge key by key, everything else is replaced. That is
+how the fly-through and half-life variants are written once.
+
+The build fingerprints each resolved spec, the data files of its dataset
+and the plotting code, and records them in a manifest next to the outputs.
+Only charts whose fingerprint changed, or whose output is missing, are
+rebuilt. Each dataset is loaded at most once per build, and only when a
+stale chart needs it.
+
+    python chart_build.py                      # rebuild what is stale
+    python chart_build.py fly_through_enhanced --frames 36
+    python chart_build.py --dry-run            # list stale charts
+"""
+import argparse
+import copy
+import functools
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import density_contour
+import keto_data
+import pca_view
+from stage_profile import stage
+from stereo_render import Scene, stereo_coordinates, to_rgb
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SPECS = os.path.join(HERE, 'charts.json')
+DEFAULT_OUT_DIR = 'charts'
+MANIFEST = '.chart_manifest.json'
+# Changes to these rebuild every chart
+CODE_FILES = ('chart_build.py', 'keto_data.py', 'stereo_render.py', 'flythrough_render.py', 'density_contour.py',
+              'pca_view.py', 'set_clusters.py')
+
+# Colours and markers the existing scripts use for each set
+SET_STYLES = {
+    'Zeta': ('orange', 'D'),
+    'Theta': ('purple', 'o'),
+    'Eta': ('green', 's'),
+    'Gamma': ('blue', '^'),
+    'Beta': ('teal', 'v'),
+    'Alpha': ('gray', 'P'),
+    'BetaUZeta': ('brown', 'X'),
+    'Omega': ('black', '.'),
+}
+
+DATASETS = {
+    'keto': {'load': keto_data.load, 'files': (keto_data.DEFAULT_KETO_CTA_CSV, keto_data.DEFAULT_QANGIO_CSV)},
+    # Bootstrap of the same data (seed 0), for the density views
+    'keto_1m': {'load': functools.partial(keto_data.synthetic_cohort, 1_000_000),
+                'files': (keto_data.DEFAULT_KETO_CTA_CSV, keto_data.DEFAULT_QANGIO_CSV)},
+    # The Keto-CTA data with its first three principal component scores as PC1..PC3
+    'keto_pca': {'load': pca_view.scored_store, 'files': (keto_data.DEFAULT_KETO_CTA_CSV, keto_data.DEFAULT_QANGIO_CSV)},
+}
+
+
+# ---- specs ----
+
+def _merge(base, override):
+    out = copy.deepcopy(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(out.get(key), dict):
+            out[key] = _merge(out[key], value)
+        else:
+            out[key] = copy.deepcopy(value)
+    return out
+
+
+def resolve(specs):
+    """Chart name -> spec with 'extends' chains merged in; cycles are an error."""
+    resolved = {}
+
+    def visit(name, chain):
+        if name in resolved:
+            return resolved[name]
+        if name in chain:
+            raise ValueError(f"Chart spec cycle: {' -> '.join(chain + [name])}")
+        if name not in specs:
+            raise KeyError(f'Unknown chart spec: {name}')
+        spec = specs[name]
+        parent = spec.get('extends')
+        base = visit(parent, chain + [name]) if parent else {}
+        merged = _merge(base, {k: v for k, v in spec.items() if k != 'extends'})
+        merged['depends'] = (base.get('depends', []) + [parent]) if parent else []
+        resolved[name] = merged
+        return merged
+
+    for name in specs:
+        visit(name, [])
+    return resolved
+
+
+def load_specs(path=DEFAULT_SPECS):
+    with open(path, encoding='utf-8') as f:
+        return resolve(json.load(f)['charts'])
+
+
+# ---- fingerprints and manifest ----
+
+def _file_hash(path, cache):
+    if path not in cache:
+        h = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        cache[path] = h.hexdigest()
+    return cache[path]
+
+
+def fingerprint(spec, file_cache):
+    """Hash of the resolved spec, its dataset's files and the plotting code."""
+    h = hashlib.sha1(json.dumps(spec, sort_keys=True).encode())
+    files = list(DATASETS[spec.get('data', 'keto')]['files']) + [os.path.join(HERE, c) for c in CODE_FILES]
+    for path in files:
+        h.update(path.encode())
+        h.update((_file_hash(path, file_cache) if os.path.exists(path) else 'missing').encode())
+    return h.hexdigest()
+
+
+def read_manifest(out_dir):
+    path = os.path.join(out_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_manifest(out_dir, manifest):
+    with open(os.path.join(out_dir, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+
+def stale_charts(specs, out_dir, names=None, force=False):
+    """(name, fingerprint) of every selected chart that needs a rebuild, in dependency order."""
+    manifest = read_manifest(out_dir)
+    file_cache = {}
+    stale = []
+    for name in _build_order(specs, names or list(specs)):
+        fp = fingerprint(specs[name], file_cache)
+        output = os.path.join(out_dir, specs[name]['output'])
+        if force or manifest.get(name) != fp or not os.path.exists(output):
+            stale.append((name, fp))
+    return stale
+
+
+def _build_order(specs, names):
+    order = []
+    for name in names:
+        for dep in specs[name]['depends'] + [name]:
+            if dep not in order and dep in names:
+                order.append(dep)
+    return order
+
+
+# ---- data ----
+
+class DataCache:
+    """Loads each dataset on first use, once per build."""
+
+    def __init__(self):
+        self._stores = {}
+        self.loads = 0
+
+    def store(self, name):
+        if name not in self._stores:
+            with stage('chart data load'):
+                self._stores[name] = DATASETS[name]['load']()
+            self.loads += 1
+        return self._stores[name]
+
+
+def _points(view, spec):
+    """Columns of one set for a chart, after the spec's filter."""
+    proj = spec.get('projection', {'type': 'xy'})
+    if proj['type'] == 'ratio-stereo':
+        r0, r1, value = (view.column(proj[c]).astype(np.float64) for c in ('ratio0', 'ratio1', 'value'))
+        cols = {'ratio0': r0, 'ratio1': r1}
+        cols['x'], cols['y'], cols['z'] = stereo_coordinates(r0, r1, value, depth_scale=proj.get('depth_scale', 1.0))
+    else:
+        cols = {a: view.column(spec[a]).astype(np.float64) for a in ('x', 'y', 'z') if a in spec}
+    if spec.get('filter') == 'positive':
+        keep = np.ones(view.n, dtype=bool)
+        for a in ('x', 'y', 'z'):
+            if a in spec:
+                keep &= cols[a] > 0
+        cols = {k: v[keep] for k, v in cols.items()}
+    return cols
+
+
+# ---- renderers ----
+
+def _pyplot():
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def render_scatter2d(spec, store, path):
+    plt = _pyplot()
+    from scipy.stats import linregress
+    fig, ax = plt.subplots(figsize=tuple(spec.get('figsize', (10, 8))))
+    regression = any(o['type'] == 'regression' for o in spec.get('overlays', []))
+    dens = next((o for o in spec.get('overlays', []) if o['type'] == 'density'), None)
+    points = {}
+    for set_name in spec['sets']:
+        color, marker = SET_STYLES[set_name]
+        pts = points[set_name] = _points(store.view(set_name), spec)
+        label = f"{set_name} (N={len(pts['x'])})"
+        if dens is None or dens.get('points', True):
+            ax.scatter(pts['x'], pts['y'], color=color, marker=marker, label=label,
+                       **({} if dens is None else {'s': 2, 'alpha': 0.3, 'rasterized': True}))
+        else:
+            ax.plot([], [], color=color, label=label)
+        if regression and len(pts['x']) >= 2 and np.ptp(pts['x']) > 0:
+            fit = linregress(pts['x'], pts['y'])
+            ends = np.array([pts['x'].min(), pts['x'].max()])
+            ax.plot(ends, fit.intercept + fit.slope * ends, color=color,
+                    label=f'{set_name} Slope: {fit.slope:.3f}, R²: {fit.rvalue ** 2:.3f}')
+    if dens is not None:
+        density_contour.draw(ax, {s: (p['x'], p['y']) for s, p in points.items()}, SET_STYLES,
+                             dens.get('bins', 256), dens.get('mass', density_contour.DEFAULT_MASS),
+                             dens.get('filled', True))
+    labels = spec.get('labels', {})
+    ax.set_xlabel(labels.get('x', spec.get('x', '')))
+    ax.set_ylabel(labels.get('y', spec.get('y', '')))
+    ax.set_title(labels.get('title', ''))
+    ax.legend()
+    ax.grid(True)
+    fig.savefig(path, dpi=spec.get('dpi', 100))
+    plt.close(fig)
+
+
+def _highlight(overlay, points):
+    """(label, set, xyz) of a highlight overlay: the set's point nearest its 'near' value."""
+    pts = points[overlay['set']]
+    i = int(np.argmin(np.abs(pts[overlay.get('near_column', 'ratio0')] - overlay['near'])))
+    return overlay.get('label', 'Your Point'), overlay['set'], (pts['x'][i], pts['y'][i], pts['z'][i])
+
+
+def _trail_target(overlay, highlights):
+    """
+    The position a trail overlay follows: the highlight its 'highlight' key
+    names (by label or set), or the spec's only highlight when it names none.
+    """
+    name = overlay.get('highlight')
+    if not highlights:
+        raise ValueError('A trail overlay needs a highlight overlay to follow')
+    if name is None:
+        if len(highlights) != 1:
+            raise ValueError(f"A trail needs a 'highlight' naming one of {len(highlights)} highlights "
+                             f"({', '.join(label for label, _, _ in highlights)})")
+        return highlights[0][2]
+    found = [xyz for label, set_name, xyz in highlights if name in (label, set_name)]
+    if len(found) != 1:
+        raise ValueError(f"Trail highlight {name!r} matches {len(found)} highlights, expected one of "
+                         f"{[label for label, _, _ in highlights]}")
+    return found[0]
+
+
+def _scene3d(spec, store):
+    """The fly-through scene: per-set scatters, overlays and fixed limits, as the scripts draw it."""
+    plt = _pyplot()
+    fig = plt.figure(figsize=tuple(spec.get('figsize', (10, 8))))
+    ax = fig.add_subplot(111, projection='3d')
+    points = {s: _points(store.view(s), spec) for s in spec['sets']}
+    artists = {'sets': []}
+    for set_name, pts in points.items():
+        color, marker = SET_STYLES[set_name]
+        label = spec.get('set_labels', {}).get(set_name, set_name)
+        artists['sets'].append(ax.scatter(pts['x'], pts['y'], pts['z'], c=color, marker=marker, label=label))
+
+    overlays = spec.get('overlays', [])
+    highlights = [_highlight(o, points) for o in overlays if o['type'] == 'highlight']
+    artists['highlights'], artists['trails'] = [], []
+    for overlay in overlays:
+        kind = overlay['type']
+        if kind == 'highlight':
+            label, _, xyz = _highlight(overlay, points)
+            artists['highlights'].append(ax.scatter(*xyz, c=overlay.get('color', 'magenta'), marker='*', s=150,
+                                                    label=label))
+        elif kind == 'vectors':
+            pts = points[overlay['set']]
+            color = SET_STYLES[overlay['set']][0]
+            mask = (pts['z'] != 0) & (pts['ratio0'] != 0) & (pts['ratio1'] != 0)
+            step = (pts['ratio1'] - pts['ratio0']) * 0.5
+            for i in np.flatnonzero(mask):
+                ax.quiver(pts['x'][i], pts['y'][i], pts['z'][i], step[i], 0, step[i] * overlay.get('scale', 40),
+                          color=color, alpha=0.5, arrow_length_ratio=0.1)
+        elif kind == 'trail':
+            artists['trails'].append((ax.scatter([], [], [], c=overlay.get('color', 'magenta'), marker='o', s=50,
+                                                 alpha=0.5),
+                                      _trail_target(overlay, highlights), overlay.get('length', 10), []))
+        elif kind == 'text':
+            ax.text2D(0.05, 0.95, overlay['text'], transform=ax.transAxes, fontsize=8,
+                      verticalalignment='top', bbox=dict(facecolor='white', alpha=0.8))
+
+    labels = spec.get('labels', {})
+    ax.set_xlabel(labels.get('x', ''))
+    ax.set_ylabel(labels.get('y', ''))
+    ax.set_zlabel(labels.get('z', ''))
+    ax.set_title(labels.get('title', ''))
+    everything = {a: np.concatenate([p[a] for p in points.values()]) for a in ('x', 'y', 'z')}
+    ax.set_xlim(everything['x'].min() - 0.5, everything['x'].max() + 0.5)
+    ax.set_ylim(everything['y'].min() - 0.5, everything['y'].max() + 0.5)
+    z_lim = (everything['z'].min() - 5, everything['z'].max() + 5)
+    ax.set_zlim(*z_lim)
+    ax.grid(True)
+    return plt, fig, ax, artists, z_lim
+
+
+def render_scatter3d(spec, store, path):
+    plt, fig, ax, _, _ = _scene3d(spec, store)
+    camera = spec.get('camera', {})
+    ax.view_init(elev=camera.get('elevation', 20), azim=camera.get('azimuth', -60))
+    fig.savefig(path, dpi=spec.get('dpi', 100))
+    plt.close(fig)
+
+
+def render_flythrough(spec, store, path):
+    """The fly_through_*.py camera path: one orbit with elevation, zoom and z drift, pulsing highlight."""
+    anim = spec.get('animation', {})
+    if anim.get('backend', 'mplot3d') == 'raster':
+        return render_flythrough_raster(spec, store, path)
+    import matplotlib.animation as animation
+    from flythrough_render import camera_path, pulse_sizes
+    from stage_profile import wrap_method
+    with stage('mplot3d scene setup'):
+        plt, fig, ax, artists, z_lim = _scene3d(spec, store)
+    frames = anim.get('frames', 360)
+    azimuth, elevation, distance, z_shift = camera_path(frames)
+    sizes = pulse_sizes(frames)
+
+    @stage('camera update')
+    def update_view(i):
+        ax.dist = distance[i]
+        ax.set_zlim(z_lim[0] + z_shift[i], z_lim[1] + z_shift[i])
+        for highlight in artists['highlights']:
+            highlight._sizes = [sizes[i]]
+        for scatter, xyz, length, trail in artists['trails']:
+            trail.append(xyz)
+            del trail[:-length]
+            scatter._offsets3d = tuple(list(c) for c in zip(*trail))
+        ax.view_init(elev=elevation[i], azim=azimuth[i])
+        return artists['sets']
+
+    ani = animation.FuncAnimation(fig, update_view, frames=frames, interval=1000 / anim.get('fps', 30), blit=False)
+    writer = animation.PillowWriter(fps=anim.get('fps', 30))
+    wrap_method(writer, 'grab_frame', 'mplot3d frame draw')
+    wrap_method(writer, 'finish', 'gif encode')
+    ani.save(path, writer=writer, dpi=spec.get('dpi', 100))
+    plt.close(fig)
+
+
+def _blend(color, alpha, background=(255, 255, 255)):
+    """A translucent matplotlib colour flattened onto the background."""
+    return tuple(int(round(alpha * c + (1 - alpha) * b)) for c, b in zip(to_rgb(color), background))
+
+
+def render_flythrough_raster(spec, store, path):
+    """The same fly-through drawn by flythrough_render: overlays once, points splatted per frame."""
+    import flythrough_render as fr
+    anim = spec.get('animation', {})
+    frames = anim.get('frames', 360)
+    dpi = spec.get('dpi', 100)
+    width, height = (int(round(v * dpi)) for v in spec.get('figsize', (10, 8)))
+    radius = int(round(fr.marker_radius(36, dpi)))
+
+    with stage('raster scene setup'):
+        points = {s: _points(store.view(s), spec) for s in spec['sets']}
+        everything = {a: np.concatenate([p[a] for p in points.values()]) for a in ('x', 'y', 'z')}
+        lo = np.array([everything['x'].min() - 0.5, everything['y'].min() - 0.5, everything['z'].min() - 5])
+        hi = np.array([everything['x'].max() + 0.5, everything['y'].max() + 0.5, everything['z'].max() + 5])
+        scene = Scene().add_box(samples=1024, lo=lo, hi=hi)
+        fixed = len(scene.points)
+        legend = []
+        for set_name, pts in points.items():
+            color, marker = SET_STYLES[set_name]
+            scene.add_points(pts['x'], pts['y'], pts['z'], color, marker, radius)
+            legend.append((spec.get('set_labels', {}).get(set_name, set_name), color, marker, 36))
+
+        sprites, text = [], None
+        overlays = spec.get('overlays', [])
+        highlights = [_highlight(o, points) for o in overlays if o['type'] == 'highlight']
+        for overlay in overlays:
+            kind = overlay['type']
+            if kind == 'highlight':
+                label, _, xyz = _highlight(overlay, points)
+                color = overlay.get('color', 'magenta')
+                legend.append((label, color, '*', 150))
+                # One copy per pulse radius; each frame shows the copy of its size
+                pulse = np.rint(fr.marker_radius(fr.pulse_sizes(frames), dpi)).astype(int)
+                for r in np.unique(pulse):
+                    sprites.append((len(scene.points), pulse == r))
+                    scene.add_points(*xyz, color=color, marker='*', radius=r)
+            elif kind == 'vectors':
+                pts = points[overlay['set']]
+                mask = (pts['z'] != 0) & (pts['ratio0'] != 0) & (pts['ratio1'] != 0)
+                step = (pts['ratio1'] - pts['ratio0'])[mask] * 0.5
+                starts = np.column_stack([pts['x'][mask], pts['y'][mask], pts['z'][mask]])
+                ends = starts + np.column_stack([step, np.zeros_like(step), step * overlay.get('scale', 40)])
+                scene.add_segments(starts, ends, color=_blend(SET_STYLES[overlay['set']][0], 0.5), samples=128)
+            elif kind == 'trail':
+                # The trail repeats the highlight's fixed position, so it is one marker from frame 1 on
+                sprites.append((len(scene.points), np.arange(frames) >= 1))
+                color = _blend(overlay.get('color', 'magenta'), 0.5)
+                scene.add_points(*_trail_target(overlay, highlights), color=color, marker='o',
+                                 radius=int(round(fr.marker_radius(50, dpi))))
+            elif kind == 'text':
+                text = overlay['text']
+
+        labels = spec.get('labels', {})
+        moving = np.arange(len(scene.points)) >= fixed
+        overlay = fr.overlay_layer(width, height, dpi, labels.get('title', ''), labels, legend, text)
+        fly = fr.FlyThrough(scene, width, height, moving=moving, overlay=overlay)
+        for row, shown in sprites:
+            fly.show_only([row], shown[:, None])
+    fly.save_gif(path, frames, anim.get('fps', 30))
+
+
+def render_halflife(spec, store, path):
+    """The halflife-*.py table: per-participant doubling times and their positive means."""
+    view = store.view(spec['set'])
+    frame = pd.DataFrame({'Id': view.ids})
+    for attr in spec.get('attributes', ['Cac', 'Ncpv']):
+        frame[f'{attr.upper()}_dt'] = view.column(f'Td{attr}')
+    frame.to_csv(path, index=False, float_format='%.6g')
+    for column in frame.columns[1:]:
+        print(f"  {spec['set']} {column.replace('_dt', '')} Doubling Time Mean: {frame[column][frame[column] > 0].mean()}")
+
+
+RENDERERS = {
+    'scatter2d': render_scatter2d,
+    'scatter3d': render_scatter3d,
+    'flythrough': render_flythrough,
+    'halflife': render_halflife,
+}
+
+
+# ---- build ----
+
+def build(specs, out_dir=DEFAULT_OUT_DIR, names=None, force=False, dry_run=False):
+    """Rebuilds the stale charts; returns (rebuilt names, data loads)."""
+    os.makedirs(out_dir, exist_ok=True)
+    stale = stale_charts(specs, out_dir, names, force)
+    if dry_run:
+        return [name for name, _ in stale], 0
+    data = DataCache()
+    manifest = read_manifest(out_dir)
+    for name, fp in stale:
+        spec = specs[name]
+        with stage(f"chart {name}"):
+            RENDERERS[spec['kind']](spec, data.store(spec.get('data', 'keto')), os.path.join(out_dir, spec['output']))
+        manifest[name] = fp
+        write_manifest(out_dir, manifest)
+    return [name for name, _ in stale], data.loads
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the declarative charts, redoing only what is stale.')
+    parser.add_argument('charts', nargs='*', help='chart names (default: all)')
+    parser.add_argument('--specs', default=DEFAULT_SPECS)
+    parser.add_argument('--out-dir', default=DEFAULT_OUT_DIR)
+    parser.add_argument('--force', action='store_true')
+    parser.add_argument('--dry-run', action='store_true')
+    parser.add_argument('--frames', type=int, default=None, help='override animation frames (quick previews)')
+    args = parser.parse_args()
+
+    specs = load_specs(args.specs)
+    if args.frames:
+        for spec in specs.values():
+            if 'animation' in spec:
+                spec['animation']['frames'] = args.frames
+    rebuilt, loads = build(specs, args.out_dir, args.charts or None, args.force, args.dry_run)
+    verb = 'stale' if args.dry_run else 'rebuilt'
+    print(f"{len(rebuilt)} of {len(args.charts or specs)} charts {verb}: {', '.join(rebuilt) or '-'}; "
+          f'{loads} data load(s)')
+
+
+if __name__ == '__main__':
+    main()
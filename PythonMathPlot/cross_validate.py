@@ -0,0 +1,169 @@
+"""
+Out-of-sample validation of baseline -> one-year prediction models.
+
+Every candidate is an OLS model predicting a visit-1 value (Cac1, Ncpv1,
+Pav1, or their Ln forms) from a small set of baseline (visit-0) columns.
+Candidates are scored by k-fold and leave-one-out RMSE without refitting:
+
+  * the full-data Gram matrix G = X'X and fit are computed once per model;
+  * leave-one-out residuals come from the rank-one downdate G - x_i x_i'
+    (Sherman-Morrison), e_i / (1 - h_i);
+  * a fold's fit comes from downdating G and X'y by the fold's rows,
+    G - X_f'X_f, one p x p solve per fold instead of a refit.
+
+Candidates of the same size are evaluated as one batched array operation,
+and batches are spread across a process pool.
+
+CacPredict/NcpvPredict project one year past the last visit, so there is
+no observed value to score them against; the persistence model (the
+visit-1 value equals the baseline value) is reported as the reference.
+
+    python cross_validate.py --targets Cac1 LnCac1 Ncpv1 Pav1 --max-terms 3
+"""
+import argparse
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import keto_data
+from stage_profile import stage
+
+DEFAULT_TARGETS = ('Cac1', 'Ncpv1', 'Pav1')
+BASELINE_COLUMNS = tuple(
+    [f'{a}0' for a in keto_data.CSV_ATTRIBUTES]
+    + [f'Ln{a}0' for a in keto_data.CSV_ATTRIBUTES]
+    + ['LnCac0/LnNcpv0', 'LnNcpv0/LnCac0', 'LnCac0/LnTps0', 'LnTcpv0/LnNcpv0', 'LnPav0/LnNcpv0']
+)
+
+
+def candidate_sets(columns, max_terms):
+    """Index tuples of every predictor subset of 1..max_terms columns."""
+    for size in range(1, max_terms + 1):
+        yield from itertools.combinations(range(len(columns)), size)
+
+
+def fold_ids(n, folds, seed=0):
+    """Balanced random fold assignment."""
+    rng = np.random.default_rng(seed)
+    ids = np.arange(n) % folds
+    rng.shuffle(ids)
+    return ids
+
+
+def score_batch(y, Z, folds, candidates):
+    """
+    Scores equally sized candidates at once. y is (n,), Z is (n, q) baseline
+    columns, folds is a fold id per row, candidates is (C, terms) indices
+    into Z. Returns in-sample R^2, k-fold RMSE and LOO RMSE, each (C,).
+    """
+    candidates = np.asarray(candidates)
+    n = len(y)
+    X = np.concatenate([np.ones((len(candidates), n, 1)), np.transpose(Z[:, candidates], (1, 0, 2))], axis=2)
+    G = np.einsum('cnp,cnq->cpq', X, X)
+    b = np.einsum('cnp,n->cp', X, y)
+    G_inv = np.linalg.pinv(G, hermitian=True)
+    beta = np.einsum('cpq,cq->cp', G_inv, b)
+    resid = y[None, :] - np.einsum('cnp,cp->cn', X, beta)
+
+    ss_tot = np.sum((y - y.mean()) ** 2)
+    r2 = 1.0 - np.sum(resid ** 2, axis=1) / ss_tot if ss_tot > 0 else np.full(len(X), np.nan)
+
+    # Leave-one-out: rank-one downdate of G by each row
+    h = np.einsum('cnp,cpq,cnq->cn', X, G_inv, X)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        press = resid / (1.0 - h)
+    press[~np.isfinite(press)] = np.nan
+    loo_rmse = np.sqrt(np.nanmean(press ** 2, axis=1))
+
+    # k-fold: downdate G and X'y by each fold's rows
+    sq = np.zeros(len(X))
+    for f in np.unique(folds):
+        rows = np.flatnonzero(folds == f)
+        Xf = X[:, rows, :]
+        G_f = G - np.einsum('cmp,cmq->cpq', Xf, Xf)
+        b_f = b - np.einsum('cmp,m->cp', Xf, y[rows])
+        beta_f = np.einsum('cpq,cq->cp', np.linalg.pinv(G_f, hermitian=True), b_f)
+        sq += np.sum((y[rows][None, :] - np.einsum('cmp,cp->cm', Xf, beta_f)) ** 2, axis=1)
+    kfold_rmse = np.sqrt(sq / n)
+    return r2, kfold_rmse, loo_rmse
+
+
+def _score_task(args):
+    y, Z, folds, candidates = args
+    return candidates, score_batch(y, Z, folds, candidates)
+
+
+def cross_validate(store, targets=DEFAULT_TARGETS, set_name='Omega', predictors=BASELINE_COLUMNS,
+                   max_terms=3, folds=5, seed=0, workers=None, batch=512):
+    """One row per (target, candidate predictor set), ranked by k-fold RMSE within each target."""
+    view = store.view(set_name)
+    Z_all = view.matrix(predictors).T.astype(np.float64)
+    candidates = list(candidate_sets(predictors, max_terms))
+    frames = []
+    pool = ProcessPoolExecutor(max_workers=workers) if workers and workers > 1 else None
+    try:
+        for target in targets:
+            y_all = view.column(target).astype(np.float64)
+            ok = np.isfinite(y_all) & np.isfinite(Z_all).all(axis=1)
+            y, Z = y_all[ok], Z_all[ok]
+            fid = fold_ids(len(y), min(folds, len(y)), seed)
+            tasks = []
+            for size in range(1, max_terms + 1):
+                group = [c for c in candidates if len(c) == size]
+                # Keep a batch's (C, n, p) design under ~160 MB on large cohorts
+                step = max(1, min(batch, 20_000_000 // (len(y) * (size + 1))))
+                tasks += [(y, Z, fid, group[i:i + step]) for i in range(0, len(group), step)]
+            with stage('cross-validation', len(candidates)):
+                results = pool.map(_score_task, tasks) if pool else map(_score_task, tasks)
+                rows = []
+                for group, (r2, kfold_rmse, loo_rmse) in results:
+                    for c, a, k, l in zip(group, r2, kfold_rmse, loo_rmse):
+                        rows.append((' + '.join(predictors[i] for i in c), len(c), a, k, l))
+            frame = pd.DataFrame(rows, columns=['predictors', 'terms', 'r2', 'kfold_rmse', 'loo_rmse'])
+            frame.insert(0, 'n', len(y))
+            frame.insert(0, 'set', set_name)
+            frame.insert(0, 'target', target)
+            frame['rank'] = frame['kfold_rmse'].rank(method='min').astype(int)
+            frames.append(frame.sort_values('rank'))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return pd.concat(frames, ignore_index=True)
+
+
+def persistence_rmse(store, target, set_name='Omega'):
+    """RMSE of predicting the visit-1 value with the visit-0 value."""
+    baseline = target[:-1] + '0'
+    view = store.view(set_name)
+    err = view.column(target).astype(np.float64) - view.column(baseline).astype(np.float64)
+    return float(np.sqrt(np.nanmean(err ** 2)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='k-fold and LOO validation of one-year prediction models.')
+    parser.add_argument('--targets', nargs='*', default=list(DEFAULT_TARGETS))
+    parser.add_argument('--set', default='Omega', choices=keto_data.SET_NAMES)
+    parser.add_argument('--max-terms', type=int, default=3)
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--synthetic', type=int, default=0)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--out', default='cv_models.csv')
+    args = parser.parse_args()
+
+    store = keto_data.synthetic_cohort(args.synthetic) if args.synthetic else keto_data.load()
+    ranked = cross_validate(store, args.targets, args.set, max_terms=args.max_terms, folds=args.folds,
+                            seed=args.seed, workers=args.workers)
+    ranked.to_csv(args.out, index=False)
+    for target, group in ranked.groupby('target', sort=False):
+        print(f'\n{target} ({args.set}, {args.folds}-fold): persistence RMSE {persistence_rmse(store, target, args.set):.4f}')
+        print(group.head(args.top)[['rank', 'predictors', 'r2', 'kfold_rmse', 'loo_rmse']].to_string(index=False))
+    print(f"\n{len(ranked)} models written to '{args.out}'")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+"""
+Raster backend for the fly-through animations.
+
+The mplot3d path (chart_build.render_flythrough with the default backend)
+redraws the whole figure for every frame: axes, panes, legend, text box
+and every artist, then PillowWriter quantizes each RGBA frame to its own
+palette. This backend does the per-frame work only once where it can:
+
+- the static overlays (title, legend, statistics box, axis labels) are drawn
+  once with matplotlib on a transparent canvas and mapped to palette indices;
+- the camera path is turned into one (frames, 4, 4) stack of view-projection
+  matrices, and the scene is projected for a whole batch of frames in a
+  single einsum;
+- markers are splatted with stereo_render.splat straight into palette-index
+  framebuffers, the overlay is composited with one masked copy, and the GIF
+  is written with a single global palette, so no frame is ever quantized.
+
+Axis labels stay put in the overlay instead of orbiting with the axes.
+
+    python chart_build.py fly_through_enhanced --force      # "backend": "raster" in charts.json
+    python benchmarks/bench_flythrough.py --frames 60
+"""
+import numpy as np
+from PIL import Image
+
+import jit_kernels
+from stage_profile import stage
+from stereo_render import WHITE, splat, to_rgb
+
+
+def camera_path(frames):
+    """
+    The fly_through_*.py camera: one orbit with a sine in elevation and zoom
+    and the z window drifting from -5 to +5. Returns per-frame azimuth,
+    elevation, matplotlib-style distance (10 = default) and z shift.
+    """
+    t = np.arange(frames) * 360 / frames
+    wave = np.sin(t / 180 * np.pi)
+    return t % 360, 20 + 10 * wave, 10 - 2 * wave, -5 + 10 * (t / 360)
+
+
+def pulse_sizes(frames, base=150, amplitude=50):
+    """The highlight's scatter size (points^2) in every frame."""
+    t = np.arange(frames) * 360 / frames
+    return base + amplitude * np.sin(t / 90 * np.pi)
+
+
+def marker_radius(size, dpi=100):
+    """Pixel radius of a matplotlib scatter marker of the given size (points^2)."""
+    return np.sqrt(size) / 2 * dpi / 72
+
+
+def view_projections(azimuth, elevation, distance, aspect, fov=40.0, near=0.1, far=100.0):
+    """(F, 4, 4) look-at-origin view-projection matrices for per-frame camera angles and distances."""
+    az, el = np.radians(azimuth), np.radians(elevation)
+    direction = np.stack([np.cos(el) * np.cos(az), np.cos(el) * np.sin(az), np.sin(el)], axis=-1)
+    eye = distance[:, None] * direction
+    forward = -direction
+    right = np.cross(forward, [0.0, 0.0, 1.0])
+    right /= np.linalg.norm(right, axis=-1, keepdims=True)
+    up = np.cross(right, forward)
+
+    views = np.zeros((len(eye), 4, 4))
+    for row, axis in enumerate((right, up, -forward)):
+        views[:, row, :3] = axis
+        views[:, row, 3] = -np.einsum('fi,fi->f', axis, eye)
+    views[:, 3, 3] = 1.0
+
+    top = near * np.tan(np.radians(fov) / 2)
+    projection = np.array([
+        [near / (top * aspect), 0, 0, 0],
+        [0, near / top, 0, 0],
+        [0, 0, -(far + near) / (far - near), -2 * far * near / (far - near)],
+        [0, 0, -1, 0],
+    ])
+    return projection @ views
+
+
+def overlay_layer(width, height, dpi=100, title='', labels=None, legend=(), text=None):
+    """
+    The static chart furniture as an RGBA uint8 array, drawn once with
+    matplotlib on a transparent figure. legend is (label, colour, marker, size)
+    tuples; text goes in a boxed block at the top left of the axes.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    labels = labels or {}
+    fig = plt.figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+    fig.patch.set_alpha(0)
+    ax = fig.add_subplot(111)
+    ax.patch.set_alpha(0)
+    for spine in ax.spines.values():
+        spine.set_visible(False)
+    ax.set_xticks([])
+    ax.set_yticks([])
+    ax.set_title(title)
+    ax.set_xlabel(labels.get('x', ''))
+    ax.set_ylabel(labels.get('y', ''))
+    if labels.get('z'):
+        ax.yaxis.set_label_position('left')
+        ax.text(1.02, 0.5, labels['z'], transform=ax.transAxes, rotation=90, va='center', ha='left')
+    if legend:
+        for label, color, marker, size in legend:
+            ax.scatter([], [], color=np.asarray(to_rgb(color)) / 255, marker=marker, s=size, label=label)
+        ax.legend(loc='upper right')
+    if text:
+        ax.text(0.05, 0.95, text, transform=ax.transAxes, fontsize=8,
+                verticalalignment='top', bbox=dict(facecolor='white', alpha=0.8))
+    fig.canvas.draw()
+    rgba = np.array(fig.canvas.buffer_rgba(), dtype=np.uint8)
+    plt.close(fig)
+    return rgba
+
+
+class FlyThrough:
+    """
+    A Scene orbited along camera_path(). Points flagged in moving follow the
+    z window drift (the data); the others (box, grid) stay fixed as the axes
+    do. Extra per-frame sprites, such as the pulsing highlight, are points
+    whose visibility is switched per frame.
+    """
+
+    def __init__(self, scene, width=1000, height=800, box_aspect=(1.0, 1.0, 0.75), moving=None,
+                 overlay=None, background=WHITE, distance=5.0, fov=40.0):
+        self.scene = scene
+        self.width = width
+        self.height = height
+        self.box_aspect = box_aspect
+        self.distance = distance
+        self.fov = fov
+        n = len(scene.points)
+        self.moving = np.ones(n, dtype=bool) if moving is None else np.asarray(moving, dtype=bool)
+        self.shown = None  # (frames, N) visibility, None = always
+        self._palette(overlay, background)
+
+    def _palette(self, overlay, background):
+        """One GIF palette: background, the scene colours, then the quantized overlay."""
+        colors, point_index = np.unique(self.scene.colors, axis=0, return_inverse=True)
+        bg = np.asarray(to_rgb(background), dtype=np.uint8)
+        palette = [bg[None, :], colors]
+        # Point index -> palette index; the extra last entry is the empty pixel (-1)
+        self.lut = np.append(point_index.ravel() + 1, 0).astype(np.uint8)
+        self.overlay_mask = None
+        if overlay is not None:
+            alpha = overlay[..., 3:4].astype(np.float64) / 255
+            self.overlay_mask = overlay[..., 3] > 0
+            flat = (overlay[..., :3] * alpha + bg * (1 - alpha))[self.overlay_mask].round().astype(np.uint8)
+            room = 256 - 1 - len(colors)
+            quantized = Image.fromarray(flat[None, :, :]).quantize(colors=room, method=Image.Quantize.MEDIANCUT)
+            used = len(quantized.getcolors(room))
+            self.overlay_index = np.zeros((self.height, self.width), dtype=np.uint8)
+            self.overlay_index[self.overlay_mask] = np.asarray(quantized)[0] + 1 + len(colors)
+            palette.append(np.asarray(quantized.getpalette()[:3 * used], dtype=np.uint8).reshape(-1, 3))
+        self.palette = np.concatenate(palette)
+        if len(self.palette) > 256:
+            raise ValueError(f'{len(self.palette)} colours do not fit a GIF palette')
+
+    def show_only(self, rows, frames_mask):
+        """Points at rows are drawn only in the frames where frames_mask (frames, len(rows)) is True."""
+        if self.shown is None:
+            self.shown = np.ones((frames_mask.shape[0], len(self.scene.points)), dtype=bool)
+        self.shown[:, rows] = frames_mask
+
+    @stage('raster projection')
+    def project(self, frames, n_frames):
+        """Pixel x, pixel y and eye depth (each (len(frames), N)) for frames of an n_frames orbit."""
+        azimuth, elevation, dist, z_shift = (a[frames] for a in camera_path(n_frames))
+        vp = view_projections(azimuth, elevation, self.distance * dist / 10, self.width / self.height, self.fov)
+        model = self.scene.model_matrix(self.box_aspect)
+        pts = self.scene.points
+        world = model @ np.column_stack([pts, np.ones(len(pts))]).T
+        clip = np.einsum('fij,jn->fni', vp, world)
+        # Shifting the z window by s moves the data by -s (in model units) against the fixed box
+        drift = (z_shift * model[2, 2])[:, None] * vp[:, :, 2]
+        clip -= self.moving[None, :, None] * drift[:, None, :]
+        w = clip[..., 3]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            px = (clip[..., 0] / w + 1) / 2 * (self.width - 1)
+            py = (1 - clip[..., 1] / w) / 2 * (self.height - 1)
+        if self.shown is not None:
+            w = np.where(self.shown[frames], w, -1.0)
+        return px, py, w
+
+    def frames(self, n_frames, batch=16):
+        """Yields (H, W) uint8 palette-index frames, batch frames rasterized at a time."""
+        scene = self.scene
+        for start in range(0, n_frames, batch):
+            frames = np.arange(start, min(start + batch, n_frames))
+            px, py, depth = self.project(frames, n_frames)
+            with stage('raster splat', len(frames)):
+                winner = splat(px, py, depth, scene.markers, scene.radii, self.width, self.height)
+                if jit_kernels.use_loops():
+                    indexed = np.empty(winner.shape, dtype=np.uint8)
+                    masked = self.overlay_mask is not None
+                    mask = self.overlay_mask if masked else np.zeros((0, 0), dtype=bool)
+                    overlay = self.overlay_index if masked else np.zeros((0, 0), dtype=np.uint8)
+                    jit_kernels.composite(winner, self.lut, overlay, mask, indexed)
+                else:
+                    indexed = self.lut[winner]
+                    if self.overlay_mask is not None:
+                        np.copyto(indexed, self.overlay_index, where=self.overlay_mask)
+            yield from indexed
+
+    def save_gif(self, path, n_frames, fps=30, batch=16):
+        """Renders every frame and writes an endlessly looping GIF with one shared palette."""
+        palette = self.palette.ravel().tolist()
+
+        def image(frame):
+            im = Image.fromarray(frame, 'P')
+            im.putpalette(palette)
+            return im
+
+        images = (image(frame) for frame in self.frames(n_frames, batch))
+        first = next(images)
+        with stage('gif encode', n_frames):
+            first.save(path, save_all=True, append_images=images, duration=1000 / fps, loop=0, optimize=False)
+        return path
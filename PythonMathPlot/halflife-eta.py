@@ -1,5 +1,6 @@
 import pandas as pd
 import numpy as np
+from stage_profile import stage
 
 # Input dataset
 data = {
@@ -9,19 +10,21 @@ data = {
     "Ncpv0": [45.3,53.4,82.4,130.5,78,233.8,169,58.9,244.9,365.6,238.5,147.2,290.8,255.8,200.3,71.8,450.6],
     "Ncpv1": [51.6,112.2,168.4,179,89.6,345.8,182.2,76.4,357.9,428.5,307.3,194.8,378.9,389.6,275.1,103.6,606.5]
 }
-df = pd.DataFrame(data)
+with stage('dataframe build', len(data["Id"])):
+    df = pd.DataFrame(data)
 
 # Calculate doubling times using exponential growth assumption
 # growth rate k = ln(C1/C0) / t  => doubling time = ln(2)/k
-df["CAC_rate"] = np.log(df["Cac1"]/df["Cac0"]) / 1.0
-df["CAC_dt"] = np.log(2) / df["CAC_rate"]
+with stage('ln/ratio computation', len(df)):
+    df["CAC_rate"] = np.log(df["Cac1"]/df["Cac0"]) / 1.0
+    df["CAC_dt"] = np.log(2) / df["CAC_rate"]
 
-df["NCPV_rate"] = np.log(df["Ncpv1"]/df["Ncpv0"]) / 1.0
-df["NCPV_dt"] = np.log(2) / df["NCPV_rate"]
+    df["NCPV_rate"] = np.log(df["Ncpv1"]/df["Ncpv0"]) / 1.0
+    df["NCPV_dt"] = np.log(2) / df["NCPV_rate"]
 
-# Compute average doubling times (ignoring negative/0 growth)
-cac_dt_mean = df[df["CAC_dt"] > 0]["CAC_dt"].mean()
-ncpv_dt_mean = df[df["NCPV_dt"] > 0]["NCPV_dt"].mean()
+    # Compute average doubling times (ignoring negative/0 growth)
+    cac_dt_mean = df[df["CAC_dt"] > 0]["CAC_dt"].mean()
+    ncpv_dt_mean = df[df["NCPV_dt"] > 0]["NCPV_dt"].mean()
 
 # Print the results
 print("CAC Doubling Time Mean:", cac_dt_mean)
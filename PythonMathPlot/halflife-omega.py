@@ -1,5 +1,6 @@
 import pandas as pd
 import numpy as np
+from stage_profile import stage
 
 # Input dataset
 data = {
@@ -9,19 +10,21 @@ data = {
         "Ncpv0": [9.3,193.3,6.5,1.8,15.6,10.4,48.4,65.6,3.8,42.8,21.7,4.9,27.8,22.4,26.5,0,6.3,8,0,45.7,13.5,1.7,21,5.7,16.5,0,23.3,5.3,101.1,9.9,3.3,0,15.4,24,28.3,20.7,2.2,12.4,23.6,17.2,24.2,1.4,36.7,18.9,3.8,20,61.8,26.6,39.7,26.3,19.6,20.8,67.1,64.9,68.2,15.5,94.7,82.8,42.4,4.4,12.8,45.3,77.3,53.3,113.6,91.1,139.4,171.5,53.7,52.1,164.2,290.2,83.3,141.1,106.8,53.4,174.6,82.4,130.5,78,163.9,233.8,169,58.9,244.9,365.6,100.5,238.5,46.2,147.2,183.5,252.3,290.8,174.9,73.4,255.8,105.7,200.3,71.8,450.6],
         "Ncpv1": [18.8,212.2,23.2,9.1,24.8,11.8,80.4,82.5,13.1,64.4,44.4,16.7,39.3,55.9,70.9,0,19.8,15.3,13.6,64,20.7,6.8,67.3,9.9,58.4,9.2,25.7,5.3,156.6,39.4,9,3.9,25.7,40.4,58,26.1,9.7,23,44.3,25.4,35.3,4.6,80.2,21.9,4,32.8,98.3,104,57,60.7,42,45.7,166.7,68.5,71.4,31,130.8,144.9,64.7,11.2,15.2,51.6,96.1,104.7,162,119.7,153.6,211.9,99.3,62.5,220,301,97.7,191,116.5,112.2,210,168.4,179,89.6,248.2,345.8,182.2,76.4,357.9,428.5,180.3,307.3,41.7,194.8,213.8,319.7,378.9,245,92.7,389.6,166.7,275.1,103.6,606.5]
 }
-df = pd.DataFrame(data)
+with stage('dataframe build', len(data["Id"])):
+    df = pd.DataFrame(data)
 
 # Calculate doubling times using exponential growth assumption
 # growth rate k = ln(C1/C0) / t  => doubling time = ln(2)/k
-df["CAC_rate"] = np.log(df["Cac1"]/df["Cac0"]) / 1.0
-df["CAC_dt"] = np.log(2) / df["CAC_rate"]
+with stage('ln/ratio computation', len(df)):
+    df["CAC_rate"] = np.log(df["Cac1"]/df["Cac0"]) / 1.0
+    df["CAC_dt"] = np.log(2) / df["CAC_rate"]
 
-df["NCPV_rate"] = np.log(df["Ncpv1"]/df["Ncpv0"]) / 1.0
-df["NCPV_dt"] = np.log(2) / df["NCPV_rate"]
+    df["NCPV_rate"] = np.log(df["Ncpv1"]/df["Ncpv0"]) / 1.0
+    df["NCPV_dt"] = np.log(2) / df["NCPV_rate"]
 
-# Compute average doubling times (ignoring negative/0 growth)
-cac_dt_mean = df[df["CAC_dt"] > 0]["CAC_dt"].mean()
-ncpv_dt_mean = df[df["NCPV_dt"] > 0]["NCPV_dt"].mean()
+    # Compute average doubling times (ignoring negative/0 growth)
+    cac_dt_mean = df[df["CAC_dt"] > 0]["CAC_dt"].mean()
+    ncpv_dt_mean = df[df["NCPV_dt"] > 0]["NCPV_dt"].mean()
 
 # Print the results
 print("CAC Doubling Time Mean:", cac_dt_mean)
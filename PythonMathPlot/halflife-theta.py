@@ -1,5 +1,6 @@
 import pandas as pd
 import numpy as np
+from stage_profile import stage
 
 # Input dataset
 data = {
@@ -9,19 +10,21 @@ data = {
     "Ncpv0": [6.3,39.7,26.3,20.8,67.1,94.7,42.4,12.8,53.3,139.4,171.5,53.7,52.1,164.2,290.2,83.3,141.1,106.8,163.9,100.5,183.5,252.3,105.7],
     "Ncpv1": [19.8,57,60.7,45.7,166.7,130.8,64.7,15.2,104.7,153.6,211.9,99.3,62.5,220,301,97.7,191,116.5,248.2,180.3,213.8,319.7,166.7]
 }
-df = pd.DataFrame(data)
+with stage('dataframe build', len(data["Id"])):
+    df = pd.DataFrame(data)
 
 # Calculate doubling times using exponential growth assumption
 # growth rate k = ln(C1/C0) / t  => doubling time = ln(2)/k
-df["CAC_rate"] = np.log(df["Cac1"]/df["Cac0"]) / 1.0
-df["CAC_dt"] = np.log(2) / df["CAC_rate"]
+with stage('ln/ratio computation', len(df)):
+    df["CAC_rate"] = np.log(df["Cac1"]/df["Cac0"]) / 1.0
+    df["CAC_dt"] = np.log(2) / df["CAC_rate"]
 
-df["NCPV_rate"] = np.log(df["Ncpv1"]/df["Ncpv0"]) / 1.0
-df["NCPV_dt"] = np.log(2) / df["NCPV_rate"]
+    df["NCPV_rate"] = np.log(df["Ncpv1"]/df["Ncpv0"]) / 1.0
+    df["NCPV_dt"] = np.log(2) / df["NCPV_rate"]
 
-# Compute average doubling times (ignoring negative/0 growth)
-cac_dt_mean = df[df["CAC_dt"] > 0]["CAC_dt"].mean()
-ncpv_dt_mean = df[df["NCPV_dt"] > 0]["NCPV_dt"].mean()
+    # Compute average doubling times (ignoring negative/0 growth)
+    cac_dt_mean = df[df["CAC_dt"] > 0]["CAC_dt"].mean()
+    ncpv_dt_mean = df[df["NCPV_dt"] > 0]["NCPV_dt"].mean()
 
 # Print the results
 print("CAC Doubling Time Mean:", cac_dt_mean)
@@ -1,44 +1,128 @@
-﻿import math
+"""
+Half-life / doubling-time report of the 'ratio vs Td*' regressions.
+
+Every regression of a visit ratio (Cac1/Cac0, ...) on a doubling-time
+column (TdCac, TdNcpv, ...) is taken from the mined-results store for
+every set. A negative slope is read as a half-life and a positive one as a
+doubling time, ln 2 / |slope| years (inf for a zero slope). The LnTd*
+regressors are left out: their slope is per ln-year, so ln 2 / |slope| is
+not a time. The whole selection is converted in one vectorized step and
+ranked by p-value.
+
+p-values are the two-sided t test of the OLS slope (n - 2 degrees of
+freedom), as regression_mine computes them and scipy.stats.linregress
+reports them. The baseline table was typed in from GoldMiner's output and
+its p-values came from a different test. Its slopes match, but its
+p-values do not (Cac1/Cac0 vs TdCac in Eta-17: 0.5601 there, 0.0267
+here).
+
+The store is streamed chunk by chunk and only the selected rows are kept.
+Without a store, just these two families are mined from the cohort.
+
+    python regression_mine.py --out mined_regressions.csv
+    python halflifetimes.py --same-attribute     # half_life_doubling_times.csv
+    python halflifetimes.py --synthetic 100000 --rank time
+"""
+import argparse
+import os
+
+import numpy as np
 import pandas as pd
 
+import keto_data
+import regression_mine
+from stage_profile import stage
+
+DEFAULT_REPORT = 'half_life_doubling_times.csv'
+DEPENDENT_FAMILIES = ('ratio',)
+REGRESSOR_FAMILIES = ('td',)
+REPORT_COLUMNS = ('Rank', 'Regression', 'Set', 'Slope', 'p_value', 'Type', 'Time_years')
+_COLUMNS = ['set', 'dependent', 'regressor', 'dep_family', 'reg_family', 'n', 'slope', 'p_value']
+
+
+def _attribute(columns, prefixes):
+    """The visit attribute of every column name once a leading prefix and visit suffix are stripped."""
+    names = pd.Series(columns, dtype=object).str.split('/').str[0]
+    for prefix in prefixes:
+        names = names.str.replace(f'^{prefix}', '', regex=True)
+    return names.str.replace(r'\d+$', '', regex=True).to_numpy(dtype=object)
+
+
+def select(chunk, same_attribute=False):
+    """The chunk's ratio-on-Td regressions; same_attribute keeps Cac1/Cac0 vs TdCac but not vs TdNcpv."""
+    keep = chunk['dep_family'].isin(DEPENDENT_FAMILIES) & chunk['reg_family'].isin(REGRESSOR_FAMILIES)
+    chunk = chunk[keep.to_numpy()]
+    if same_attribute and len(chunk):
+        dep = _attribute(chunk['dependent'], ())
+        reg = _attribute(chunk['regressor'], ('LnTd', 'Td'))
+        chunk = chunk[dep == reg]
+    return chunk
+
+
+def half_lives(frame):
+    """Type and Time_years of every slope, as arrays."""
+    slope = frame['slope'].to_numpy(dtype=np.float64)
+    magnitude = np.abs(slope)
+    time = np.full(len(slope), np.inf)
+    np.divide(np.log(2), magnitude, out=time, where=magnitude > 0)
+    kind = np.where(slope < 0, 'Half-life (regression)', 'Doubling (growth)')
+    return kind, np.round(time, 2)
+
+
+def report(chunks, same_attribute=False, rank='p_value'):
+    """The report frame (REPORT_COLUMNS) of every ratio-on-Td regression in the result chunks."""
+    with stage('half-life select') as s:
+        parts = [select(chunk, same_attribute) for chunk in chunks]
+        parts = [p for p in parts if len(p)]
+        frame = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=_COLUMNS)
+        s.items = len(frame)
+    with stage('half-life computation', len(frame)):
+        kind, time = half_lives(frame)
+        out = pd.DataFrame({
+            'Regression': (frame['dependent'].astype(str) + ' vs ' + frame['regressor'].astype(str)).to_numpy(),
+            'Set': (frame['set'].astype(str) + '-' + frame['n'].astype(np.int64).astype(str)).to_numpy(),
+            'Slope': frame['slope'].to_numpy(dtype=np.float64),
+            'p_value': frame['p_value'].to_numpy(dtype=np.float64),
+            'Type': kind,
+            'Time_years': time,
+        })
+        by = ['p_value', 'Time_years'] if rank == 'p_value' else ['Time_years', 'p_value']
+        out = out.sort_values(by, kind='mergesort', na_position='last', ignore_index=True)
+        out.insert(0, 'Rank', np.arange(1, len(out) + 1))
+    return out
+
+
+def mined(store, sets=keto_data.SET_NAMES, min_n=4):
+    """Result chunks of just the ratio and Td families, for a cohort without a mined store."""
+    dependents = regression_mine.all_columns(store.n_visits, DEPENDENT_FAMILIES)
+    regressors = regression_mine.all_columns(store.n_visits, REGRESSOR_FAMILIES)
+    return regression_mine.iter_mine(store, sets=sets, dependents=dependents, regressors=regressors, min_n=min_n)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Half-lives and doubling times of the ratio vs Td* regressions.')
+    parser.add_argument('--src', default=regression_mine.DEFAULT_RESULTS, help='mined result store')
+    parser.add_argument('--out', default=DEFAULT_REPORT)
+    parser.add_argument('--same-attribute', action='store_true', help='only Cac1/Cac0 vs TdCac, not vs TdNcpv')
+    parser.add_argument('--rank', choices=('p_value', 'time'), default='p_value')
+    parser.add_argument('--sets', nargs='*', default=list(keto_data.SET_NAMES), help='sets to mine without a store')
+    parser.add_argument('--synthetic', type=int, default=0, help='mine a synthetic cohort of this size')
+    parser.add_argument('--chunksize', type=int, default=200_000)
+    args = parser.parse_args()
+
+    if args.synthetic or not os.path.exists(args.src):
+        store = keto_data.synthetic_cohort(args.synthetic) if args.synthetic else keto_data.load()
+        chunks = mined(store, args.sets)
+    else:
+        chunks = regression_mine.read_results(args.src, args.chunksize, columns=_COLUMNS)
+    df = report(chunks, args.same_attribute, args.rank)
+
+    print(df.head(20).to_string(index=False))
+    with stage('csv write', len(df)):
+        df.to_csv(args.out, index=False)
+    counts = df['Type'].value_counts()
+    print(f"{len(df)} regressions ({', '.join(f'{k}: {v}' for k, v in counts.items())}) written to '{args.out}'")
+
 
-rows = [
-    # CAC
-    ("Cac1/Cac0 vs TdCac","Eta-17",-0.0312,0.5601),
-    ("Cac1/Cac0 vs TdCac","Theta-17",-0.0141,0.6968),
-    ("Cac1/Cac0 vs TdCac","Beta-34",-0.0137,0.7065),
-    ("Cac1/Cac0 vs TdCac","Alpha-82",0.0209,0.8007),
-    ("Cac1/Cac0 vs TdCac","Omega-91",0.0151,0.8431),
-    ("Cac1/Cac0 vs TdCac","Zeta-9",-0.0067,0.8879),
-    ("Cac1/Cac0 vs TdCac","BetaUZeta-43",-0.0030,0.9455),
-    # NCPV
-    ("Ncpv1/Ncpv0 vs TdNcpv","Gamma-45",-0.1963,0.66116372),
-    ("Ncpv1/Ncpv0 vs TdNcpv","Alpha-85",-0.1404,0.62700814),
-    ("Ncpv1/Ncpv0 vs TdNcpv","Omega-97",-0.1035,0.67059389),
-    ("Ncpv1/Ncpv0 vs TdNcpv","Eta-17",-0.0951,0.38383917),
-    ("Ncpv1/Ncpv0 vs TdNcpv","Beta-40",-0.0741,0.53942816),
-    ("Ncpv1/Ncpv0 vs TdNcpv","Theta-23",-0.0723,0.55267777),
-    ("Ncpv1/Ncpv0 vs TdNcpv","BetaUZeta-52",-0.0489,0.63405439),
-    ("Ncpv1/Ncpv0 vs TdNcpv","Zeta-12",-0.0178,0.80121905),
-    # QAngio
-    ("QAngio1/QAngio0 vs TdQAng","Omega-10",-0.0518,0.81123843),
-    ("QAngio1/QAngio0 vs TdQAng","BetaUZeta-9",-0.0543,0.80451432),
-    ("QAngio1/QAngio0 vs TdQAng","Alpha-9",-0.0611,0.77587065),
-    ("QAngio1/QAngio0 vs TdQAng","Beta-8",-0.0651,0.76433206),
-    ("QAngio1/QAngio0 vs TdQAng","Eta-6",-0.0312,0.49525457),
-
-]
-
-df = pd.DataFrame(rows, columns=["Regression","Set","Slope","p_value"])
-
-# classify slope sign
-df["Type"] = df["Slope"].apply(lambda s: "Half-life (regression)" if s < 0 else "Doubling (growth)")
-
-# compute time in years
-df["Time_years"] = df["Slope"].abs().apply(lambda s: math.log(2)/s if s > 0 else float("inf"))
-df["Time_years"] = df["Time_years"].round(2)
-
-print(df)
-
-# save to CSV
-df.to_csv("half_life_doubling_times.csv", index=False)
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+"""
+Influence diagnostics for mined regressions: leverage, studentized
+residuals, Cook's distance and DFBETAS, and a flag for findings that hang
+on a single participant.
+
+Works on the mined result store (dependent ~ regressor) and on the
+cross-validated models of cross_validate.py (target ~ 'a + b', any number
+of terms). Regressions of the same set and size are diagnosed as one
+batch from closed-form quantities, with no refits:
+
+  * the Gram inverse (Z'Z)^-1 of each centred design gives the hat
+    diagonal h_i = z_i'(Z'Z)^-1 z_i and the coefficients;
+  * deleting participant i changes the coefficients by
+    (Z'Z)^-1 z_i e_i / (1 - h_i) and the SSE by e_i^2 / (1 - h_i), which give
+    DFBETAS, the externally studentized residual and Cook's distance;
+  * the same downdates give every leave-one-out F-test p-value, so
+    'single_point' marks a regression that is significant but loses it (or
+    flips a slope's sign) when one participant is dropped.
+
+    python influence.py --src mined_regressions.csv --out influence_regressions.csv
+    python influence.py --src cv_models.csv --out cv_influence.csv
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+import keto_data
+import regression_mine
+from stage_profile import stage
+
+DEFAULT_INFLUENCE = 'influence_regressions.csv'
+INFLUENCE_COLUMNS = ('max_leverage', 'max_cooks', 'cooks_id', 'n_cooks_high', 'max_abs_dfbetas', 'dfbetas_id',
+                     'max_abs_student', 'p_full', 'p_drop_max', 'drop_id', 'sign_flip', 'single_point')
+
+# Id column -> (the statistic it identifies, row index of its maximum)
+_ID_OF = {'cooks_id': ('max_cooks', 'cooks_row'), 'dfbetas_id': ('max_abs_dfbetas', 'dfbetas_row'),
+          'drop_id': ('p_drop_max', 'drop_row')}
+
+
+def influence(Y, X, alpha=0.05):
+    """
+    Influence summaries of B regressions of Y (B, n) on X (B, n, p), each
+    with an intercept, dropping non-finite rows per regression. Returns
+    (B,) arrays; the *_row entries index the most influential participant.
+    """
+    B, n_rows, p = X.shape
+    w = np.isfinite(Y) & np.isfinite(X).all(axis=2)
+    wf = w.astype(np.float64)
+    n = wf.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        y_mean = np.where(w, Y, 0).sum(axis=1) / n
+        x_mean = np.where(w[..., None], X, 0).sum(axis=1) / n[:, None]
+    y = np.where(w, Y - y_mean[:, None], 0.0)
+    Z = np.concatenate([wf[..., None], np.where(w[..., None], X - x_mean[:, None, :], 0.0)], axis=2)
+    q = p + 1
+
+    G = np.einsum('bni,bnj->bij', Z, Z)
+    scale = np.sqrt(np.einsum('bii->bi', G))
+    ok = (n > q + 1) & (scale[:, 1:] > 1e-12 * np.sqrt(n)[:, None]).all(axis=1)
+    # Equilibrate before the rank check so unit choices do not look singular
+    Gs = G / np.where(scale > 0, scale, 1)[:, :, None] / np.where(scale > 0, scale, 1)[:, None, :]
+    ok &= np.linalg.cond(np.where(ok[:, None, None], Gs, np.eye(q))) < 1e10
+    G_inv = np.linalg.inv(np.where(ok[:, None, None], G, np.eye(q)))
+
+    beta = np.einsum('bij,bj->bi', G_inv, np.einsum('bnj,bn->bj', Z, y))
+    e = np.where(w, y - np.einsum('bni,bi->bn', Z, beta), 0.0)
+    # Rows of Z (Z'Z)^-1 are (Z'Z)^-1 z_i, shared by the hat diagonal and DFBETA
+    ZG = Z @ G_inv
+    h = np.einsum('bni,bni->bn', ZG, Z)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        one_minus_h = np.where(w, 1 - h, np.nan)
+        dof = n - q
+        sse = (e * e).sum(axis=1)
+        sst = (y * y).sum(axis=1)
+        s2 = sse / dof
+        sse_drop = sse[:, None] - e * e / one_minus_h
+        s2_drop = sse_drop / (dof - 1)[:, None]
+        student = e / np.sqrt(s2_drop * one_minus_h)
+        cooks = e * e * h / (q * s2[:, None] * one_minus_h ** 2)
+        dfbeta = ZG * (e / one_minus_h)[..., None]
+        dfbetas = dfbeta[..., 1:] / (np.sqrt(s2_drop)[..., None] * np.sqrt(np.einsum('bii->bi', G_inv)[:, None, 1:]))
+
+        f_full = (sst - sse) / p / s2
+        # A constant dependent has nothing to explain; the miner reports p = 1 for it
+        p_full = np.where(sst > 0, stats.f.sf(f_full, p, dof), 1.0)
+        sst_drop = sst[:, None] - y * y * (n / (n - 1))[:, None]
+        # The F survival function falls with F, so the largest leave-one-out p is at the smallest F
+        # (a leave-one-out fit can be exact, with an SSE of rounding noise either side of zero)
+        exact = np.maximum(sse_drop, 0)
+        f_drop = np.where(sst_drop > 0, (sst_drop - exact) / p / (exact / (dof - 1)[:, None]), 0.0)
+        flips = (np.sign(beta[:, None, 1:] - dfbeta[..., 1:]) != np.sign(beta[:, None, 1:])).any(axis=2) & w
+
+    def worst(values):
+        values = np.where(w & np.isfinite(values), values, -np.inf)
+        row = values.argmax(axis=1)
+        return np.take_along_axis(values, row[:, None], axis=1)[:, 0], row
+
+    max_h, _ = worst(h)
+    max_cooks, cooks_row = worst(cooks)
+    max_dfbetas, dfbetas_row = worst(np.abs(dfbetas).max(axis=2))
+    max_student, _ = worst(np.abs(student))
+    f_drop_min, drop_row = worst(np.where(np.isnan(f_drop), np.nan, -f_drop))
+    with np.errstate(invalid='ignore'):
+        dropped = (w & ~np.isnan(f_drop)).any(axis=1)
+        p_drop_max = np.where(dropped, stats.f.sf(-f_drop_min, p, dof - 1), np.nan)
+    sign_flip = flips.any(axis=1)
+    out = {
+        'n': n.astype(np.int64),
+        'max_leverage': max_h,
+        'max_cooks': max_cooks,
+        'cooks_row': cooks_row,
+        'n_cooks_high': ((cooks > 4 / n[:, None]) & w).sum(axis=1),
+        'max_abs_dfbetas': max_dfbetas,
+        'dfbetas_row': dfbetas_row,
+        'max_abs_student': max_student,
+        'p_full': p_full,
+        'p_drop_max': p_drop_max,
+        'drop_row': drop_row,
+        'sign_flip': sign_flip,
+        'single_point': ((p_full <= alpha) & (p_drop_max > alpha)) | ((p_full <= alpha) & sign_flip),
+    }
+    for key, values in out.items():
+        if values.dtype.kind == 'f':
+            out[key] = np.where(ok, np.where(np.isinf(values), np.nan, values), np.nan)
+        elif key in ('sign_flip', 'single_point'):
+            out[key] = values & ok
+    return out
+
+
+def _terms(chunk):
+    """Dependent names and predictor name lists of a mined (regressor) or cross-validated (predictors) chunk."""
+    if 'regressor' in chunk:
+        return chunk['dependent'].tolist(), [[r] for r in chunk['regressor']]
+    return chunk['target'].tolist(), [p.split(' + ') for p in chunk['predictors']]
+
+
+def annotate_chunk(store, chunk, alpha=0.05, budget=20_000_000):
+    """The chunk with INFLUENCE_COLUMNS appended; ids are participant Ids."""
+    dependents, predictors = _terms(chunk)
+    extra = {c: np.full(len(chunk), np.nan) for c in INFLUENCE_COLUMNS}
+    extra['sign_flip'] = np.zeros(len(chunk), dtype=bool)
+    extra['single_point'] = np.zeros(len(chunk), dtype=bool)
+    sizes = np.array([len(t) for t in predictors])
+    for (set_name, p), rows in chunk.assign(_p=sizes).groupby(['set', '_p'], sort=False).indices.items():
+        view = store.view(set_name)
+        names = sorted({dependents[i] for i in rows} | {t for i in rows for t in predictors[i]})
+        data = view.matrix(names).astype(np.float64, copy=False)
+        index = {name: i for i, name in enumerate(names)}
+        ids = view.ids
+        step = max(1, budget // (view.n * (p + 1)))
+        for start in range(0, len(rows), step):
+            part = rows[start:start + step]
+            with stage('influence', len(part)):
+                Y = data[[index[dependents[i]] for i in part]]
+                X = data[np.array([[index[t] for t in predictors[i]] for i in part])].transpose(0, 2, 1)
+                out = influence(Y, X, alpha)
+            for column in INFLUENCE_COLUMNS:
+                if column in _ID_OF:
+                    value, row = _ID_OF[column]
+                    extra[column][part] = np.where(np.isnan(out[value]), np.nan, ids[out[row]])
+                else:
+                    extra[column][part] = out[column]
+    frame = chunk.copy()
+    for column in INFLUENCE_COLUMNS:
+        frame[column] = extra[column]
+    for column in _ID_OF:
+        frame[column] = frame[column].astype('Int64')
+    return frame
+
+
+def iter_influence(store, chunks, alpha=0.05, max_p=None):
+    """Annotates a stream of result chunks; with max_p only regressions with p_value <= max_p are kept."""
+    for chunk in chunks:
+        if max_p is not None and 'p_value' in chunk:
+            chunk = chunk[chunk['p_value'] <= max_p].reset_index(drop=True)
+        if len(chunk):
+            yield annotate_chunk(store, chunk, alpha)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Leverage, Cook\'s distance and DFBETAS for mined regressions.')
+    parser.add_argument('--src', default=regression_mine.DEFAULT_RESULTS)
+    parser.add_argument('--out', default=DEFAULT_INFLUENCE)
+    parser.add_argument('--alpha', type=float, default=0.05)
+    parser.add_argument('--max-p', type=float, default=None, help='only diagnose regressions with p <= this')
+    parser.add_argument('--chunksize', type=int, default=50_000)
+    parser.add_argument('--synthetic', type=int, default=0, help='diagnose against a synthetic cohort')
+    args = parser.parse_args()
+
+    store = keto_data.synthetic_cohort(args.synthetic) if args.synthetic else keto_data.load()
+    chunks = iter_influence(store, regression_mine.read_results(args.src, args.chunksize), args.alpha, args.max_p)
+    rows = regression_mine.write_results(chunks, args.out)
+    print(f"{rows} regressions diagnosed in '{args.out}'")
+
+    significant = flagged = 0
+    drivers = pd.Series(dtype=np.int64)
+    for chunk in regression_mine.read_results(args.out, args.chunksize, columns=['p_full', 'single_point', 'drop_id']):
+        significant += int((chunk['p_full'] <= args.alpha).sum())
+        hit = chunk[chunk['single_point']]
+        flagged += len(hit)
+        drivers = drivers.add(hit['drop_id'].value_counts(), fill_value=0)
+    print(f'p <= {args.alpha}: {significant}; hang on a single participant: {flagged}')
+    if len(drivers):
+        print('Participants most often deciding a finding (Id: regressions):')
+        print(', '.join(f'{int(i)}: {int(c)}' for i, c in drivers.sort_values(ascending=False).head(10).items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,455 @@
+"""
+Compact struct-of-arrays model of the Keto-CTA participants.
+
+Mirrors Keto_Cta.Element/Visit: each visit attribute (Tps, Cac, Ncpv, Tcpv,
+Pav, Qangio) is one contiguous (participants x visits) array, and every
+derived Element column (DCac, LnDNcpv, TdCac, GeoMeanPav, CacPredict, ...)
+is a 1-D array computed on first use and cached. Ratio selectors use the
+DataMiner spelling: 'LnCac0 / LnNcpv0' or 'ln(Cac1 / Cac0)'.
+
+Participants are stored ordered by leaf set (Gamma, Theta, Eta, Zeta), so
+every set in the README hierarchy is one contiguous slice and view(set)
+returns zero-copy column views. dtype=np.float32 halves the footprint for
+large synthetic cohorts.
+
+Visit times are per participant (years since the first visit, from
+Visit.VisitDate when known) and default to one-year spacing; Td columns
+use the real first-to-last interval.
+"""
+import copy
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from stage_profile import stage
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TEST_DATA = os.path.join(HERE, '..', 'KetoCtaRegressions', 'TestData')
+DEFAULT_KETO_CTA_CSV = os.path.join(TEST_DATA, 'keto-cta-quant-and-semi-quant.csv')
+DEFAULT_QANGIO_CSV = os.path.join(TEST_DATA, 'keto-cta-qangio.csv')
+
+VISIT_ATTRIBUTES = ('Tps', 'Cac', 'Ncpv', 'Tcpv', 'Pav', 'Qangio')
+# Column order of keto-cta-quant-and-semi-quant.csv: V1/V2 pairs per attribute
+CSV_ATTRIBUTES = ('Tps', 'Cac', 'Ncpv', 'Tcpv', 'Pav')
+
+# Keto_Cta.LeafSetName values
+LEAF_SETS = {'Zeta': 1, 'Gamma': 2, 'Theta': 3, 'Eta': 4}
+# Storage order; keeps every set below contiguous
+LEAF_ORDER = ('Gamma', 'Theta', 'Eta', 'Zeta')
+SET_LEAVES = {
+    'Omega': ('Gamma', 'Theta', 'Eta', 'Zeta'),
+    'Alpha': ('Gamma', 'Theta', 'Eta'),
+    'Beta': ('Theta', 'Eta'),
+    'BetaUZeta': ('Theta', 'Eta', 'Zeta'),
+    'Zeta': ('Zeta',),
+    'Gamma': ('Gamma',),
+    'Theta': ('Theta',),
+    'Eta': ('Eta',),
+}
+SET_NAMES = ('Omega', 'Alpha', 'Beta', 'Zeta', 'Gamma', 'Theta', 'Eta', 'BetaUZeta')
+
+ELEMENT_COLUMNS = tuple(
+    [f'{p}{a}' for p in ('D', 'GeoMean', 'LnD', 'LnGeoMean', 'Td', 'LnTd') for a in VISIT_ATTRIBUTES]
+    + ['MaxNcpv', 'LnMaxNcpv', 'MinNcpv', 'LnMinNcpv', 'MaxCac', 'LnMaxCac', 'MinCac', 'LnMinCac']
+    + ['CacPredict', 'NcpvPredict', 'LnCacPredict', 'LnNcpvPredict']
+)
+
+_ATTR = '|'.join(VISIT_ATTRIBUTES)
+_VISIT_RE = re.compile(rf'^(Ln)?({_ATTR})(\d+)$')
+_ELEMENT_RE = re.compile(rf'^(D|GeoMean|LnD|LnGeoMean|Td|LnTd)({_ATTR})$')
+_EXTREME_RE = re.compile(r'^(Ln)?(Max|Min)(Ncpv|Cac)$')
+_PREDICT_RE = re.compile(r'^(Ln)?(Cac|Ncpv)Predict$')
+_LN_RATIO_RE = re.compile(r'^ln\((.+)/(.+)\)$', re.IGNORECASE)
+_RATIO_RE = re.compile(r'^([^/()]+)/([^/()]+)$')
+
+
+def ln(values, offset=1.0):
+    """MathUtils.Ln: natural log of |value| + offset."""
+    return np.log(np.abs(values) + offset)
+
+
+def td(v0, v1, dt=1.0):
+    """
+    MathUtils.Td, vectorized: time to double (positive) or half-life
+    (negative). No change gives 0 (the 'infinite' case), a non-positive
+    visit value gives NaN.
+    """
+    v0 = np.asarray(v0)
+    v1 = np.asarray(v1)
+    out = np.full(np.broadcast(v0, v1).shape, np.nan, dtype=np.result_type(v0, v1, np.float32))
+    valid = (v0 > 0) & (v1 > 0)
+    dt = np.broadcast_to(np.asarray(dt, dtype=out.dtype), out.shape)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_ratio = np.log(np.where(valid, v1, 1) / np.where(valid, v0, 1))
+        out[valid] = dt[valid] * np.log(2) / log_ratio[valid]
+    out[np.abs(v1 - v0) < 1e-8] = 0.0
+    return out
+
+
+def dbl_predict(td_values, baseline, years=1.0):
+    """MathUtils.DblPredict: baseline grown (or decayed) for `years` at the rate implied by Td."""
+    td_values = np.asarray(td_values)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate = np.where(td_values > 0, np.log(2) / td_values, np.log(0.5) / -td_values)
+        out = baseline * np.exp(years * rate)
+    out = np.where(td_values == 0, baseline, out)
+    return np.where(np.isnan(td_values), np.nan, out).astype(np.result_type(td_values, baseline))
+
+
+def years_since_first(dates):
+    """(participants x visits) visit dates -> years since each participant's first visit."""
+    dates = np.asarray(dates, dtype='datetime64[D]')
+    days = (dates - dates[:, :1]).astype(np.float64)
+    days[np.isnat(dates)] = np.nan
+    return days / 365.25
+
+
+def attributes_of(name):
+    """The visit attributes a column is computed from, e.g. {'Cac', 'Ncpv'} for LnCac0/LnNcpv1."""
+    return set(re.findall(_ATTR, name))
+
+
+def classify(visits):
+    """Keto_Cta.Element.ComputeSetState over all participants: LeafSetName codes."""
+    first = {a: visits[a][:, 0] for a in CSV_ATTRIBUTES}
+    last = {a: visits[a][:, -1] for a in CSV_ATTRIBUTES}
+    is_zeta = np.zeros(len(first['Cac']), dtype=bool)
+    for a in CSV_ATTRIBUTES:
+        is_zeta |= last[a] < first[a]
+    leaf = np.where(last['Cac'] - first['Cac'] > 10, LEAF_SETS['Eta'], LEAF_SETS['Theta'])
+    leaf = np.where((first['Cac'] == 0) & (last['Cac'] == 0), LEAF_SETS['Gamma'], leaf)
+    return np.where(is_zeta, LEAF_SETS['Zeta'], leaf).astype(np.int8)
+
+
+def _normalize(name):
+    return re.sub(r'\s+', '', name)
+
+
+class ColumnStore:
+    """Participants x visits arrays plus lazily derived Element columns."""
+
+    def __init__(self, ids, visits, leaf=None, dtype=np.float64, ln_offset=1.0, visit_years=None):
+        self.dtype = np.dtype(dtype)
+        self.ln_offset = ln_offset
+        visits = {a: np.asarray(v, dtype=self.dtype) for a, v in visits.items()}
+        n = len(ids)
+        n_visits = next(iter(visits.values())).shape[1]
+        if visit_years is None:
+            visit_years = np.arange(n_visits)
+        visit_years = np.broadcast_to(np.asarray(visit_years, dtype=self.dtype), (n, n_visits))
+        for a in VISIT_ATTRIBUTES:
+            if a not in visits:
+                visits[a] = np.full((n, n_visits), np.nan, dtype=self.dtype)
+        leaf = classify(visits) if leaf is None else np.asarray(leaf, dtype=np.int8)
+
+        rank = np.empty(max(LEAF_SETS.values()) + 1, dtype=np.int8)
+        for i, name in enumerate(LEAF_ORDER):
+            rank[LEAF_SETS[name]] = i
+        order = np.argsort(rank[leaf], kind='stable')
+        self.ids = np.asarray(ids)[order]
+        self.leaf = leaf[order]
+        self._visits = {a: np.ascontiguousarray(visits[a][order]) for a in VISIT_ATTRIBUTES}
+        self._years = np.ascontiguousarray(visit_years[order])
+        self._cache = {}
+        # Columns handed in by attach(): not derivable, so drop() leaves them alone
+        self._attached = {}
+
+        counts = np.bincount(rank[self.leaf], minlength=len(LEAF_ORDER))
+        bounds = dict(zip(LEAF_ORDER, zip(np.cumsum(counts) - counts, np.cumsum(counts))))
+        self._slices = {s: slice(int(bounds[leaves[0]][0]), int(bounds[leaves[-1]][1]))
+                        for s, leaves in SET_LEAVES.items()}
+
+    @classmethod
+    def from_csv(cls, path=DEFAULT_KETO_CTA_CSV, qangio_path=DEFAULT_QANGIO_CSV, dtype=np.float64, ln_offset=1.0,
+                 visit_dates=None):
+        """
+        Reads the Keto-CTA CSV the way GoldMiner.ReadKetoCtaFile does; ids are
+        1-based row numbers. visit_dates is an optional (rows x visits) array
+        of dates in CSV row order.
+        """
+        with stage('csv parse') as s:
+            raw = pd.read_csv(path).to_numpy(dtype=np.float64)
+            s.items = len(raw)
+        n = len(raw)
+        visits = {a: raw[:, 2 * i:2 * i + 2] for i, a in enumerate(CSV_ATTRIBUTES)}
+        visits['Qangio'] = np.full((n, 2), np.nan)
+        if qangio_path and os.path.exists(qangio_path):
+            qa = pd.read_csv(qangio_path).to_numpy(dtype=np.float64)
+            rows = qa[:, 0].astype(int) - 1
+            keep = (rows >= 0) & (rows < n)
+            visits['Qangio'][rows[keep]] = qa[keep, 1:3]
+        years = None if visit_dates is None else years_since_first(visit_dates)
+        return cls(np.arange(1, n + 1), visits, dtype=dtype, ln_offset=ln_offset, visit_years=years)
+
+    # ---- shape and sets ----
+
+    @property
+    def n(self):
+        return len(self.ids)
+
+    @property
+    def n_visits(self):
+        return self._visits['Cac'].shape[1]
+
+    def __len__(self):
+        return self.n
+
+    def set_slice(self, set_name):
+        return self._slices[set_name]
+
+    def set_sizes(self):
+        return {s: self._slices[s].stop - self._slices[s].start for s in SET_NAMES}
+
+    def view(self, set_name):
+        return SetView(self, set_name, self._slices[set_name])
+
+    def views(self, set_names=SET_NAMES):
+        return [self.view(s) for s in set_names]
+
+    # ---- columns ----
+
+    def visit(self, attribute):
+        """(participants x visits) array of one visit attribute."""
+        return self._visits[attribute]
+
+    @property
+    def years(self):
+        """(participants x visits) visit times in years since the first visit."""
+        return self._years
+
+    def column(self, name):
+        key = _normalize(name)
+        if key in self._attached:
+            return self._attached[key]
+        cached = self._cache.get(key)
+        if cached is None:
+            cached = self._cache[key] = self._derive(key)
+        return cached
+
+    def columns(self, names):
+        return [self.column(n) for n in names]
+
+    def matrix(self, names, rows=slice(None)):
+        """
+        Selected columns stacked as a (len(names) x participants) array. On a
+        with_ln_offsets() store, when any column is stacked by offset, the
+        result is (offsets x len(names) x participants), with the columns
+        that do not depend on the offset repeated along the first axis.
+        """
+        cols = [self.column(n)[..., rows] for n in names]
+        lead = np.broadcast_shapes(*(c.shape[:-1] for c in cols))
+        return np.stack([np.broadcast_to(c, lead + c.shape[-1:]) for c in cols], axis=-2)
+
+    def attach(self, name, values):
+        """Adds a computed per-participant column (store order), such as PCA scores, under name."""
+        values = np.asarray(values, dtype=self.dtype)
+        if values.shape != (self.n,):
+            raise ValueError(f'Column {name} has shape {values.shape}, expected ({self.n},)')
+        self._attached[_normalize(name)] = values
+        return self
+
+    def materialize(self, names=ELEMENT_COLUMNS):
+        with stage('derive columns', len(names) * self.n):
+            for name in names:
+                self.column(name)
+        return self
+
+    def with_ln_offsets(self, offsets):
+        """
+        A store over the same visits whose Ln transforms use every offset in
+        the grid at once: columns that depend on the offset come back stacked
+        as (len(offsets), participants), the others unchanged.
+        """
+        swept = copy.copy(self)
+        swept.ln_offset = np.asarray(offsets, dtype=np.float64)[:, None]
+        swept._cache = {}
+        swept._attached = dict(self._attached)
+        return swept
+
+    def is_cached(self, name):
+        key = _normalize(name)
+        return key in self._cache or key in self._attached
+
+    def drop(self, names=None):
+        """Frees derived columns (all of them by default); they are re-derived on the next use."""
+        for name in (list(self._cache) if names is None else names):
+            self._cache.pop(_normalize(name), None)
+
+    def column_names(self):
+        visit_cols = [f'{ln_}{a}{v}' for ln_ in ('', 'Ln') for a in VISIT_ATTRIBUTES for v in range(self.n_visits)]
+        return visit_cols + list(ELEMENT_COLUMNS)
+
+    @property
+    def nbytes(self):
+        arrays = list(self._visits.values()) + [self._years, self.ids, self.leaf]
+        arrays += [c for c in (*self._cache.values(), *self._attached.values()) if c.base is None]
+        return sum(a.nbytes for a in arrays)
+
+    def to_frame(self, names=None, rows=slice(None)):
+        names = self.column_names() if names is None else names
+        data = {}
+        for n in names:
+            values = self.column(n)[..., rows]
+            if values.ndim == 1:
+                data[n] = values
+            else:
+                # Stacked by Ln offset: one column per offset, e.g. LnCac0[0.5]
+                data.update({f'{n}[{o:g}]': v for o, v in zip(np.ravel(self.ln_offset), values)})
+        frame = pd.DataFrame(data)
+        frame.insert(0, 'Id', self.ids[rows])
+        return frame
+
+    def _ln(self, values):
+        return ln(values, self.ln_offset).astype(self.dtype, copy=False)
+
+    def _derive(self, name):
+        m = _VISIT_RE.match(name)
+        if m:
+            values = self._visits[m.group(2)][:, int(m.group(3))]
+            return self._ln(values) if m.group(1) else values
+
+        m = _ELEMENT_RE.match(name)
+        if m:
+            prefix, attr = m.groups()
+            v = self._visits[attr]
+            if prefix == 'D':
+                return (v[:, -1] - v[:, 0]).astype(self.dtype, copy=False)
+            if prefix == 'GeoMean':
+                with np.errstate(invalid='ignore', over='ignore'):
+                    g = np.prod(np.abs(v), axis=1) ** (1.0 / v.shape[1])
+                return np.where((v < 0).any(axis=1), np.nan, g).astype(self.dtype, copy=False)
+            if prefix == 'Td':
+                return td(v[:, 0], v[:, -1], self._years[:, -1] - self._years[:, 0]).astype(self.dtype, copy=False)
+            return self._ln(self.column(prefix[2:] + attr))
+
+        m = _EXTREME_RE.match(name)
+        if m:
+            is_ln, kind, attr = m.groups()
+            if is_ln:
+                return self._ln(self.column(kind + attr))
+            v = self._visits[attr]
+            return (v.max(axis=1) if kind == 'Max' else v.min(axis=1)).astype(self.dtype, copy=False)
+
+        m = _PREDICT_RE.match(name)
+        if m:
+            is_ln, attr = m.groups()
+            if is_ln:
+                return self._ln(self.column(attr + 'Predict'))
+            return dbl_predict(self.column('Td' + attr), self._visits[attr][:, -1]).astype(self.dtype, copy=False)
+
+        m = _LN_RATIO_RE.match(name)
+        if m:
+            return self._ln(self._ratio(m.group(1), m.group(2)))
+
+        m = _RATIO_RE.match(name)
+        if m:
+            return self._ratio(m.group(1), m.group(2))
+
+        raise KeyError(f'Unknown column: {name}')
+
+    def _ratio(self, numerator, denominator):
+        # CreateSelector semantics: a zero numerator or denominator gives 0
+        n = self.column(numerator)
+        d = self.column(denominator)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            r = np.where((n == 0) | (d == 0), 0, n / np.where(d == 0, 1, d))
+        return r.astype(self.dtype, copy=False)
+
+
+class SetView:
+    """Zero-copy window onto one set's contiguous rows of a ColumnStore."""
+
+    def __init__(self, store, name, rows):
+        self.store = store
+        self.name = name
+        self.rows = rows
+
+    @property
+    def n(self):
+        return self.rows.stop - self.rows.start
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def ids(self):
+        return self.store.ids[self.rows]
+
+    def visit(self, attribute):
+        return self.store.visit(attribute)[self.rows]
+
+    @property
+    def years(self):
+        return self.store.years[self.rows]
+
+    def column(self, name):
+        return self.store.column(name)[..., self.rows]
+
+    def matrix(self, names):
+        return self.store.matrix(names, self.rows)
+
+    def to_frame(self, names=None):
+        return self.store.to_frame(names, self.rows)
+
+    def __repr__(self):
+        return f'SetView({self.name}, n={self.n})'
+
+
+def load(path=DEFAULT_KETO_CTA_CSV, qangio_path=DEFAULT_QANGIO_CSV, dtype=np.float64, ln_offset=1.0, visit_dates=None):
+    return ColumnStore.from_csv(path, qangio_path, dtype=dtype, ln_offset=ln_offset, visit_dates=visit_dates)
+
+
+def synthetic_cohort(n, seed=0, dtype=np.float64, source=None, jitter=0.15, chunk=1_000_000,
+                     waves=None, date_jitter=0.08):
+    """
+    Bootstrap cohort of n participants resampled from the real data with
+    lognormal jitter, generated in chunks straight into the target dtype.
+    A shared per-attribute factor keeps each participant's visit-to-visit
+    change; a small per-visit factor lets some participants change set.
+
+    waves (nominal visit years, e.g. (0, 1, 2.5)) simulates more visits:
+    each resampled participant's first-to-last change is extended
+    geometrically (linearly when a visit is zero) to their own visit dates,
+    which scatter around the nominal years by date_jitter years.
+    """
+    source = source or load()
+    rng = np.random.default_rng(seed)
+    n_visits = source.n_visits if waves is None else len(waves)
+    visits = {a: np.empty((n, n_visits), dtype=dtype) for a in VISIT_ATTRIBUTES}
+    years = np.empty((n, n_visits), dtype=dtype)
+    with stage('synthetic cohort', n):
+        for start in range(0, n, chunk):
+            stop = min(start + chunk, n)
+            pick = rng.integers(0, source.n, stop - start)
+            if waves is None:
+                t = source.years[pick]
+            else:
+                t = np.asarray(waves, dtype=np.float64) + rng.normal(0.0, date_jitter, (stop - start, n_visits))
+                t = np.maximum.accumulate(t - t[:, :1], axis=1)
+                span = source.years[pick, -1:] - source.years[pick, :1]
+                frac = t / span
+            years[start:stop] = t
+            for a in VISIT_ATTRIBUTES:
+                base = source.visit(a)[pick]
+                if waves is not None:
+                    v0, v1 = base[:, :1], base[:, -1:]
+                    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+                        grown = v0 * (v1 / v0) ** frac
+                    linear = np.maximum(v0 + (v1 - v0) * frac, 0.0)
+                    base = np.where((v0 > 0) & (v1 > 0), grown, linear)
+                shared = rng.lognormal(0.0, jitter, size=(stop - start, 1))
+                own = rng.lognormal(0.0, jitter / 5, size=base.shape)
+                values = base * shared * own
+                if a in ('Tps', 'Cac'):
+                    values = np.rint(values)
+                visits[a][start:stop] = values
+    return ColumnStore(np.arange(1, n + 1), visits, dtype=dtype, ln_offset=source.ln_offset, visit_years=years)
+
+
+if __name__ == '__main__':
+    store = load()
+    print(f'{store.n} participants, {store.n_visits} visits')
+    for set_name, size in store.set_sizes().items():
+        print(f'{set_name:>10}: {size}')
@@ -0,0 +1,260 @@
+"""
+Diff of two mining runs: which regressions appeared, disappeared, or
+moved by more than a threshold in slope, R^2 or p-value.
+
+Both runs are streamed in chunks and brought into key order, by default
+(set, dependent, regressor), with an external sort: every chunk is sorted
+and spilled to a temporary run file as a sequence of pickled blocks. The
+runs of one side are then merged and the two sides merge-joined in one
+pass. Both merges work a block at a time: only keys up to the smallest
+last key buffered from any input can be complete, so those rows are taken
+from every input at once, merged with one vectorized sort or join, and
+the inputs are refilled. Time is the chunk sorts plus one linear pass,
+and memory is one chunk while sorting and one block per run while
+merging, however many rows the runs have.
+
+A matched regression is 'changed' when any of these hold:
+  slope         |slope_b - slope_a| > slope_rel * max(|slope_a|, |slope_b|)
+  sign          the slope changed sign
+  r2            |r2_b - r2_a| > r2_abs
+  p             |log10 p_b - log10 p_a| > p_log10 (orders of magnitude)
+  significance  p crossed alpha
+  fit           the fit became (or stopped being) undefined
+Keys only in the new run are 'added', keys only in the old run are
+'removed'. The diff is written in key order.
+
+Other CSV listings work with their own key and value columns:
+
+    python mine_diff.py old_regressions.csv mined_regressions.csv --out regression_diff.csv
+    python mine_diff.py old/half_life_doubling_times.csv half_life_doubling_times.csv \\
+        --key Regression Set --slope Slope --r2 none --p p_value
+"""
+import argparse
+import os
+import pickle
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import regression_mine
+from stage_profile import stage
+
+DEFAULT_DIFF = 'regression_diff.csv'
+DEFAULT_KEY = ('set', 'dependent', 'regressor')
+# Diff value name -> result store column
+DEFAULT_VALUES = {'n': 'n', 'slope': 'slope', 'r2': 'r2', 'p': 'p_value'}
+FLAGS = ('slope', 'sign', 'r2', 'p', 'significance', 'fit')
+# Joins the key columns into one sortable string; sorts before any printable character
+_SEP = '\x1f'
+
+
+def _keyed(chunk, key, values):
+    """The chunk reduced to a joined '_key' column and the value columns, renamed to their diff names."""
+    joined = chunk[key[0]].astype(str)
+    for column in key[1:]:
+        joined = joined + _SEP + chunk[column].astype(str)
+    frame = pd.DataFrame({'_key': joined.to_numpy(dtype=object)})
+    for name, column in values.items():
+        frame[name] = chunk[column].to_numpy()
+    return frame
+
+
+def _spill(frame, path, block):
+    with open(path, 'wb') as f:
+        for start in range(0, len(frame), block):
+            pickle.dump(frame.iloc[start:start + block].reset_index(drop=True), f, pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+def _read_run(path):
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def sorted_runs(path, key, values, work, chunksize=500_000, block=50_000):
+    """
+    Spills path's rows as key-sorted runs of one chunk each into work.
+    Returns one iterator of sorted blocks per run; a single-chunk file is
+    kept in memory. Duplicate keys keep their first row.
+    """
+    runs = []
+    first = None
+    with stage('diff sort') as s:
+        rows = 0
+        chunks = regression_mine.read_results(path, chunksize, columns=list(key) + list(values.values()))
+        for i, chunk in enumerate(chunks):
+            frame = _keyed(chunk, key, values).sort_values('_key', kind='stable', ignore_index=True)
+            rows += len(frame)
+            if i == 0:
+                first = frame
+                continue
+            # More than one chunk: every run goes to disk
+            if first is not None:
+                runs.append(_spill(first, os.path.join(work, f'{os.path.basename(path)}.0.run'), block))
+                first = None
+            runs.append(_spill(frame, os.path.join(work, f'{os.path.basename(path)}.{i}.run'), block))
+        s.items = rows
+    if first is not None:
+        return [(first.iloc[start:start + block] for start in range(0, len(first), block))]
+    return [_read_run(r) for r in runs]
+
+
+def aligned(streams):
+    """
+    Steps through key-sorted streams of frames together: each step yields
+    one frame per stream holding every row with a key up to the smallest
+    last key buffered from any unfinished stream, so a key never straddles
+    two steps.
+    """
+    streams = [iter(s) for s in streams]
+    buffers = [None] * len(streams)
+    finished = [False] * len(streams)
+    while True:
+        for i, stream in enumerate(streams):
+            while not finished[i] and (buffers[i] is None or not len(buffers[i])):
+                nxt = next(stream, None)
+                if nxt is None:
+                    finished[i] = True
+                else:
+                    buffers[i] = nxt if buffers[i] is None else pd.concat([buffers[i], nxt], ignore_index=True)
+        live = [b['_key'].iat[-1] for b, done in zip(buffers, finished) if not done]
+        if all(finished) and not any(b is not None and len(b) for b in buffers):
+            return
+        bound = min(live) if live else None
+        step = []
+        for i, b in enumerate(buffers):
+            if b is None or not len(b):
+                step.append(b.iloc[:0] if b is not None else None)
+                continue
+            cut = len(b) if bound is None else int(np.searchsorted(b['_key'].to_numpy(), bound, side='right'))
+            step.append(b.iloc[:cut])
+            buffers[i] = b.iloc[cut:].reset_index(drop=True)
+        yield step
+
+
+def merged(runs):
+    """One key-sorted stream of frames from several sorted runs; duplicate keys keep their first row."""
+    if not runs:
+        return
+    for step in aligned(runs):
+        parts = [p for p in step if p is not None and len(p)]
+        if not parts:
+            continue
+        frame = pd.concat(parts, ignore_index=True).sort_values('_key', kind='stable')
+        yield frame.drop_duplicates('_key', ignore_index=True)
+
+
+def classify(joined, slope_rel=0.1, r2_abs=0.05, p_log10=1.0, alpha=0.05):
+    """Status ('added', 'removed', 'changed', 'unchanged') and ';'-joined flags of merge-joined rows."""
+    side = joined['_merge'].to_numpy()
+    flags = {}
+
+    def get(name, s):
+        column = f'{name}_{s}'
+        return joined[column].to_numpy(dtype=np.float64) if column in joined else None
+
+    slope_a, slope_b = get('slope', 'a'), get('slope', 'b')
+    r2_a, r2_b = get('r2', 'a'), get('r2', 'b')
+    p_a, p_b = get('p', 'a'), get('p', 'b')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if slope_a is not None:
+            flags['slope'] = np.abs(slope_b - slope_a) > slope_rel * np.maximum(np.abs(slope_a), np.abs(slope_b))
+            flags['sign'] = np.sign(slope_a) * np.sign(slope_b) < 0
+            flags['fit'] = np.isnan(slope_a) != np.isnan(slope_b)
+        if r2_a is not None:
+            flags['r2'] = np.abs(r2_b - r2_a) > r2_abs
+        if p_a is not None:
+            log_a, log_b = np.log10(np.maximum(p_a, 1e-300)), np.log10(np.maximum(p_b, 1e-300))
+            flags['p'] = np.abs(log_b - log_a) > p_log10
+            flags['significance'] = (p_a <= alpha) != (p_b <= alpha)
+    both = side == 'both'
+    changed = np.zeros(len(joined), dtype=bool)
+    names = np.full(len(joined), '', dtype=object)
+    for flag in FLAGS:
+        if flag in flags:
+            hit = flags[flag] & both
+            changed |= hit
+            names = np.where(hit, np.where(names == '', flag, names + ';' + flag), names)
+    status = np.where(side == 'left_only', 'removed', np.where(side == 'right_only', 'added',
+                                                               np.where(changed, 'changed', 'unchanged')))
+    return status, names
+
+
+def iter_diff(old, new, key=DEFAULT_KEY, values=None, chunksize=500_000, slope_rel=0.1, r2_abs=0.05, p_log10=1.0,
+              alpha=0.05, max_p=None, keep_unchanged=False, tmpdir=None):
+    """Yields diff frames in key order: the key columns, status, flags and every value for both runs."""
+    key = list(key)
+    values = dict(DEFAULT_VALUES if values is None else values)
+    present = [set(pd.read_csv(path, nrows=0).columns) for path in (old, new)]
+    values = {name: column for name, column in values.items() if all(column in cols for cols in present)}
+    with tempfile.TemporaryDirectory(dir=tmpdir) as work:
+        sides = [merged(sorted_runs(path, key, values, work, chunksize)) for path in (old, new)]
+        for a, b in aligned(sides):
+            a = a if a is not None else pd.DataFrame(columns=['_key', *values])
+            b = b if b is not None else pd.DataFrame(columns=['_key', *values])
+            with stage('diff join', len(a) + len(b)):
+                joined = a.merge(b, on='_key', how='outer', suffixes=('_a', '_b'), indicator=True, sort=True)
+                status, flags = classify(joined, slope_rel, r2_abs, p_log10, alpha)
+                keep = status != 'unchanged' if not keep_unchanged else np.ones(len(joined), dtype=bool)
+                if max_p is not None and 'p' in values:
+                    with np.errstate(invalid='ignore'):
+                        p = np.fmin(joined['p_a'].to_numpy(dtype=np.float64), joined['p_b'].to_numpy(dtype=np.float64))
+                    keep &= p <= max_p
+                if not keep.any():
+                    continue
+                joined = joined[keep]
+                parts = joined['_key'].str.split(_SEP, n=len(key) - 1, expand=True)
+                frame = pd.DataFrame({column: parts[i].to_numpy() for i, column in enumerate(key)})
+                frame['status'] = status[keep]
+                frame['flags'] = flags[keep]
+                for name in values:
+                    for s in ('a', 'b'):
+                        frame[f'{name}_{s}'] = joined[f'{name}_{s}'].to_numpy()
+            yield frame
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Regressions added, removed or moved between two mining runs.')
+    parser.add_argument('old')
+    parser.add_argument('new')
+    parser.add_argument('--out', default=DEFAULT_DIFF)
+    parser.add_argument('--key', nargs='*', default=list(DEFAULT_KEY))
+    parser.add_argument('--n', default='n', help="column names in the runs ('none' to skip)")
+    parser.add_argument('--slope', default='slope')
+    parser.add_argument('--r2', default='r2')
+    parser.add_argument('--p', default='p_value')
+    parser.add_argument('--slope-rel', type=float, default=0.1, help='relative slope change')
+    parser.add_argument('--r2-abs', type=float, default=0.05, help='absolute R^2 change')
+    parser.add_argument('--p-log10', type=float, default=1.0, help='p-value change in orders of magnitude')
+    parser.add_argument('--alpha', type=float, default=0.05, help='significance level for crossings')
+    parser.add_argument('--max-p', type=float, default=None, help='ignore regressions with p > this in both runs')
+    parser.add_argument('--all', action='store_true', help='also write unchanged regressions')
+    parser.add_argument('--chunksize', type=int, default=500_000)
+    args = parser.parse_args()
+
+    values = {name: column for name, column in
+              (('n', args.n), ('slope', args.slope), ('r2', args.r2), ('p', args.p)) if column.lower() != 'none'}
+    chunks = iter_diff(args.old, args.new, args.key, values, args.chunksize, args.slope_rel, args.r2_abs,
+                       args.p_log10, args.alpha, args.max_p, args.all)
+    rows = regression_mine.write_results(chunks, args.out)
+    print(f"{rows} differences written to '{args.out}'")
+
+    status = pd.Series(dtype=np.int64)
+    flags = pd.Series(dtype=np.int64)
+    for chunk in regression_mine.read_results(args.out, columns=['status', 'flags']):
+        status = status.add(chunk['status'].value_counts(), fill_value=0)
+        flags = flags.add(chunk['flags'].dropna().astype(str).str.split(';').explode().value_counts(), fill_value=0)
+    if len(status):
+        print(', '.join(f'{s}: {int(status.get(s, 0))}' for s in ('added', 'removed', 'changed', 'unchanged')
+                        if s in status))
+    if len(flags):
+        print('Changed by: ' + ', '.join(f'{f}: {int(flags[f])}' for f in FLAGS if f in flags))
+
+
+if __name__ == '__main__':
+    main()
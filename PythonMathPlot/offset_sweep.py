@@ -0,0 +1,188 @@
+"""
+Sensitivity of the mined regressions to the Ln offset constant.
+
+Every Ln column is MathUtils.Ln(value, addConstant = 1.0), ln(|v| + 1), and
+the mined slopes, R^2 and p-values of any regression with an Ln side
+depend on that +1. This sweep re-derives the offset-dependent columns for a
+whole grid of offsets at once (ColumnStore.with_ln_offsets stacks them as
+(offsets, participants)) and refits only the affected regressions, with one
+stacked regression_mine.ols_matrix call per pair class:
+
+    Ln dependent on any regressor, plain dependent on Ln regressor.
+
+Plain-on-plain regressions do not move and are not refit. Per
+(set, dependent, regressor) the summary gives the fit at the reference
+offset (1.0), the range of slope, R^2 and p over the grid, whether the
+slope keeps its sign, and whether a finding that is significant at the
+reference offset stays significant at every offset ('survives').
+
+    python offset_sweep.py --offsets 0.01 0.1 0.5 1 2 5 10 --out offset_sweep.csv
+    python offset_sweep.py --families ln_visit ln_delta delta --npz offset_fits.npz
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import keto_data
+import regression_mine
+from stage_profile import stage
+
+DEFAULT_OFFSETS = (0.01, 0.1, 0.5, 1.0, 2.0, 5.0, 10.0)
+DEFAULT_SWEEP = 'offset_sweep.csv'
+SWEEP_COLUMNS = ('set', 'dependent', 'regressor', 'dep_family', 'reg_family', 'n', 'slope', 'r2', 'p_value',
+                 'slope_min', 'slope_max', 'r2_min', 'r2_max', 'p_max', 'sign_stable', 'significant_share',
+                 'survives')
+
+
+def offset_dependent(swept, names):
+    """The names whose columns stack over the offset grid."""
+    return [name for name in names if swept.column(name).ndim == 2]
+
+
+def sweep_fits(view, dependents, regressors, min_n=4):
+    """
+    Fits of every dependent on every regressor for one set of an offset-swept
+    store, each output stacked as (offsets, dependents, regressors).
+    Plain-on-plain pairs are left NaN, they do not depend on the offset.
+    """
+    k = view.store.ln_offset.shape[0]
+    deps_ln = np.array([view.column(d).ndim == 2 for d in dependents])
+    regs_ln = np.array([view.column(r).ndim == 2 for r in regressors])
+
+    def stack(names, ln):
+        """(offsets, columns, n) for Ln columns, (1, columns, n) for plain ones."""
+        cols = [view.column(c).astype(np.float64, copy=False) for c in names]
+        if not cols:
+            return None
+        return np.stack(cols, axis=1) if ln else np.stack(cols)[None]
+
+    fits = {key: np.full((k, len(dependents), len(regressors)), np.nan)
+            for key in ('n', 'slope', 'intercept', 'r2', 'p_value')}
+    Y_ln = stack([d for d, m in zip(dependents, deps_ln) if m], True)
+    Y_plain = stack([d for d, m in zip(dependents, deps_ln) if not m], False)
+    X_ln = stack([r for r, m in zip(regressors, regs_ln) if m], True)
+    X_plain = stack([r for r, m in zip(regressors, regs_ln) if not m], False)
+    with stage('offset sweep fit', k * len(dependents) * len(regressors)):
+        for (rows, Y), (cols, X) in (((deps_ln, Y_ln), (regs_ln, X_ln)), ((deps_ln, Y_ln), (~regs_ln, X_plain)),
+                                     ((~deps_ln, Y_plain), (regs_ln, X_ln))):
+            if Y is None or X is None:
+                continue
+            part = regression_mine.ols_matrix(Y, X, min_n)
+            for key, values in part.items():
+                fits[key][np.ix_(np.arange(k), np.flatnonzero(rows), np.flatnonzero(cols))] = values
+    return fits
+
+
+def summarize(set_name, dependents, regressors, fits, offsets, reference=1.0, alpha=0.05, fam=None):
+    """One SWEEP_COLUMNS row per refit regression of one set."""
+    fam = fam or {}
+    ref = int(np.argmin(np.abs(np.asarray(offsets) - reference)))
+    slope, r2, p = fits['slope'], fits['r2'], fits['p_value']
+    keep = np.isfinite(slope[ref])
+    keep &= np.asarray(dependents, dtype=object)[:, None] != np.asarray(regressors, dtype=object)[None, :]
+    d_idx, r_idx = np.nonzero(keep)
+    with np.errstate(invalid='ignore'):
+        sign_stable = (np.sign(slope) == np.sign(slope[ref])).all(axis=0)
+        significant = p <= alpha
+        share = significant.mean(axis=0)
+        survives = significant.all(axis=0)
+    return pd.DataFrame({
+        'set': set_name,
+        'dependent': np.asarray(dependents, dtype=object)[d_idx],
+        'regressor': np.asarray(regressors, dtype=object)[r_idx],
+        'dep_family': [fam.get(dependents[i], 'other') for i in d_idx],
+        'reg_family': [fam.get(regressors[j], 'other') for j in r_idx],
+        'n': fits['n'][ref][keep].astype(np.int64),
+        'slope': slope[ref][keep],
+        'r2': r2[ref][keep],
+        'p_value': p[ref][keep],
+        'slope_min': np.nanmin(slope[:, keep], axis=0),
+        'slope_max': np.nanmax(slope[:, keep], axis=0),
+        'r2_min': np.nanmin(r2[:, keep], axis=0),
+        'r2_max': np.nanmax(r2[:, keep], axis=0),
+        'p_max': np.nanmax(p[:, keep], axis=0),
+        'sign_stable': sign_stable[keep],
+        'significant_share': share[keep],
+        'survives': survives[keep],
+    })
+
+
+def iter_sweep(store, offsets=DEFAULT_OFFSETS, sets=keto_data.SET_NAMES, columns=None, min_n=4,
+               reference=1.0, alpha=0.05, block=64, stacked=None):
+    """
+    Yields one summary frame per (set, dependent block). Every selected
+    column is both dependent and regressor. When stacked is a dict, the raw
+    (offsets, dependents, regressors) fits are collected in it per set.
+    """
+    columns = list(columns or regression_mine.all_columns(store.n_visits))
+    fam = regression_mine.family_of(store.n_visits)
+    swept = store.with_ln_offsets(offsets)
+    with stage('offset columns', len(columns) * len(offsets)):
+        ln_columns = set(offset_dependent(swept, columns))
+    for set_name in sets:
+        view = swept.view(set_name)
+        if view.n < min_n:
+            continue
+        for start in range(0, len(columns), block):
+            deps = columns[start:start + block]
+            # Plain dependents only move against Ln regressors
+            regs = columns if any(d in ln_columns for d in deps) else [c for c in columns if c in ln_columns]
+            fits = sweep_fits(view, deps, regs, min_n)
+            if stacked is not None:
+                stacked.setdefault(set_name, []).append((deps, regs, fits))
+            yield summarize(set_name, deps, regs, fits, offsets, reference, alpha, fam)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sensitivity of the mined regressions to the Ln offset.')
+    parser.add_argument('--offsets', nargs='*', type=float, default=list(DEFAULT_OFFSETS))
+    parser.add_argument('--reference', type=float, default=1.0, help='offset the findings were mined with')
+    parser.add_argument('--alpha', type=float, default=0.05)
+    parser.add_argument('--out', default=DEFAULT_SWEEP)
+    parser.add_argument('--npz', default=None, help='also save the stacked per-offset fits')
+    parser.add_argument('--sets', nargs='*', default=list(keto_data.SET_NAMES))
+    parser.add_argument('--families', nargs='*', default=None)
+    parser.add_argument('--min-n', type=int, default=4)
+    parser.add_argument('--synthetic', type=int, default=0)
+    args = parser.parse_args()
+
+    offsets = sorted(set(args.offsets) | {args.reference})
+    store = keto_data.synthetic_cohort(args.synthetic) if args.synthetic else keto_data.load()
+    columns = regression_mine.all_columns(store.n_visits, args.families)
+    stacked = {} if args.npz else None
+    chunks = iter_sweep(store, offsets, args.sets, columns, args.min_n, args.reference, args.alpha, stacked=stacked)
+    rows = regression_mine.write_results(chunks, args.out)
+    print(f"{rows} offset-dependent regressions over offsets {offsets} written to '{args.out}'")
+    if stacked is not None:
+        arrays = {'offsets': np.asarray(offsets)}
+        for set_name, parts in stacked.items():
+            for i, (deps, regs, fits) in enumerate(parts):
+                arrays[f'{set_name}/{i}/dependents'] = np.asarray(deps)
+                arrays[f'{set_name}/{i}/regressors'] = np.asarray(regs)
+                for key in ('slope', 'r2', 'p_value'):
+                    arrays[f'{set_name}/{i}/{key}'] = fits[key]
+        np.savez_compressed(args.npz, **arrays)
+        print(f"Stacked fits (offset axis first) saved to '{args.npz}'")
+
+    totals = {'significant': 0, 'survives': 0, 'sign_flips': 0}
+    by_set = {}
+    for chunk in regression_mine.read_results(args.out, columns=['set', 'p_value', 'sign_stable', 'survives']):
+        found = chunk[chunk['p_value'] <= args.alpha]
+        totals['significant'] += len(found)
+        totals['survives'] += int(found['survives'].sum())
+        totals['sign_flips'] += int((~found['sign_stable']).sum())
+        for set_name, group in found.groupby('set'):
+            counts = by_set.setdefault(set_name, [0, 0])
+            counts[0] += len(group)
+            counts[1] += int(group['survives'].sum())
+    print(f"p <= {args.alpha} at offset {args.reference}: {totals['significant']}; significant at every offset: "
+          f"{totals['survives']}; slope sign flips somewhere on the grid: {totals['sign_flips']}")
+    for set_name in keto_data.SET_NAMES:
+        if set_name in by_set:
+            found, kept = by_set[set_name]
+            print(f'  {set_name:<10} {kept:>6} of {found:>6} survive ({kept / found:.0%})')
+
+
+if __name__ == '__main__':
+    main()
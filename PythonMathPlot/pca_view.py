@@ -0,0 +1,197 @@
+"""
+Principal components of the enhanced dataset by randomized SVD.
+
+The raw, Ln and delta columns of every attribute (QAngio, mostly missing,
+is left out) are standardized with a streamed mean and variance, as in
+set_clusters.py. Participants with a non-finite column get no scores
+(NaN). The leading components come from randomized subspace iteration
+(Halko, Martinsson & Tropp, 2011) on the standardized matrix A:
+
+- a Gaussian test matrix of k + oversample columns is multiplied by
+  A^T A one batch of participants at a time, A_b^T (A_b Q), so a pass
+  holds one batch and a (columns x (k + oversample)) block;
+- power passes re-orthonormalize and multiply again, sharpening the
+  leading subspace;
+- a last pass projects A^T A onto the subspace, and the small symmetric
+  eigenproblem gives the components and their variances.
+
+Loadings are component x sqrt(variance), the correlation of each column
+with each component. The scores are attached to the store as PC1, PC2,
+... columns, so the 2-D/3-D charts (chart_build.py pca_scores, pca_scene)
+plot them like any other column.
+
+    python pca_view.py --k 5 --out pca_loadings.csv --plot pca_scores.png
+    python pca_view.py --synthetic 5000000 --k 3
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import keto_data
+import regression_mine
+from set_clusters import Features
+from stage_profile import stage
+
+DEFAULT_FAMILIES = ('visit', 'ln_visit', 'delta', 'ln_delta')
+DEFAULT_LOADINGS = 'pca_loadings.csv'
+
+
+def default_columns(n_visits=2):
+    """The raw, Ln and delta columns of every attribute except QAngio."""
+    return [c for c in regression_mine.all_columns(n_visits, DEFAULT_FAMILIES) if 'Qangio' not in c]
+
+
+def _gram(features, Q):
+    """A^T (A Q) of the standardized feature rows, a batch at a time, and the trace of A^T A."""
+    out = np.zeros_like(Q)
+    trace = 0.0
+    with stage('pca pass', features.n):
+        for rows in features.slices():
+            X, _ = features.block(rows)
+            if len(X):
+                out += X.T @ (X @ Q)
+                trace += float(np.einsum('ij,ij->', X, X))
+    return out, trace
+
+
+class PCA:
+    """Leading principal components of standardized store columns."""
+
+    def __init__(self, features, k=3, oversample=10, power=2, seed=0):
+        self.features = features
+        self.columns = features.columns
+        d = len(self.columns)
+        k = min(k, d)
+        width = min(k + oversample, d)
+        rng = np.random.default_rng(seed)
+        G, trace = _gram(features, rng.standard_normal((d, width)))
+        Q = np.linalg.qr(G)[0]
+        for _ in range(power):
+            Q = np.linalg.qr(_gram(features, Q)[0])[0]
+        B = Q.T @ _gram(features, Q)[0]
+        values, vectors = np.linalg.eigh((B + B.T) / 2)
+        order = np.argsort(values)[::-1][:k]
+        components = (Q @ vectors[:, order]).T
+        # Sign convention: each component's largest-magnitude coefficient is positive
+        flip = np.sign(components[np.arange(k), np.abs(components).argmax(axis=1)])
+        self.components = components * np.where(flip == 0, 1, flip)[:, None]
+        dof = max(features.count - 1, 1)
+        self.variance = np.maximum(values[order], 0) / dof
+        # Unit per standardized column, none for a constant one
+        self.total_variance = trace / dof
+        self.ratio = self.variance / self.total_variance if self.total_variance > 0 else np.zeros(k)
+
+    @property
+    def k(self):
+        return len(self.components)
+
+    def names(self, prefix='PC'):
+        return [f'{prefix}{i + 1}' for i in range(self.k)]
+
+    def loadings(self):
+        """(columns x components) correlations of every column with every component."""
+        return pd.DataFrame((self.components * np.sqrt(self.variance)[:, None]).T,
+                            index=pd.Index(self.columns, name='column'), columns=self.names())
+
+    def summary(self):
+        return pd.DataFrame({'variance': self.variance, 'ratio': self.ratio, 'cumulative': np.cumsum(self.ratio)},
+                            index=pd.Index(self.names(), name='component'))
+
+    def scores(self):
+        """(k x participants) scores in store order; NaN where a column is not finite."""
+        out = np.full((self.k, self.features.n), np.nan)
+        with stage('pca scores', self.features.n):
+            for rows in self.features.slices():
+                X, finite = self.features.block(rows)
+                part = out[:, rows]
+                part[:, finite] = self.components @ X.T
+                out[:, rows] = part
+        return out
+
+    def attach(self, store, prefix='PC'):
+        """Adds the scores to store as PC1..PCk columns."""
+        for name, values in zip(self.names(prefix), self.scores()):
+            store.attach(name, values)
+        return store
+
+
+def scored_store(store=None, columns=None, k=3, **kwargs):
+    """store (the Keto-CTA data by default) with the leading components' scores attached."""
+    store = keto_data.load() if store is None else store
+    features = Features(store, columns or default_columns(store.n_visits))
+    return PCA(features, k, **kwargs).attach(store)
+
+
+def plot_sets(store, path, sets=keto_data.LEAF_ORDER, x='PC1', y='PC2', ratio=None, max_points=200_000):
+    """One panel per set of its scores over every participant's, in the set's colour."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from chart_build import SET_STYLES
+
+    rng = np.random.default_rng(0)
+    all_x, all_y = store.column(x), store.column(y)
+    background = rng.choice(store.n, size=min(max_points, store.n), replace=False)
+    fig, axes = plt.subplots(1, len(sets), figsize=(5 * len(sets), 5), sharex=True, sharey=True, squeeze=False)
+    for ax, set_name in zip(axes[0], sets):
+        view = store.view(set_name)
+        px, py = view.column(x), view.column(y)
+        shown = rng.choice(view.n, size=min(max_points, view.n), replace=False)
+        color, marker = SET_STYLES[set_name]
+        ax.scatter(all_x[background], all_y[background], s=2, color='lightgray', rasterized=True)
+        ax.scatter(px[shown], py[shown], s=4 if view.n > 10_000 else 20, color=color, marker=marker,
+                   alpha=0.5 if view.n > 10_000 else 1.0, rasterized=True)
+        ax.set_title(f'{set_name} (N={view.n})')
+        ax.set_xlabel(x if ratio is None else f'{x} ({ratio[0]:.1%})')
+        ax.grid(True)
+    axes[0][0].set_ylabel(y if ratio is None else f'{y} ({ratio[1]:.1%})')
+    fig.tight_layout()
+    fig.savefig(path, dpi=100)
+    plt.close(fig)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Randomized-SVD principal components of the enhanced dataset.')
+    parser.add_argument('--columns', nargs='*', default=None, help='default: raw, Ln and delta columns')
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--oversample', type=int, default=10)
+    parser.add_argument('--power', type=int, default=2, help='power passes')
+    parser.add_argument('--batch', type=int, default=65_536, help='participants per streamed batch')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--top', type=int, default=5, help='strongest loadings listed per component')
+    parser.add_argument('--out', default=DEFAULT_LOADINGS)
+    parser.add_argument('--scores', default=None, help='write per-participant scores')
+    parser.add_argument('--plot', default=None, help='per-set PC1 vs PC2 panels')
+    parser.add_argument('--synthetic', type=int, default=0)
+    args = parser.parse_args()
+
+    store = keto_data.synthetic_cohort(args.synthetic) if args.synthetic else keto_data.load()
+    columns = args.columns or default_columns(store.n_visits)
+    features = Features(store, columns, args.batch)
+    print(f'{features.count} of {store.n} participants have all {len(columns)} columns')
+    pca = PCA(features, args.k, args.oversample, args.power, args.seed)
+    loadings = pca.loadings()
+
+    with pd.option_context('display.width', 200, 'display.float_format', '{:.4f}'.format):
+        print(pca.summary().to_string())
+        for name in pca.names():
+            strongest = loadings[name].abs().sort_values(ascending=False).index[:args.top]
+            print(f'{name}: ' + ', '.join(f'{c} {loadings.at[c, name]:+.3f}' for c in strongest))
+    loadings.to_csv(args.out, float_format='%.6g')
+    print(f"Loadings written to '{args.out}'")
+
+    pca.attach(store)
+    if args.scores:
+        frame = store.to_frame(pca.names())
+        frame.insert(1, 'leaf', pd.Series(store.leaf).map({v: k for k, v in keto_data.LEAF_SETS.items()}))
+        frame.to_csv(args.scores, index=False, float_format='%.6g')
+        print(f"Scores written to '{args.scores}'")
+    if args.plot and pca.k >= 2:
+        with stage('pca plot', store.n):
+            plot_sets(store, args.plot, ratio=pca.ratio[:2])
+        print(f"Score plot written to '{args.plot}'")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+"""
+Streaming p-value histograms and Benjamini-Hochberg / Benjamini-Yekutieli
+q-values over a mined result store, in bounded memory.
+
+Pass 1 reads the results once: it fills the DustsPvalueHistogram-style
+report histograms per (set, family), counts p-values into fine log-spaced
+buckets and spills the raw p-values to a flat binary file (8 bytes a row).
+
+The fine bucket counts give every p-value's rank up to its bucket, so the
+buckets are cut into contiguous groups of at most max_rows p-values. A
+lone bucket holding more is cut again, on an equal-width grid counted from
+the spill file, until every group fits or holds a single tied value (all
+the p = 1.0 of flat dependents, say). Groups are then taken from the
+largest p-values down: a group's p-values are read back from the spill
+file, sorted for their exact ranks R, and turned into m * p / R, whose
+running minimum from the top is the BH q-value. A tied group shares one
+rank, so its q-value is written while scanning, without holding its rows.
+The results go to a disk-backed array in row order, and BY is BH times
+sum(1/i), capped at 1.
+
+Pass 2 streams the results again and writes them out with q_bh and q_by
+appended. Peak memory is one read chunk plus max_rows p-values, however
+many regressions were mined and however they tie. NaN p-values take no
+part and get NaN q.
+
+    python pvalue_fdr.py --src deduped_regressions.csv --out fdr_regressions.csv --by set reg_family
+"""
+import argparse
+import os
+import tempfile
+
+import numpy as np
+
+import regression_mine
+from stage_profile import stage
+
+DEFAULT_FDR = 'fdr_regressions.csv'
+REPORT_BINS = 5
+# Fine rank buckets: [0, 1e-300), then 10 per decade up to 1, then [1, inf)
+FINE_EDGES = np.concatenate([[0.0], np.logspace(-300, 0, 3001)[:-1], [1.0, np.inf]])
+# Equal-width parts a heavy bucket is cut into at each refinement
+REFINE_PARTS = 1024
+
+
+def histogram_header(bins=REPORT_BINS):
+    """DustsPvalueHistogram column titles: 0-0.2, ..., 0.8-1.0, NaN."""
+    edges = np.linspace(0, 1, bins + 1)
+    return [f'{lo:g}-{hi:.1f}' if hi == 1 else f'{lo:g}-{hi:g}' for lo, hi in zip(edges[:-1], edges[1:])] + ['NaN']
+
+
+class PvalueHistogram:
+    """Report histograms keyed by any result columns, filled chunk by chunk."""
+
+    def __init__(self, by=('set',), bins=REPORT_BINS):
+        self.by = list(by)
+        self.bins = bins
+        self.counts = {}
+
+    def add(self, chunk):
+        p = chunk['p_value'].to_numpy(dtype=np.float64)
+        bucket = np.where(np.isnan(p), self.bins, np.minimum((np.nan_to_num(p) * self.bins).astype(np.int64),
+                                                             self.bins - 1))
+        for key, rows in chunk.groupby(self.by, sort=False).indices.items():
+            key = key if isinstance(key, tuple) else (key,)
+            hist = self.counts.setdefault(key, np.zeros(self.bins + 1, dtype=np.int64))
+            hist += np.bincount(bucket[rows], minlength=self.bins + 1)
+
+    def report(self):
+        lines = [', '.join([*(c.replace('_', ' ').title() for c in self.by), *histogram_header(self.bins)])]
+        for key in sorted(self.counts):
+            lines.append(', '.join([*map(str, key), *map(str, self.counts[key].tolist())]))
+        return lines
+
+
+def bucket_groups(counts, max_rows):
+    """Cuts fine buckets into contiguous (first, stop) ranges of at most max_rows values (a lone bucket may exceed it)."""
+    groups = []
+    first, total = 0, 0
+    for b, c in enumerate(counts):
+        if total and total + c > max_rows:
+            groups.append((first, b))
+            first, total = b, 0
+        total += c
+    groups.append((first, len(counts)))
+    return groups
+
+
+def _refine(spill_path, lo, hi, max_rows, chunk_rows):
+    """
+    Ascending (lo, hi, count) ranges covering the spilled p-values in [lo, hi),
+    each holding at most max_rows of them or a single tied value (lo == hi).
+    """
+    # p-values never exceed 1, so the open top bucket [1, inf) ends just above it
+    top = min(hi, np.nextafter(1.0, 2.0))
+    edges = np.unique(np.linspace(lo, top, REFINE_PARTS + 1))
+    counts = np.zeros(len(edges) - 1, dtype=np.int64)
+    low, high = np.inf, -np.inf
+    p_all = np.memmap(spill_path, dtype=np.float64, mode='r')
+    for start in range(0, len(p_all), chunk_rows):
+        p = np.asarray(p_all[start:start + chunk_rows])
+        p = p[(p >= lo) & (p < hi)]
+        if len(p):
+            counts += np.bincount(np.searchsorted(edges, p, side='right') - 1, minlength=len(counts))
+            low, high = min(low, p.min()), max(high, p.max())
+    del p_all
+    if low == high:
+        return [(low, low, int(counts.sum()))]
+    ranges = []
+    for first, stop in bucket_groups(counts, max_rows):
+        count = int(counts[first:stop].sum())
+        if count > max_rows:
+            ranges += _refine(spill_path, edges[first], edges[stop], max_rows, chunk_rows)
+        elif count:
+            ranges.append((edges[first], edges[stop], count))
+    return ranges
+
+
+def plan_ranges(spill_path, fine_counts, max_rows=5_000_000, chunk_rows=1_000_000):
+    """Ascending (lo, hi, count) ranges of the spilled p-values: at most max_rows each, or one tied value (lo == hi)."""
+    ranges = []
+    for first, stop in bucket_groups(fine_counts, max_rows):
+        count = int(fine_counts[first:stop].sum())
+        if count > max_rows:
+            with stage('bh refine', count):
+                ranges += _refine(spill_path, FINE_EDGES[first], FINE_EDGES[stop], max_rows, chunk_rows)
+        elif count:
+            ranges.append((FINE_EDGES[first], FINE_EDGES[stop], count))
+    return ranges
+
+
+def _fill(spill_path, q, value, q_value, chunk_rows):
+    """Writes q_value wherever the spilled p-value equals value."""
+    p_all = np.memmap(spill_path, dtype=np.float64, mode='r')
+    for start in range(0, len(p_all), chunk_rows):
+        hit = np.flatnonzero(np.asarray(p_all[start:start + chunk_rows]) == value)
+        q[hit + start] = q_value
+    del p_all
+
+
+def _scan(spill_path, lo, hi, chunk_rows):
+    """Row indices and p-values of the spilled p-values in [lo, hi)."""
+    p_all = np.memmap(spill_path, dtype=np.float64, mode='r')
+    rows, values = [], []
+    for start in range(0, len(p_all), chunk_rows):
+        p = np.asarray(p_all[start:start + chunk_rows])
+        hit = np.flatnonzero((p >= lo) & (p < hi))
+        rows.append(hit + start)
+        values.append(p[hit])
+    del p_all
+    return np.concatenate(rows), np.concatenate(values)
+
+
+def bh_qvalues(spill_path, q_path, fine_counts, max_rows=5_000_000, chunk_rows=1_000_000):
+    """
+    Exact uncapped BH q-values of the spilled p-values, written in row order
+    to a float64 file. Returns the number of tests m.
+    """
+    total = os.path.getsize(spill_path) // 8
+    m = int(fine_counts.sum())
+    q = np.memmap(q_path, dtype=np.float64, mode='w+', shape=(max(total, 1),))
+    q[:] = np.nan
+    ranges = plan_ranges(spill_path, fine_counts, max_rows, chunk_rows)
+    below = np.cumsum([0] + [count for _, _, count in ranges])
+    carry = np.inf
+    for (lo, hi, count), base in reversed(list(zip(ranges, below))):
+        with stage('bh group', count):
+            if lo == hi:
+                # One tied value: every row shares the rank base + count
+                carry = min(m * lo / (base + count), carry)
+                _fill(spill_path, q, lo, carry, chunk_rows)
+                continue
+            rows, p = _scan(spill_path, lo, hi, chunk_rows)
+            order = np.argsort(p, kind='stable')
+            rows, p = rows[order], p[order]
+            # Rank = number of p-values <= p, so tied p-values share their largest rank
+            rank = base + np.searchsorted(p, p, side='right')
+            raw = m * p / rank
+            qs = np.minimum(np.minimum.accumulate(raw[::-1])[::-1], carry)
+            carry = qs[0]
+            q[rows] = qs
+    q.flush()
+    del q
+    return m
+
+
+def by_factor(m):
+    """Benjamini-Yekutieli correction c(m) = sum of 1/i for i = 1..m."""
+    return float(np.sum(1.0 / np.arange(1, m + 1))) if m else 1.0
+
+
+def annotate(src, out, by=('set',), max_rows=5_000_000, chunksize=200_000, tmpdir=None):
+    """
+    Writes src's results to out with q_bh and q_by columns. Returns the
+    filled PvalueHistogram and the number of tests m.
+    """
+    hist = PvalueHistogram(by)
+    fine = np.zeros(len(FINE_EDGES) - 1, dtype=np.int64)
+    with tempfile.TemporaryDirectory(dir=tmpdir) as work:
+        spill_path = os.path.join(work, 'p_values.f8')
+        q_path = os.path.join(work, 'q_values.f8')
+        with stage('p-value pass') as s, open(spill_path, 'wb') as spill:
+            rows = 0
+            for chunk in regression_mine.read_results(src, chunksize):
+                p = chunk['p_value'].to_numpy(dtype=np.float64)
+                hist.add(chunk)
+                finite = p[np.isfinite(p)]
+                fine += np.bincount(np.searchsorted(FINE_EDGES, finite, side='right') - 1, minlength=len(fine))
+                p.tofile(spill)
+                rows += len(p)
+            s.items = rows
+        if rows == 0:
+            regression_mine.write_results([], out)
+            return hist, 0
+        m = bh_qvalues(spill_path, q_path, fine, max_rows, min(max_rows, 1_000_000))
+        c_m = by_factor(m)
+        q_all = np.memmap(q_path, dtype=np.float64, mode='r')
+
+        def annotated():
+            start = 0
+            for chunk in regression_mine.read_results(src, chunksize):
+                q = np.asarray(q_all[start:start + len(chunk)])
+                start += len(chunk)
+                yield chunk.assign(q_bh=np.minimum(q, 1.0), q_by=np.minimum(q * c_m, 1.0))
+
+        regression_mine.write_results(annotated(), out)
+        del q_all
+    return hist, m
+
+
+def main():
+    parser = argparse.ArgumentParser(description='p-value histograms and BH/BY q-values for a result store.')
+    parser.add_argument('--src', default=regression_mine.DEFAULT_RESULTS)
+    parser.add_argument('--out', default=DEFAULT_FDR)
+    parser.add_argument('--by', nargs='*', default=['set', 'reg_family'], help='histogram key columns')
+    parser.add_argument('--alpha', type=float, default=0.05)
+    parser.add_argument('--max-rows', type=int, default=5_000_000, help='p-values held in memory at once')
+    parser.add_argument('--chunksize', type=int, default=200_000)
+    args = parser.parse_args()
+
+    hist, m = annotate(args.src, args.out, args.by, args.max_rows, args.chunksize)
+    print('\n'.join(hist.report()))
+    significant = {'q_bh': 0, 'q_by': 0}
+    for chunk in regression_mine.read_results(args.out, args.chunksize, columns=list(significant)):
+        for column in significant:
+            significant[column] += int((chunk[column] <= args.alpha).sum())
+    print(f"\n{m} tests; q <= {args.alpha}: {significant['q_bh']} (BH), {significant['q_by']} (BY)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""
+Streaming deduplication of mined regressions (regression_mine.py results).
+
+Two passes over each chunk, both vectorized:
+
+  * exact duplicates - the Python Dust.Key: a 64-bit hash of set,
+    dependent, regressor (whitespace stripped, lower case) and R^2 to 7
+    places; a result seen before is dropped;
+  * affine duplicates - within a set, two columns that are affine
+    transforms of each other (LnCac0 and 2*LnCac0 + 1, a column and its
+    negation, a ratio and a constant multiple of it) give regressions with
+    the same N, R^2 and p-value. Each set's columns are fingerprinted once
+    from the store (z-scored, sign-normalised and rounded values), and
+    only the first regression per (set, dependent class, regressor class)
+    is kept. A column regressed on an affine copy of itself is dropped.
+
+Kept rows gain a 'group' column, the hash shared by every regression
+folded into them, so the dropped members can be traced later. Only the
+seen hashes are held in memory (8 bytes each), never the results.
+
+    python regression_dedup.py --src mined_regressions.csv --out deduped_regressions.csv
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import keto_data
+import regression_mine
+from stage_profile import stage
+
+DEFAULT_DEDUPED = 'deduped_regressions.csv'
+
+
+def _hash_rows(frame):
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy(dtype=np.uint64)
+
+
+def dust_keys(chunk, r2_digits=7):
+    """Dust.Key equivalent for every row of a result chunk."""
+    name = (chunk['dependent'].astype(str) + 'vs.' + chunk['regressor'].astype(str))
+    key = pd.DataFrame({
+        'name': name.str.replace(r'\s+', '', regex=True).str.lower(),
+        'set': chunk['set'].astype(str).str.lower(),
+        'r2': chunk['r2'].round(r2_digits),
+    })
+    return _hash_rows(key)
+
+
+def affine_classes(store, set_name, columns, digits=6):
+    """
+    Column -> class hash for one set; columns in the same class are affine
+    transforms of each other on that set's rows (same missing rows too).
+    The hash depends only on the column's values, so classes computed in
+    separate calls agree. Constant columns each get a class of their own.
+    """
+    M = store.view(set_name).matrix(columns).astype(np.float64)
+    finite = np.isfinite(M)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.nanmean(np.where(finite, M, np.nan), axis=1, keepdims=True)
+        std = np.nanstd(np.where(finite, M, np.nan), axis=1, keepdims=True)
+        z = (M - mean) / std
+    constant = ~(std[:, 0] > 1e-12 * np.maximum(np.abs(mean[:, 0]), 1.0))
+    z = np.where(finite, z, 0.0)
+    # Sign of the first clearly nonzero value makes x and -x alike
+    lead = np.argmax(np.abs(z) > 10.0 ** -digits, axis=1)
+    z *= np.where(z[np.arange(len(z)), lead] < 0, -1.0, 1.0)[:, None]
+    z = np.round(z, digits) + 0.0
+    z[~finite] = np.inf
+    classes = _hash_rows(pd.DataFrame(z))
+    own = _hash_rows(pd.DataFrame({'name': [f'constant:{c}' for c in columns]}))
+    classes = np.where(constant, own, classes).view(np.int64)
+    return dict(zip(columns, classes.tolist()))
+
+
+class Deduplicator:
+    """
+    Stateful filter over a stream of result chunks. With a store, affine
+    duplicates are grouped as well as exact ones.
+    """
+
+    def __init__(self, store=None, r2_digits=7, digits=6):
+        self.store = store
+        self.r2_digits = r2_digits
+        self.digits = digits
+        self._seen_keys = np.zeros(0, dtype=np.uint64)
+        self._seen_groups = np.zeros(0, dtype=np.uint64)
+        self._classes = {}
+        self.rows_in = 0
+        self.exact_dropped = 0
+        self.affine_dropped = 0
+
+    def _class_of(self, set_name, names):
+        known = self._classes.setdefault(set_name, {})
+        missing = sorted(set(names) - known.keys())
+        if missing:
+            known.update(affine_classes(self.store, set_name, missing, self.digits))
+        return known
+
+    def _groups(self, chunk):
+        """Group hash per row, and a mask of rows regressing a column on an affine copy of itself."""
+        if self.store is None:
+            return _hash_rows(chunk[['set', 'dependent', 'regressor']]), np.zeros(len(chunk), dtype=bool)
+        dep_class = np.empty(len(chunk), dtype=np.int64)
+        reg_class = np.empty(len(chunk), dtype=np.int64)
+        for set_name, rows in chunk.groupby('set', sort=False).indices.items():
+            part = chunk.iloc[rows]
+            classes = self._class_of(set_name, set(part['dependent']) | set(part['regressor']))
+            dep_class[rows] = part['dependent'].map(classes).to_numpy()
+            reg_class[rows] = part['regressor'].map(classes).to_numpy()
+        groups = _hash_rows(pd.DataFrame({'set': chunk['set'].to_numpy(), 'dep': dep_class,
+                                          'reg': reg_class, 'n': chunk['n'].to_numpy()}))
+        return groups, dep_class == reg_class
+
+    @staticmethod
+    def _first_unseen(hashes, seen):
+        """Mask of rows whose hash is new (first occurrence in the chunk), and the grown seen array."""
+        unique, first = np.unique(hashes, return_index=True)
+        new = np.ones(len(unique), dtype=bool)
+        if len(seen):
+            new = seen[np.minimum(np.searchsorted(seen, unique), len(seen) - 1)] != unique
+        keep = np.zeros(len(hashes), dtype=bool)
+        keep[first[new]] = True
+        return keep, np.union1d(seen, unique[new])
+
+    def process(self, chunk):
+        """Drops the rows of one chunk already represented; returns the kept rows."""
+        self.rows_in += len(chunk)
+        with stage('dedup', len(chunk)) as s:
+            keep, self._seen_keys = self._first_unseen(dust_keys(chunk, self.r2_digits), self._seen_keys)
+            self.exact_dropped += int((~keep).sum())
+            chunk = chunk[keep]
+            groups, trivial = self._groups(chunk)
+            keep, self._seen_groups = self._first_unseen(groups, self._seen_groups)
+            keep &= ~trivial
+            self.affine_dropped += int((~keep).sum())
+            chunk = chunk[keep].assign(group=groups[keep].view(np.int64))
+            s.items = len(chunk)
+        return chunk
+
+    def __call__(self, chunks):
+        for chunk in chunks:
+            kept = self.process(chunk)
+            if len(kept):
+                yield kept
+
+    def summary(self):
+        kept = self.rows_in - self.exact_dropped - self.affine_dropped
+        return (f'{self.rows_in} regressions: {self.exact_dropped} exact and '
+                f'{self.affine_dropped} affine duplicates dropped, {kept} kept')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Drop duplicate and affine-equivalent mined regressions.')
+    parser.add_argument('--src', default=regression_mine.DEFAULT_RESULTS)
+    parser.add_argument('--out', default=DEFAULT_DEDUPED)
+    parser.add_argument('--exact-only', action='store_true', help='skip affine grouping (no store needed)')
+    parser.add_argument('--synthetic', type=int, default=0, help='results were mined from a synthetic cohort')
+    parser.add_argument('--chunksize', type=int, default=200_000)
+    args = parser.parse_args()
+
+    store = None
+    if not args.exact_only:
+        store = keto_data.synthetic_cohort(args.synthetic) if args.synthetic else keto_data.load()
+    dedup = Deduplicator(store)
+    regression_mine.write_results(dedup(regression_mine.read_results(args.src, args.chunksize)), args.out)
+    print(dedup.summary())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+"""
+Vectorized regression mining over the Keto-CTA column store.
+
+The Python counterpart of DataMiner's GoldMiner: for every set and every
+(dependent, regressor) column pair it fits a simple OLS regression and
+reports N, slope, intercept, R^2 and p-value. A dependent block's fits for
+all regressors come from a handful of masked matrix products, so a set's
+thousands of regressions cost a few BLAS calls. Missing values (QAngio)
+are dropped pairwise.
+
+With robust=True each kept regression is refit with the Theil-Sen
+estimator (robust_regression.py) and ts_slope/ts_intercept are reported
+next to the OLS values; workers > 1 spreads those fits over a process pool.
+
+Results stream out as DataFrame chunks (iter_mine) and are stored as CSV
+(write_results/read_results), the result store the report stages read.
+
+    python regression_mine.py --out mined_regressions.csv --robust --workers 4
+"""
+import argparse
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+import keto_data
+from robust_regression import theil_sen_pairs
+from stage_profile import stage
+
+RESULT_COLUMNS = ('set', 'dependent', 'regressor', 'dep_family', 'reg_family',
+                  'n', 'slope', 'intercept', 'r2', 'p_value')
+ROBUST_COLUMNS = ('ts_slope', 'ts_intercept')
+DEFAULT_RESULTS = 'mined_regressions.csv'
+
+# Cross-attribute Ln ratios, as in 3dregressions.txt ('LnCac0 / LnNcpv0 vs. LnCac1')
+_LN_RATIO_PAIRS = (('Cac', 'Ncpv'), ('Ncpv', 'Cac'), ('Cac', 'Tps'), ('Tcpv', 'Ncpv'), ('Pav', 'Ncpv'))
+
+
+def families(n_visits=2):
+    """Regression column families, keyed by family name."""
+    attrs = keto_data.VISIT_ATTRIBUTES
+    visits = range(n_visits)
+    last = n_visits - 1
+    return {
+        'visit': [f'{a}{v}' for a in attrs for v in visits],
+        'ln_visit': [f'Ln{a}{v}' for a in attrs for v in visits],
+        'delta': [f'D{a}' for a in attrs],
+        'ln_delta': [f'LnD{a}' for a in attrs],
+        'geomean': [f'GeoMean{a}' for a in attrs],
+        'ln_geomean': [f'LnGeoMean{a}' for a in attrs],
+        'td': [f'Td{a}' for a in attrs],
+        'ln_td': [f'LnTd{a}' for a in attrs],
+        'extreme': ['MaxNcpv', 'MinNcpv', 'MaxCac', 'MinCac', 'LnMaxNcpv', 'LnMinNcpv', 'LnMaxCac', 'LnMinCac'],
+        'predict': ['CacPredict', 'NcpvPredict', 'LnCacPredict', 'LnNcpvPredict'],
+        'ratio': [f'{a}{last}/{a}0' for a in attrs],
+        'ln_ratio': [f'Ln{a}{i}/Ln{b}{j}' for a, b in _LN_RATIO_PAIRS for i in visits for j in visits],
+    }
+
+
+def family_of(n_visits=2):
+    """Column name -> family name."""
+    return {c: f for f, cols in families(n_visits).items() for c in cols}
+
+
+def all_columns(n_visits=2, names=None):
+    fams = families(n_visits)
+    return [c for f in (names or fams) for c in fams[f]]
+
+
+def ols_matrix(dependents, regressors, min_n=4):
+    """
+    Simple OLS of every dependent row on every regressor row, pairwise
+    dropping non-finite values. Inputs are (d, n) and (r, n); every output
+    is a (d, r) array. Stacked inputs (..., d, n) and (..., r, n) broadcast
+    over the leading axes like matmul. Fits with fewer than min_n points or
+    a constant regressor come back NaN.
+    """
+    Y = np.asarray(dependents, dtype=np.float64)
+    X = np.asarray(regressors, dtype=np.float64)
+    wy = np.isfinite(Y)
+    wx = np.isfinite(X)
+    wyf = wy.astype(np.float64)
+    wxf = wx.astype(np.float64)
+    # Shift by the row means so the sums below don't cancel catastrophically
+    with np.errstate(invalid='ignore'):
+        my = np.nanmean(np.where(wy, Y, np.nan), axis=-1, keepdims=True) if Y.size else np.zeros(Y.shape[:-1] + (1,))
+        mx = np.nanmean(np.where(wx, X, np.nan), axis=-1, keepdims=True) if X.size else np.zeros(X.shape[:-1] + (1,))
+    y0 = np.where(wy, Y - np.nan_to_num(my), 0.0)
+    x0 = np.where(wx, X - np.nan_to_num(mx), 0.0)
+
+    n = wyf @ wxf.swapaxes(-1, -2)
+    sx = wyf @ x0.swapaxes(-1, -2)
+    sy = y0 @ wxf.swapaxes(-1, -2)
+    sxx = wyf @ (x0 * x0).swapaxes(-1, -2)
+    syy = (y0 * y0) @ wxf.swapaxes(-1, -2)
+    sxy = y0 @ x0.swapaxes(-1, -2)
+    return ols_from_sums(n, sx, sy, sxx, syy, sxy, np.nan_to_num(mx).swapaxes(-1, -2), np.nan_to_num(my), min_n)
+
+
+def ols_from_sums(n, sx, sy, sxx, syy, sxy, x_shift=0.0, y_shift=0.0, min_n=4):
+    """
+    The ols_matrix fits from pairwise-complete sums: counts, sums, sums of
+    squares and cross-products of the shifted values x - x_shift and
+    y - y_shift. Sums over disjoint row sets add, so fits of a union of
+    sets need no pass over its rows.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cxx = sxx - sx * sx / n
+        cyy = syy - sy * sy / n
+        cxy = sxy - sx * sy / n
+        slope = cxy / cxx
+        x_bar = sx / n + x_shift
+        y_bar = sy / n + y_shift
+        intercept = y_bar - slope * x_bar
+        r2 = np.clip(cxy * cxy / (cxx * cyy), 0.0, 1.0)
+        df = n - 2
+        t_stat = np.sqrt(r2 * df / (1.0 - r2))
+        p_value = 2.0 * stats.t.sf(t_stat, np.maximum(df, 1))
+    p_value = np.where(r2 >= 1.0, 0.0, p_value)
+    # A dependent constant over the pair's rows explains nothing, whatever the rounding in cxy
+    flat = ~(cyy > 1e-12 * syy)
+    r2 = np.where(flat, 0.0, r2)
+    p_value = np.where(flat, 1.0, p_value)
+    bad = (n < max(min_n, 3)) | ~(cxx > 1e-12 * sxx)
+    for a in (slope, intercept, r2, p_value):
+        a[bad] = np.nan
+    r2 = np.where(np.isnan(r2) & ~bad, 0.0, r2)
+    p_value = np.where(np.isnan(p_value) & ~bad, 1.0, p_value)
+    return {'n': n.astype(np.int64), 'slope': slope, 'intercept': intercept, 'r2': r2, 'p_value': p_value}
+
+
+def chunk_frame(set_name, deps, regs, fits, keep, fam):
+    """
+    One set's fits as a RESULT_COLUMNS frame: the (d, r) ols_matrix
+    outputs where keep is set, deps[i] and regs[j] naming the rows and
+    columns, fam mapping column names to families. Also returns the kept
+    dependent and regressor indices.
+    """
+    d_idx, r_idx = np.nonzero(keep)
+    return pd.DataFrame({
+        'set': set_name,
+        'dependent': np.asarray(deps, dtype=object)[d_idx],
+        'regressor': np.asarray(regs, dtype=object)[r_idx],
+        'dep_family': [fam.get(deps[i], 'other') for i in d_idx],
+        'reg_family': [fam.get(regs[j], 'other') for j in r_idx],
+        'n': fits['n'][keep],
+        'slope': fits['slope'][keep],
+        'intercept': fits['intercept'][keep],
+        'r2': fits['r2'][keep],
+        'p_value': fits['p_value'][keep],
+    }), d_idx, r_idx
+
+
+def iter_mine(store, sets=keto_data.SET_NAMES, dependents=None, regressors=None, min_n=4,
+              robust=False, workers=None, block=64):
+    """
+    Yields one DataFrame of results (RESULT_COLUMNS, plus ROBUST_COLUMNS when
+    robust) per (set, dependent block). A regression of a column on itself
+    is skipped.
+    """
+    dependents = list(dependents or all_columns(store.n_visits))
+    regressors = list(regressors or all_columns(store.n_visits))
+    fam = family_of(store.n_visits)
+    pool = ProcessPoolExecutor(max_workers=workers) if robust and workers and workers > 1 else None
+    try:
+        for set_name in sets:
+            view = store.view(set_name)
+            if view.n < min_n:
+                continue
+            X = view.matrix(regressors).astype(np.float64, copy=False)
+            for start in range(0, len(dependents), block):
+                deps = dependents[start:start + block]
+                Y = view.matrix(deps).astype(np.float64, copy=False)
+                with stage('regression fit') as s:
+                    fits = ols_matrix(Y, X, min_n)
+                    keep = np.isfinite(fits['slope'])
+                    keep &= np.asarray(deps, dtype=object)[:, None] != np.asarray(regressors, dtype=object)[None, :]
+                    frame, d_idx, r_idx = chunk_frame(set_name, deps, regressors, fits, keep, fam)
+                    s.items = len(frame)
+                if robust:
+                    with stage('robust fit', len(frame)):
+                        ts = theil_sen_pairs(X, Y, zip(d_idx.tolist(), r_idx.tolist()), pool=pool)
+                    frame['ts_slope'] = ts[:, 0]
+                    frame['ts_intercept'] = ts[:, 1]
+                yield frame
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
+def mine(store, **kwargs):
+    frames = list(iter_mine(store, **kwargs))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=RESULT_COLUMNS)
+
+
+def write_results(chunks, path=DEFAULT_RESULTS):
+    """Streams result chunks into one CSV; returns the number of rows written."""
+    rows = 0
+    with stage('result write') as s:
+        with open(path, 'w', newline='') as f:
+            header = True
+            for chunk in chunks:
+                chunk.to_csv(f, header=header, index=False, float_format='%.10g')
+                header = False
+                rows += len(chunk)
+        s.items = rows
+    return rows
+
+
+def read_results(path=DEFAULT_RESULTS, chunksize=200_000, columns=None):
+    """Streams a result store back as DataFrame chunks."""
+    with open(path, newline='') as f:
+        if not next(csv.reader(f), None):
+            return
+    for chunk in pd.read_csv(path, chunksize=chunksize, usecols=columns):
+        yield chunk
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mine simple regressions over every set.')
+    parser.add_argument('--out', default=DEFAULT_RESULTS)
+    parser.add_argument('--sets', nargs='*', default=list(keto_data.SET_NAMES))
+    parser.add_argument('--families', nargs='*', default=None, help='column families to mine (default: all)')
+    parser.add_argument('--min-n', type=int, default=4)
+    parser.add_argument('--robust', action='store_true', help='also fit Theil-Sen slopes')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--synthetic', type=int, default=0, help='mine a synthetic cohort of this size')
+    parser.add_argument('--float32', action='store_true')
+    args = parser.parse_args()
+
+    dtype = np.float32 if args.float32 else np.float64
+    store = keto_data.synthetic_cohort(args.synthetic, dtype=dtype) if args.synthetic else keto_data.load(dtype=dtype)
+    columns = all_columns(store.n_visits, args.families)
+    chunks = iter_mine(store, sets=args.sets, dependents=columns, regressors=columns, min_n=args.min_n,
+                       robust=args.robust, workers=args.workers)
+    rows = write_results(chunks, args.out)
+    print(f"{rows} regressions written to '{args.out}'")
+
+    if args.robust and rows:
+        results = pd.concat(read_results(args.out), ignore_index=True)
+        results['ts_gap'] = (results['ts_slope'] - results['slope']).abs()
+        significant = results[results['p_value'] < 0.05].sort_values('ts_gap', ascending=False)
+        print('Significant OLS slopes that disagree most with Theil-Sen:')
+        print(significant[['set', 'dependent', 'regressor', 'n', 'slope', 'ts_slope', 'r2', 'p_value']]
+              .head(15).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
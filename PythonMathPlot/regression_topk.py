@@ -0,0 +1,107 @@
+"""
+Streaming top-k of mined regressions per group (by default per set and
+dependent), for the best-regression listings (ListRegressionBasic,
+RankSelector, Analysis/QAngino/BestQangioRegressions.txt).
+
+TopK keeps at most k rows per group while the result store streams past.
+Each chunk is merged with the rows already kept, and one stable sort cuts
+every group back to its best k. That is the bounded per-group heap done as
+a single batched step. Memory is O(k x groups) plus one chunk, and the
+listing is ready after one pass.
+
+Rankings: 'r2' (highest first), 'p_value' (lowest first), 'abs_slope'
+(largest |slope| first). Ties keep stream order. Rows whose score is NaN
+are never kept.
+
+    python regression_topk.py --src fdr_regressions.csv --k 5 --rank p_value --out best_regressions.csv
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import regression_mine
+from stage_profile import stage
+
+RANKINGS = ('r2', 'p_value', 'abs_slope')
+DEFAULT_TOPK = 'best_regressions.csv'
+
+
+def score(chunk, rank):
+    """Larger is better for every ranking."""
+    if rank == 'r2':
+        return chunk['r2'].to_numpy(dtype=np.float64)
+    if rank == 'p_value':
+        return -chunk['p_value'].to_numpy(dtype=np.float64)
+    if rank == 'abs_slope':
+        return np.abs(chunk['slope'].to_numpy(dtype=np.float64))
+    raise ValueError(f'Unknown ranking: {rank}')
+
+
+class TopK:
+    """Best k results per group over a stream of result chunks."""
+
+    def __init__(self, k=10, by=('set', 'dependent'), rank='r2'):
+        self.k = k
+        self.by = list(by)
+        self.rank = rank
+        self.rows_in = 0
+        self._kept = None
+
+    def add(self, chunk):
+        s = score(chunk, self.rank)
+        keep = ~np.isnan(s)
+        chunk = chunk[keep].assign(_score=s[keep], _seq=np.arange(self.rows_in, self.rows_in + len(chunk))[keep])
+        self.rows_in += len(keep)
+        with stage('top-k merge', len(chunk)):
+            merged = chunk if self._kept is None else pd.concat([self._kept, chunk], ignore_index=True)
+            merged = merged.sort_values([*self.by, '_score', '_seq'],
+                                        ascending=[True] * len(self.by) + [False, True], kind='mergesort')
+            self._kept = merged.groupby(self.by, sort=False).head(self.k)
+
+    def __call__(self, chunks):
+        for chunk in chunks:
+            self.add(chunk)
+        return self.result()
+
+    def result(self):
+        """Kept rows, grouped and best first, with a 1-based 'rank' column."""
+        if self._kept is None:
+            return pd.DataFrame(columns=[*regression_mine.RESULT_COLUMNS, 'rank'])
+        frame = self._kept.drop(columns=['_score', '_seq']).reset_index(drop=True)
+        frame['rank'] = frame.groupby(self.by, sort=False).cumcount() + 1
+        return frame
+
+
+def listing(frame):
+    """BestQangioRegressions.txt layout: Index, Regression, sub-phenotype N, Slope, R^2, p-value."""
+    lines = ['Index, Regression,sub-phenotype N,Slope,R^2,p-value']
+    for i, row in enumerate(frame.itertuples(index=False)):
+        lines.append(f'{i},{row.dependent} vs. {row.regressor},{row.set} {row.n},'
+                     f'{row.slope:.4f},{row.r2:.3f},{row.p_value:.6f}')
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Best k mined regressions per group, in one pass.')
+    parser.add_argument('--src', default=regression_mine.DEFAULT_RESULTS)
+    parser.add_argument('--out', default=DEFAULT_TOPK)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--by', nargs='*', default=['set', 'dependent'])
+    parser.add_argument('--rank', default='r2', choices=RANKINGS)
+    parser.add_argument('--chunksize', type=int, default=200_000)
+    parser.add_argument('--show', default=None, help='print the listing of one set')
+    args = parser.parse_args()
+
+    top = TopK(args.k, args.by, args.rank)
+    best = top(regression_mine.read_results(args.src, args.chunksize))
+    best.to_csv(args.out, index=False, float_format='%.10g')
+    print(f"{len(best)} of {top.rows_in} regressions kept ({args.k} per {', '.join(args.by)}) in '{args.out}'")
+    if args.show:
+        shown = best[best['set'] == args.show]
+        shown = shown.iloc[np.argsort(-score(shown, args.rank), kind='stable')]
+        print('\n'.join(listing(shown)))
+
+
+if __name__ == '__main__':
+    main()
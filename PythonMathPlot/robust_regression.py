@@ -0,0 +1,233 @@
+"""
+Robust simple regression: Theil-Sen slopes by O(n log n) slope selection.
+
+The Theil-Sen slope is the median of the n(n-1)/2 pairwise slopes. Rather
+than forming them all, SlopeSelector finds the k-th smallest slope by
+randomized interval contraction (Matousek 1991; Dillencourt, Mount and
+Netanyahu 1992):
+
+  * the number of slopes <= t equals the number of inversions of
+    u = y - t*x taken in x order, counted with a vectorized bottom-up merge
+    sort in O(n log n);
+  * a random sample of pairwise slopes brackets the target rank, and the
+    bracket is tightened until it holds O(n) slopes;
+  * those slopes are enumerated straight from the merge passes and the
+    answer is picked from them.
+
+Pairs with equal x have no slope and are ignored, as in the usual estimator.
+The inversion count runs as a compiled merge sort when numba is installed
+(jit_kernels.count_inversions).
+"""
+import numpy as np
+
+import jit_kernels
+
+
+def _dense_ranks(u, x):
+    """Ranks of (u, -x) lexicographically; identical points share a rank."""
+    order = np.lexsort((-x, u))
+    u_sorted, x_sorted = u[order], x[order]
+    change = np.ones(len(u), dtype=np.int64)
+    change[1:] = (u_sorted[1:] != u_sorted[:-1]) | (x_sorted[1:] != x_sorted[:-1])
+    ranks = np.empty(len(u), dtype=np.int64)
+    ranks[order] = np.cumsum(change) - 1
+    return ranks
+
+
+def _ranges(starts, lengths):
+    """Concatenation of arange(s, s + l) for every (s, l)."""
+    total = int(lengths.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(total)
+
+
+def strict_inversions(keys, emit=False):
+    """
+    Number of pairs a < b with keys[b] < keys[a], by bottom-up merge sort
+    (log2(n) vectorized passes). With emit=True also returns the pairs as two
+    index arrays (earlier position, later position).
+    """
+    n = len(keys)
+    if n < 2:
+        empty = np.zeros(0, dtype=np.int64)
+        return (0, empty, empty) if emit else 0
+    size = 1 << (n - 1).bit_length()
+    top = int(keys.max()) + 1
+    # Padding is larger than every key and increasing, so it adds no inversions
+    vals = np.concatenate([keys.astype(np.int64), top + np.arange(size - n, dtype=np.int64)])
+    idx = np.arange(size, dtype=np.int64)
+    pos = np.arange(size, dtype=np.int64)
+    span = 2 * (top + size)
+    total = 0
+    firsts, seconds = [], []
+    width = 1
+    while width < size:
+        block = pos // (2 * width)
+        is_right = (pos % (2 * width)) >= width
+        # Equal keys: left element first, so only strictly larger lefts follow a right one
+        order = np.argsort(block * span + vals * 2 + is_right, kind='stable')
+        merged_left = (~is_right[order]).astype(np.int64)
+        lefts_before = np.cumsum(merged_left) - merged_left
+        lefts_before -= np.repeat(lefts_before[::2 * width], 2 * width)
+        right_at = merged_left == 0
+        counts = width - lefts_before[right_at]
+        total += int(counts.sum())
+        if emit and counts.any():
+            merged_idx = idx[order]
+            left_idx = merged_idx[merged_left == 1]  # width lefts per block, in merged order
+            right_block = (np.flatnonzero(right_at) // (2 * width)).astype(np.int64)
+            starts = right_block * width + (width - counts)
+            firsts.append(left_idx[_ranges(starts, counts)])
+            seconds.append(np.repeat(merged_idx[right_at], counts))
+        vals = vals[order]
+        idx = idx[order]
+        width *= 2
+    if not emit:
+        return total
+    if firsts:
+        return total, np.concatenate(firsts), np.concatenate(seconds)
+    empty = np.zeros(0, dtype=np.int64)
+    return total, empty, empty
+
+
+class SlopeSelector:
+    """Order statistics of the pairwise slopes of one (x, y) sample."""
+
+    def __init__(self, x, y, seed=0):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        order = np.lexsort((y, x))
+        self.x, self.y = x[order], y[order]
+        self.n = len(x)
+        _, tie_sizes = np.unique(self.x, return_counts=True)
+        self.total = self.n * (self.n - 1) // 2 - int((tie_sizes * (tie_sizes - 1) // 2).sum())
+        self.rng = np.random.default_rng(seed)
+
+    def count_le(self, t):
+        """Number of pairwise slopes <= t."""
+        u = self.y - t * self.x
+        keys = _dense_ranks(u, self.x)
+        return int(jit_kernels.count_inversions(keys)) if jit_kernels.use_loops() else strict_inversions(keys)
+
+    def slopes_between(self, lo, hi):
+        """All pairwise slopes in (lo, hi], unsorted."""
+        x, y = self.x, self.y
+        if np.isneginf(lo):
+            pi = np.arange(self.n)
+        else:
+            pi = np.lexsort((-x, y - lo * x))
+        keys = _dense_ranks(y - hi * x, x) if np.isfinite(hi) else _dense_ranks(-x, x)
+        _, a, b = strict_inversions(keys[pi], emit=True)
+        i, j = pi[a], pi[b]
+        return (y[j] - y[i]) / (x[j] - x[i])
+
+    def _sample(self, m):
+        i = self.rng.integers(0, self.n, m)
+        j = self.rng.integers(0, self.n, m)
+        keep = self.x[i] != self.x[j]
+        i, j = i[keep], j[keep]
+        return (self.y[j] - self.y[i]) / (self.x[j] - self.x[i])
+
+    def select(self, k, budget=None):
+        """k-th smallest pairwise slope (0-based)."""
+        return self.select_range(k, k, budget)[0]
+
+    def select_range(self, k1, k2, budget=None):
+        """The k1-th through k2-th smallest pairwise slopes (0-based), from one bracket."""
+        if not 0 <= k1 <= k2 < self.total:
+            raise IndexError(f'slope ranks {k1}..{k2} out of range for {self.total} slopes')
+        budget = budget or max(4 * self.n, 256) + (k2 - k1)
+        lo, hi, c_lo, c_hi = -np.inf, np.inf, 0, self.total
+        for _ in range(64):
+            if c_hi - c_lo <= budget:
+                break
+            sample = self._sample(max(4 * self.n, 64))
+            sample = np.sort(sample[(sample > lo) & (sample <= hi)])
+            if len(sample) < 8:
+                break
+            spread = 1.5 / np.sqrt(len(sample))
+            quantiles = [(k1 - c_lo + 0.5) / (c_hi - c_lo) - spread, (k2 - c_lo + 0.5) / (c_hi - c_lo) + spread]
+            for q in quantiles:
+                t = sample[int(np.clip(np.floor(q * len(sample)), 0, len(sample) - 1))]
+                if not lo < t < hi:
+                    continue
+                c = self.count_le(t)
+                if c <= k1:
+                    lo, c_lo = t, c
+                elif c >= k2 + 1:
+                    hi, c_hi = t, c
+        between = np.sort(self.slopes_between(lo, hi))
+        # Clip guards against rounding disagreements between counting and enumeration
+        picks = np.clip(np.arange(k1, k2 + 1) - c_lo, 0, len(between) - 1)
+        return [float(v) for v in between[picks]]
+
+    def median(self):
+        if self.total == 0:
+            return np.nan
+        return float(np.mean(self.select_range((self.total - 1) // 2, self.total // 2)))
+
+
+def theil_sen(x, y, seed=0, naive_below=64):
+    """
+    Theil-Sen slope and Sen intercept (median of y - slope * x); NaN rows
+    dropped. Below naive_below points the direct O(n^2) median is cheaper
+    than selection and gives the same answer.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    keep = np.isfinite(x) & np.isfinite(y)
+    x, y = x[keep], y[keep]
+    if len(x) < 2:
+        return np.nan, np.nan
+    if len(x) < naive_below:
+        return theil_sen_naive(x, y)
+    slope = SlopeSelector(x, y, seed).median()
+    if np.isnan(slope):
+        return np.nan, np.nan
+    return slope, float(np.median(y - slope * x))
+
+
+def theil_sen_naive(x, y):
+    """O(n^2) reference implementation, for checking and tiny samples."""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    keep = np.isfinite(x) & np.isfinite(y)
+    x, y = x[keep], y[keep]
+    i, j = np.triu_indices(len(x), 1)
+    ok = x[i] != x[j]
+    if not ok.any():
+        return np.nan, np.nan
+    slope = float(np.median((y[j] - y[i])[ok] / (x[j] - x[i])[ok]))
+    return slope, float(np.median(y - slope * x))
+
+
+def _fit_block(args):
+    regressors, dependents, pairs = args
+    return [theil_sen(regressors[r], dependents[d]) for d, r in pairs]
+
+
+def _block_args(regressors, dependents, block):
+    """Only the rows a batch needs are shipped to the worker."""
+    d_rows, d_local = np.unique([d for d, _ in block], return_inverse=True)
+    r_rows, r_local = np.unique([r for _, r in block], return_inverse=True)
+    return regressors[r_rows], dependents[d_rows], list(zip(d_local.tolist(), r_local.tolist()))
+
+
+def theil_sen_pairs(regressors, dependents, pairs, pool=None, batch=256):
+    """
+    Theil-Sen fits for many (dependent row, regressor row) pairs of two
+    column matrices, in batches of `batch` pairs. With a process pool the
+    batches run in parallel, each shipping only the rows it needs.
+    Returns an (len(pairs), 2) array of slope, intercept.
+    """
+    pairs = list(pairs)
+    if not pairs:
+        return np.zeros((0, 2))
+    batches = [pairs[i:i + batch] for i in range(0, len(pairs), batch)]
+    if pool is None or len(batches) == 1:
+        results = [_fit_block((regressors, dependents, b)) for b in batches]
+    else:
+        results = list(pool.map(_fit_block, [_block_args(regressors, dependents, b) for b in batches]))
+    return np.array([fit for block in results for fit in block], dtype=np.float64).reshape(-1, 2)
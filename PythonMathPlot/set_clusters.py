@@ -0,0 +1,292 @@
+"""
+Unsupervised check of the README's set boundaries: mini-batch k-means and
+a diagonal-covariance Gaussian mixture on chosen columns, scored against
+the rule-based sets with the adjusted Rand index (ARI).
+
+The columns default to the axes of CACvsNCPV3dPlot.py (LnCac0 / LnNcpv0,
+LnCac0 / LnNcpv1, LnCac1) and are standardized with a streamed mean and
+variance. Participants with a non-finite feature are left unclustered
+(label -1). Everything streams through row batches, so multi-million-row
+synthetic cohorts never need more than a batch of features at once:
+
+- mini-batch k-means (Sculley, 2010): k-means++ seeding on a sample, then
+  random batches that pull each centre towards its batch mean with a
+  per-centre learning rate of 1 / (points seen so far);
+- the Gaussian mixture starts from the k-means centres and runs exact EM.
+  Each iteration is one pass over the batches that accumulates the
+  responsibilities' sums of 1, x and x^2, with the squared distances
+  expanded into matmuls;
+- a final pass labels every participant, and the contingency tables
+  against the leaf sets (Gamma, Theta, Eta, Zeta) and the coarser splits
+  (Gamma / Beta / Zeta, Alpha / Zeta) give each partition's ARI.
+
+    python set_clusters.py --k 4
+    python set_clusters.py --columns LnDNcpv LnDCac LnCac0 --k 3 --synthetic 5000000 --out set_clusters.csv
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import keto_data
+from stage_profile import stage
+
+DEFAULT_COLUMNS = ('LnCac0 / LnNcpv0', 'LnCac0 / LnNcpv1', 'LnCac1')
+# Rule-based partitions: leaf set -> part
+PARTITIONS = {
+    'leaf': {'Gamma': 0, 'Theta': 1, 'Eta': 2, 'Zeta': 3},
+    'gamma_beta_zeta': {'Gamma': 0, 'Theta': 1, 'Eta': 1, 'Zeta': 2},
+    'alpha_zeta': {'Gamma': 0, 'Theta': 0, 'Eta': 0, 'Zeta': 1},
+}
+# Smallest GMM variance in standardized units. A component on a point mass
+# (all of Gamma's zero CAC) would otherwise shrink without bound, and its
+# density would make the log-likelihood and BIC meaningless.
+VAR_FLOOR = 1e-3
+
+
+def rule_labels(store, partition='leaf'):
+    """Each participant's part of a rule-based partition (store order)."""
+    lookup = np.full(max(keto_data.LEAF_SETS.values()) + 1, -1, dtype=np.int64)
+    for leaf, part in PARTITIONS[partition].items():
+        lookup[keto_data.LEAF_SETS[leaf]] = part
+    return lookup[store.leaf]
+
+
+def adjusted_rand(a, b):
+    """Adjusted Rand index of two labelings; entries < 0 in either are left out."""
+    keep = (a >= 0) & (b >= 0)
+    a, b = a[keep], b[keep]
+    n = len(a)
+    if n < 2:
+        return np.nan
+    kb = int(b.max()) + 1
+    table = np.bincount(a * kb + b, minlength=(int(a.max()) + 1) * kb).reshape(-1, kb).astype(np.float64)
+
+    def pairs(c):
+        return c * (c - 1) / 2
+
+    index = pairs(table).sum()
+    rows, cols = pairs(table.sum(axis=1)).sum(), pairs(table.sum(axis=0)).sum()
+    expected = rows * cols / pairs(n)
+    best = (rows + cols) / 2
+    return 1.0 if best == expected else (index - expected) / (best - expected)
+
+
+class Features:
+    """Standardized feature rows of a ColumnStore, read a batch of participants at a time."""
+
+    def __init__(self, store, columns, batch=65_536):
+        self.store = store
+        self.columns = list(columns)
+        self.batch = batch
+        self.n = store.n
+        # Streamed (Chan) mean and variance over the finite rows
+        count, mean, m2 = 0, np.zeros(len(self.columns)), np.zeros(len(self.columns))
+        with stage('feature moments', self.n):
+            for rows in self.slices():
+                X, _ = self.raw(rows)
+                if not len(X):
+                    continue
+                nb, mb = len(X), X.mean(axis=0)
+                delta = mb - mean
+                m2 += ((X - mb) ** 2).sum(axis=0) + delta ** 2 * count * nb / (count + nb)
+                mean += delta * nb / (count + nb)
+                count += nb
+        self.count = count
+        self.mean = mean
+        self.scale = np.sqrt(m2 / max(count - 1, 1))
+        self.scale[self.scale == 0] = 1.0
+
+    def slices(self):
+        for start in range(0, self.n, self.batch):
+            yield slice(start, min(start + self.batch, self.n))
+
+    def raw(self, rows):
+        """Finite feature rows (in the columns' units) and the mask of which rows they are."""
+        X = self.store.matrix(self.columns, rows).astype(np.float64, copy=False).T
+        finite = np.isfinite(X).all(axis=1)
+        return X[finite], finite
+
+    def block(self, rows):
+        X, finite = self.raw(rows)
+        return (X - self.mean) / self.scale, finite
+
+    def sample(self, rng, size):
+        """Standardized finite rows of a random sample of about size participants."""
+        rows = np.sort(rng.choice(self.n, size=min(size, self.n), replace=False))
+        return self.block(rows)[0]
+
+    def unscale(self, centres):
+        return centres * self.scale + self.mean
+
+
+def _sq_dist(X, C):
+    return np.maximum((X * X).sum(axis=1)[:, None] - 2 * X @ C.T + (C * C).sum(axis=1)[None, :], 0)
+
+
+def kmeans_pp(X, k, rng):
+    """k-means++ seeding: each next centre drawn with probability proportional to its squared distance."""
+    centres = [X[rng.integers(len(X))]]
+    d2 = _sq_dist(X, centres[0][None])[:, 0]
+    for _ in range(1, k):
+        total = d2.sum()
+        pick = rng.choice(len(X), p=d2 / total) if total > 0 else rng.integers(len(X))
+        centres.append(X[pick])
+        d2 = np.minimum(d2, _sq_dist(X, X[pick][None])[:, 0])
+    return np.array(centres)
+
+
+def minibatch_kmeans(features, k, batch=4096, max_iter=500, tol=1e-4, seed=0, patience=20):
+    """Centres (k, d), in standardized units, of mini-batch k-means over random batches."""
+    rng = np.random.default_rng(seed)
+    with stage('kmeans init', k):
+        centres = kmeans_pp(features.sample(rng, max(20 * k * batch // 100, 10_000)), k, rng)
+    seen = np.zeros(k)
+    calm = 0
+    with stage('kmeans batches') as s:
+        for step in range(max_iter):
+            X = features.sample(rng, batch)
+            label = _sq_dist(X, centres).argmin(axis=1)
+            counts = np.bincount(label, minlength=k).astype(np.float64)
+            sums = np.zeros_like(centres)
+            np.add.at(sums, label, X)
+            seen += counts
+            hit = counts > 0
+            rate = np.where(hit, counts / np.maximum(seen, 1), 0)[:, None]
+            new = centres + rate * (np.where(hit[:, None], sums / np.maximum(counts, 1)[:, None], centres) - centres)
+            shift = np.abs(new - centres).max()
+            centres = new
+            calm = calm + 1 if shift < tol else 0
+            if calm >= patience:
+                break
+        s.items = (step + 1) * batch
+    return centres
+
+
+def _log_gauss(X, means, var):
+    """(b, k) log densities of diagonal Gaussians, the squared terms as matmuls."""
+    inv = 1.0 / var
+    quad = (X * X) @ inv.T - 2 * X @ (means * inv).T + (means * means * inv).sum(axis=1)[None, :]
+    return -0.5 * (quad + np.log(2 * np.pi * var).sum(axis=1)[None, :])
+
+
+def _log_resp(X, weights, means, var):
+    log_p = _log_gauss(X, means, var) + np.log(weights)[None, :]
+    top = log_p.max(axis=1, keepdims=True)
+    norm = top[:, 0] + np.log(np.exp(log_p - top).sum(axis=1))
+    return log_p - norm[:, None], norm
+
+
+def diag_gmm(features, centres, max_iter=100, tol=1e-6, var_floor=VAR_FLOOR):
+    """
+    EM for a diagonal Gaussian mixture started at centres, one streamed pass
+    per iteration. Returns weights, means, variances (standardized units)
+    and the mean log-likelihood per participant of every iteration; the
+    last one is that of the returned parameters.
+    """
+    k, d = centres.shape
+    weights, means, var = np.full(k, 1.0 / k), centres.copy(), np.ones((k, d))
+    history = []
+    for it in range(max_iter):
+        nk, sx, sxx, ll, n = np.zeros(k), np.zeros((k, d)), np.zeros((k, d)), 0.0, 0
+        with stage('gmm em pass', features.n):
+            for rows in features.slices():
+                X, _ = features.block(rows)
+                if not len(X):
+                    continue
+                log_r, norm = _log_resp(X, weights, means, var)
+                r = np.exp(log_r)
+                nk += r.sum(axis=0)
+                sx += r.T @ X
+                sxx += r.T @ (X * X)
+                ll += norm.sum()
+                n += len(X)
+        history.append(ll / max(n, 1))
+        if it == max_iter - 1 or len(history) > 1 and abs(history[-1] - history[-2]) < tol * max(abs(history[-2]), 1):
+            break
+        nk = np.maximum(nk, 1e-12)
+        weights = nk / nk.sum()
+        means = sx / nk[:, None]
+        var = np.maximum(sxx / nk[:, None] - means ** 2, var_floor)
+    return weights, means, var, history
+
+
+def collapsed(var, var_floor=VAR_FLOOR):
+    """Components whose variance sits at the floor in some column: fitted to (nearly) a single point."""
+    return np.flatnonzero((var <= var_floor * (1 + 1e-9)).any(axis=1))
+
+
+def assign(features, centres=None, gmm=None):
+    """Every participant's k-means (nearest centre) or mixture (most responsible component) label; -1 if unfit."""
+    labels = np.full(features.n, -1, dtype=np.int64)
+    with stage('cluster labels', features.n):
+        for rows in features.slices():
+            X, finite = features.block(rows)
+            if not len(X):
+                continue
+            if gmm is not None:
+                score = _log_resp(X, *gmm)[0]
+                best = score.argmax(axis=1)
+            else:
+                best = _sq_dist(X, centres).argmin(axis=1)
+            part = labels[rows]
+            part[finite] = best
+            labels[rows] = part
+    return labels
+
+
+def agreement(store, labels):
+    """ARI of labels against every rule-based partition."""
+    return {name: adjusted_rand(labels, rule_labels(store, name)) for name in PARTITIONS}
+
+
+def contingency(store, labels):
+    """Participants per (cluster, leaf set)."""
+    leaf = pd.Categorical(pd.Series(store.leaf).map({v: k for k, v in keto_data.LEAF_SETS.items()}),
+                          categories=keto_data.LEAF_ORDER)
+    keep = labels >= 0
+    return pd.crosstab(pd.Series(labels[keep], name='cluster'), pd.Series(leaf[keep], name='leaf'), dropna=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mini-batch k-means and a diagonal GMM against the rule-based sets.')
+    parser.add_argument('--columns', nargs='*', default=list(DEFAULT_COLUMNS))
+    parser.add_argument('--k', type=int, default=4)
+    parser.add_argument('--batch', type=int, default=4096, help='k-means mini-batch size')
+    parser.add_argument('--stream-batch', type=int, default=65_536, help='participants per streamed pass batch')
+    parser.add_argument('--max-iter', type=int, default=500, help='k-means mini-batches')
+    parser.add_argument('--em-iter', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default=None, help='write per-participant labels')
+    parser.add_argument('--synthetic', type=int, default=0)
+    args = parser.parse_args()
+
+    store = keto_data.synthetic_cohort(args.synthetic) if args.synthetic else keto_data.load()
+    features = Features(store, args.columns, args.stream_batch)
+    print(f'{features.count} of {store.n} participants have every feature: {", ".join(args.columns)}')
+    centres = minibatch_kmeans(features, args.k, args.batch, args.max_iter, seed=args.seed)
+    kmeans = assign(features, centres)
+    weights, means, var, history = diag_gmm(features, centres, args.em_iter)
+    gmm = assign(features, gmm=(weights, means, var))
+    n_params = args.k * 2 * len(args.columns) + args.k - 1
+    bic = -2 * history[-1] * features.count + n_params * np.log(features.count)
+
+    with pd.option_context('display.width', 200, 'display.float_format', '{:.4g}'.format):
+        for name, labels, model in (('Mini-batch k-means', kmeans, centres), ('Diagonal GMM', gmm, means)):
+            print(f'\n{name} (k={args.k}): ARI ' +
+                  ', '.join(f'{part} {ari:.3f}' for part, ari in agreement(store, labels).items()))
+            print(pd.DataFrame(features.unscale(model), columns=args.columns).rename_axis('cluster').to_string())
+            print(contingency(store, labels).to_string())
+    print(f'\nGMM: {len(history)} EM passes, mean log-likelihood {history[-1]:.4f} (standardized), '
+          f'BIC {bic:.1f}, weights {np.round(weights, 3).tolist()}')
+    flat = collapsed(var)
+    if len(flat):
+        print(f'Components {flat.tolist()} collapsed onto a point (variance at the {VAR_FLOOR:g} floor): '
+              'their density, and so the log-likelihood and BIC, depend on the floor')
+    if args.out:
+        pd.DataFrame({'Id': store.ids, 'leaf': store.leaf, 'kmeans': kmeans, 'gmm': gmm}).to_csv(args.out, index=False)
+        print(f"Labels written to '{args.out}'")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+"""
+Set-comparison matrix: Welch t-tests and Mann-Whitney U tests of every
+mined column across every pair of disjoint sets (Zeta vs Gamma, Theta vs
+Eta, Beta vs Zeta, ...), the systematic check of the README's claim that
+the sub-phenotypes differ in NCPV, CAC and their deltas.
+
+Every set is a union of the four leaf sets, and counts, sums and U
+statistics of disjoint samples add up, so nothing is computed per set pair
+that can be computed per leaf:
+
+  * each leaf's non-NaN count, mean and sum of squares of every column come
+    from one reduction over its contiguous slice; a set's moments combine
+    its leaves' (Chan's update), and every pair's Welch t,
+    Welch-Satterthwaite df and Hedges' g are then array arithmetic;
+  * columns are ranked once over all participants (one sort per column
+    block), and one cumulative count per leaf along that order gives the
+    U statistic of every leaf against every other. A pair's U is the sum
+    of its leaf pairs' U; only runs of tied values are kept per leaf, for
+    the tie correction.
+
+Mann-Whitney p-values are the normal approximation with tie and continuity
+correction (scipy's method='asymptotic'). Pairs of sets that share
+participants (Omega vs Zeta, ...) are not compared.
+
+    python set_compare.py --sets Zeta Gamma Theta Eta --out set_comparisons.csv
+    python set_compare.py --synthetic 1000000 --families visit delta
+"""
+import argparse
+import itertools
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+import keto_data
+import regression_mine
+from stage_profile import stage
+
+DEFAULT_COMPARISONS = 'set_comparisons.csv'
+COMPARISON_COLUMNS = ('column', 'set_a', 'set_b', 'n_a', 'n_b', 'mean_a', 'mean_b', 'hedges_g',
+                      'welch_t', 'welch_df', 'welch_p', 'mw_u', 'rank_biserial', 'mw_p')
+LEAVES = keto_data.LEAF_ORDER
+# The README's headline variables
+HEADLINE_COLUMNS = ('Ncpv0', 'Ncpv1', 'Cac0', 'Cac1', 'DNcpv', 'DCac', 'LnDNcpv', 'LnDCac')
+
+
+def disjoint_pairs(sets):
+    """Pairs of the given sets that share no participants."""
+    return [(a, b) for a, b in itertools.combinations(sets, 2)
+            if not set(keto_data.SET_LEAVES[a]) & set(keto_data.SET_LEAVES[b])]
+
+
+def leaf_moments(block, store):
+    """Per-leaf non-NaN count, mean and sum of squared deviations, each (columns x leaves)."""
+    parts = []
+    for leaf in LEAVES:
+        rows = block[:, store.set_slice(leaf)]
+        n = (~np.isnan(rows)).sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.nansum(rows, axis=1) / n
+        m2 = np.nansum((rows - mean[:, None]) ** 2, axis=1)
+        parts.append((n, np.nan_to_num(mean), m2))
+    return tuple(np.stack(p, axis=1) for p in zip(*parts))
+
+
+def set_moments(leaf_mom, leaves):
+    """Count, mean and sample variance of a union of leaves from their moments."""
+    n, mean, m2 = (m[:, leaves] for m in leaf_mom)
+    total = n.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        combined = (n * mean).sum(axis=1) / total
+        ss = (m2 + n * (mean - combined[:, None]) ** 2).sum(axis=1)
+        return total, combined, ss / (total - 1)
+
+
+def welch(a, b):
+    """Welch t, df, two-sided p and Hedges' g from two (n, mean, var) moment triples."""
+    (na, ma, va), (nb, mb, vb) = a, b
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sa, sb = va / na, vb / nb
+        t = (ma - mb) / np.sqrt(sa + sb)
+        df = (sa + sb) ** 2 / (sa ** 2 / (na - 1) + sb ** 2 / (nb - 1))
+        pooled = np.sqrt(((na - 1) * va + (nb - 1) * vb) / (na + nb - 2))
+        g = (ma - mb) / pooled * (1 - 3 / (4 * (na + nb) - 9))
+    return t, df, 2 * stats.t.sf(np.abs(t), df), g
+
+
+class LeafRanks:
+    """
+    Rank statistics of a (columns x participants) block by leaf: u[c, i, j]
+    is the U statistic of leaf i against leaf j in column c, n[c, i] the
+    leaf's non-NaN count, and tie_counts the per-leaf counts of every run
+    of tied values (tie_column gives each run's column).
+    """
+
+    def __init__(self, block, leaf):
+        n_columns, n = block.shape
+        code = np.zeros(max(keto_data.LEAF_SETS.values()) + 1, dtype=np.int64)
+        code[[keto_data.LEAF_SETS[name] for name in LEAVES]] = np.arange(len(LEAVES))
+        with stage('column ranks', block.size):
+            order = np.argsort(block, axis=1, kind='stable')
+            ordered = np.take_along_axis(block, order, axis=1)
+            leaf_ordered = code[leaf][order]
+            valid = ~np.isnan(ordered)
+            # Runs of equal values (NaNs sort last and each is a run of its own)
+            first = np.ones_like(valid)
+            first[:, 1:] = ordered[:, 1:] != ordered[:, :-1]
+            last = np.ones_like(valid)
+            last[:, :-1] = first[:, 1:]
+            pos = np.arange(n)
+            run_start = np.maximum.accumulate(np.where(first, pos, 0), axis=1)
+            run_end = n - 1 - np.maximum.accumulate(np.where(last, pos[::-1], 0)[:, ::-1], axis=1)[:, ::-1]
+            run_end = np.where(last, pos, run_end)
+
+        k = len(LEAVES)
+        rows = np.arange(n_columns)[:, None] * k + leaf_ordered
+        self.n = np.bincount(rows[valid], minlength=n_columns * k).reshape(n_columns, k)
+        self.u = np.zeros((n_columns, k, k))
+        with stage('leaf U statistics', k * block.size):
+            for j in range(k):
+                ind = (leaf_ordered == j) & valid
+                upto = np.cumsum(ind, axis=1, dtype=np.int64)
+                below = np.take_along_axis(upto - ind, run_start, axis=1)
+                tied = np.take_along_axis(upto, run_end, axis=1) - below
+                score = below + 0.5 * tied
+                self.u[:, :, j] = np.bincount(rows[valid], weights=score[valid],
+                                              minlength=n_columns * k).reshape(n_columns, k)
+
+        in_tie = valid & (run_end > run_start)
+        run_id = np.cumsum(first, axis=None).reshape(first.shape)[in_tie]
+        new_run = np.ones(len(run_id), dtype=bool)
+        new_run[1:] = run_id[1:] != run_id[:-1]
+        compact = np.cumsum(new_run) - 1
+        self.tie_column = np.nonzero(in_tie)[0][new_run]
+        self.tie_counts = np.bincount(compact * k + leaf_ordered[in_tie],
+                                      minlength=len(self.tie_column) * k).reshape(-1, k)
+        self.n_columns = n_columns
+
+    def mann_whitney(self, a, b):
+        """U of leaves a against leaves b (per column), rank-biserial correlation and asymptotic two-sided p."""
+        u = self.u[:, a][:, :, b].sum(axis=(1, 2))
+        na, nb = self.n[:, a].sum(axis=1), self.n[:, b].sum(axis=1)
+        t = self.tie_counts[:, a + b].sum(axis=1).astype(np.float64)
+        ties = np.bincount(self.tie_column, weights=t ** 3 - t, minlength=self.n_columns)
+        N = na + nb
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mu = na * nb / 2
+            sigma = np.sqrt(na * nb / 12 * ((N + 1) - ties / (N * (N - 1))))
+            z = (np.maximum(u, na * nb - u) - mu - 0.5) / sigma
+            p = np.minimum(2 * stats.norm.sf(z), 1.0)
+            r = 2 * u / (na * nb) - 1
+        return u, r, p
+
+
+def compare(store, columns=None, sets=keto_data.SET_NAMES, block=16):
+    """
+    Every column across every disjoint pair of sets, one row per
+    (column, pair) with COMPARISON_COLUMNS.
+    """
+    columns = list(columns or regression_mine.all_columns(store.n_visits))
+    pairs = disjoint_pairs([s for s in sets if store.view(s).n])
+    leaves = {name: [LEAVES.index(x) for x in keto_data.SET_LEAVES[name]] for name in sets}
+    frames = []
+    for start in range(0, len(columns), block):
+        names = columns[start:start + block]
+        data = store.matrix(names).astype(np.float64, copy=False)
+        with stage('leaf moments', data.size):
+            leaf_mom = leaf_moments(data, store)
+        ranks = LeafRanks(data, store.leaf)
+        with stage('pair tests', len(pairs) * len(names)):
+            mom = {s: set_moments(leaf_mom, leaves[s]) for s in {s for pair in pairs for s in pair}}
+            for a, b in pairs:
+                t, df, p, g = welch(mom[a], mom[b])
+                u, r, mw_p = ranks.mann_whitney(leaves[a], leaves[b])
+                frames.append(pd.DataFrame({
+                    'column': names, 'set_a': a, 'set_b': b, 'n_a': mom[a][0], 'n_b': mom[b][0],
+                    'mean_a': mom[a][1], 'mean_b': mom[b][1], 'hedges_g': g,
+                    'welch_t': t, 'welch_df': df, 'welch_p': p, 'mw_u': u, 'rank_biserial': r, 'mw_p': mw_p,
+                }))
+    if not frames:
+        return pd.DataFrame(columns=COMPARISON_COLUMNS)
+    frame = pd.concat(frames, ignore_index=True)
+    order = {c: i for i, c in enumerate(columns)}
+    return frame.sort_values('column', key=lambda c: c.map(order), kind='stable').reset_index(drop=True)
+
+
+def matrix(frame, stat='mw_p'):
+    """One statistic as a (column x 'A vs B') table."""
+    wide = frame.assign(pair=frame['set_a'] + ' vs ' + frame['set_b'])
+    wide = wide.pivot(index='column', columns='pair', values=stat)
+    pairs = list(dict.fromkeys(frame['set_a'] + ' vs ' + frame['set_b']))
+    return wide.reindex(index=list(dict.fromkeys(frame['column'])), columns=pairs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Welch and Mann-Whitney tests of every column across set pairs.')
+    parser.add_argument('--out', default=DEFAULT_COMPARISONS)
+    parser.add_argument('--sets', nargs='*', default=list(keto_data.SET_NAMES))
+    parser.add_argument('--families', nargs='*', default=None)
+    parser.add_argument('--block', type=int, default=16, help='columns ranked per pass')
+    parser.add_argument('--stat', default='mw_p', choices=COMPARISON_COLUMNS[7:])
+    parser.add_argument('--show', nargs='*', default=list(HEADLINE_COLUMNS), help='columns to print')
+    parser.add_argument('--alpha', type=float, default=0.05)
+    parser.add_argument('--synthetic', type=int, default=0)
+    args = parser.parse_args()
+
+    store = keto_data.synthetic_cohort(args.synthetic) if args.synthetic else keto_data.load()
+    columns = regression_mine.all_columns(store.n_visits, args.families)
+    frame = compare(store, columns, args.sets, args.block)
+    frame.to_csv(args.out, index=False, float_format='%.10g')
+    table = matrix(frame, args.stat)
+    shown = [c for c in args.show if c in table.index]
+    if shown:
+        with pd.option_context('display.width', 200, 'display.max_columns', None):
+            print(f'{args.stat}:')
+            print(table.loc[shown].to_string(float_format=lambda v: f'{v:.3g}'))
+    significant = (frame[['welch_p', 'mw_p']] <= args.alpha).sum()
+    print(f"\n{len(frame)} comparisons ({frame['column'].nunique()} columns x "
+          f"{len(frame) // max(frame['column'].nunique(), 1)} set pairs) written to '{args.out}'; "
+          f"p <= {args.alpha}: {significant['welch_p']} (Welch), {significant['mw_p']} (Mann-Whitney)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+"""
+One-pass rollup of per-set statistics up the README set hierarchy.
+
+GoldMiner keeps one array per set (Omega, Alpha, Beta, Zeta, Gamma, Theta,
+Eta, BetaUZeta) and mines each separately, so every participant is read
+once per set it belongs to, four times for an Eta participant. Here the
+data is scanned once, leaf set by leaf set (Gamma, Theta, Eta, Zeta), and
+every leaf keeps only additive statistics of the chosen columns:
+
+- pairwise-complete counts, sums, sums of squares and cross-products
+  (d x d each), the inputs of regression_mine.ols_from_sums;
+- per-column minimum and maximum;
+- a sparse histogram per column on a fixed fine grid.
+
+The inner sets are merged from their children, following the README:
+
+    Theta + Eta -> Beta,  Beta + Zeta -> BetaUZeta,
+    Beta + Gamma -> Alpha,  Alpha + Zeta -> Omega
+
+Merging adds the statistics, so every set's regressions, summaries and
+histograms come from that single scan. Values are shifted by one fixed
+offset per column, so the sums do not cancel catastrophically and still
+add across sets. The offsets and the histogram grid (1/16 of a standard
+deviation wide) come from an evenly spaced sample of 4096 participants.
+The regressions match regression_mine's row for row.
+
+    python set_rollup.py --out rollup_regressions.csv --summary set_summary.csv
+    python set_rollup.py --families delta ln_delta --synthetic 5000000 --histogram LnDCac
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import keto_data
+import regression_mine
+from stage_profile import stage
+
+# The README's set divisions, children before parents
+HIERARCHY = (
+    ('Beta', ('Theta', 'Eta')),
+    ('BetaUZeta', ('Beta', 'Zeta')),
+    ('Alpha', ('Beta', 'Gamma')),
+    ('Omega', ('Alpha', 'Zeta')),
+)
+DEFAULT_ROLLUP = 'rollup_regressions.csv'
+# Fine histogram bins per standard deviation of the sample
+FINE_BINS = 16
+# Participants, evenly spaced over the store, that fix the shifts and the histogram grid
+SAMPLE = 4096
+
+
+class SetStats:
+    """Additive statistics of one set's columns: cross-products, extremes and sparse histograms."""
+
+    def __init__(self, columns, shift, width):
+        d = len(columns)
+        self.columns = list(columns)
+        self.shift = shift
+        self.width = width
+        # [i, j] sums over the rows where columns i and j are both finite
+        self.n = np.zeros((d, d))
+        self.s = np.zeros((d, d))      # sum of z_i
+        self.ss = np.zeros((d, d))     # sum of z_i^2
+        self.cross = np.zeros((d, d))  # sum of z_i z_j
+        self.lo = np.full(d, np.inf)
+        self.hi = np.full(d, -np.inf)
+        self.bins = [np.zeros(0, dtype=np.int64) for _ in range(d)]
+        self.counts = [np.zeros(0, dtype=np.int64) for _ in range(d)]
+
+    @classmethod
+    def for_block(cls, columns, block):
+        """Empty statistics whose shift and histogram grid come from a (columns x rows) block."""
+        w = np.isfinite(block)
+        n = np.maximum(w.sum(axis=1), 1)
+        shift = np.where(w, block, 0.0).sum(axis=1) / n
+        sd = np.sqrt((np.where(w, block - shift[:, None], 0.0) ** 2).sum(axis=1) / n)
+        return cls(columns, shift, np.where(sd > 0, sd / FINE_BINS, 1.0))
+
+    def _like(self):
+        return SetStats(self.columns, self.shift, self.width)
+
+    def add(self, block):
+        """Accumulates a (columns x rows) block."""
+        w = np.isfinite(block)
+        wf = w.astype(np.float64)
+        z = np.where(w, block - self.shift[:, None], 0.0)
+        self.n += wf @ wf.T
+        self.s += z @ wf.T
+        self.ss += (z * z) @ wf.T
+        self.cross += z @ z.T
+        with np.errstate(invalid='ignore'):
+            self.lo = np.fmin(self.lo, np.where(w, block, np.inf).min(axis=1, initial=np.inf))
+            self.hi = np.fmax(self.hi, np.where(w, block, -np.inf).max(axis=1, initial=-np.inf))
+        for i in range(len(self.columns)):
+            keys = np.floor(z[i][w[i]] / self.width[i]).astype(np.int64)
+            self._add_bins(i, *np.unique(keys, return_counts=True))
+        return self
+
+    def _add_bins(self, i, bins, counts):
+        if not len(self.bins[i]):
+            self.bins[i], self.counts[i] = bins, counts.astype(np.int64)
+            return
+        merged, inverse = np.unique(np.concatenate([self.bins[i], bins]), return_inverse=True)
+        self.counts[i] = np.bincount(inverse, weights=np.concatenate([self.counts[i], counts]),
+                                     minlength=len(merged)).astype(np.int64)
+        self.bins[i] = merged
+
+    def merge(self, *others):
+        """A new SetStats of the union of this set and others (disjoint rows)."""
+        out = self._like()
+        for part in (self, *others):
+            out.n += part.n
+            out.s += part.s
+            out.ss += part.ss
+            out.cross += part.cross
+            out.lo = np.fmin(out.lo, part.lo)
+            out.hi = np.fmax(out.hi, part.hi)
+            for i in range(len(out.columns)):
+                out._add_bins(i, part.bins[i], part.counts[i])
+        return out
+
+    @property
+    def count(self):
+        return np.diag(self.n).astype(np.int64)
+
+    def regressions(self, min_n=4):
+        """ols_matrix-style (d x d) fits of every column (rows) on every column (columns)."""
+        # A column constant in this set is shifted by its own value, so its deviations are exactly zero
+        const = self.lo == self.hi
+        shift = np.where(const, self.lo, self.shift)
+        s, ss, cross = self.s.copy(), self.ss.copy(), self.cross.copy()
+        s[const] = ss[const] = cross[const] = 0.0
+        cross[:, const] = 0.0
+        return regression_mine.ols_from_sums(self.n, s.T, s, ss.T, ss, cross, shift[None, :], shift[:, None], min_n)
+
+    def summary(self):
+        """Per column: N, mean, standard deviation, minimum and maximum."""
+        n = self.count
+        s, ss = np.diag(self.s), np.diag(self.ss)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = s / n
+            var = (ss - s * mean) / (n - 1)
+        return pd.DataFrame({'n': n, 'mean': mean + self.shift, 'sd': np.sqrt(np.maximum(var, 0)),
+                             'min': np.where(n > 0, self.lo, np.nan), 'max': np.where(n > 0, self.hi, np.nan)},
+                            index=pd.Index(self.columns, name='column'))
+
+    def histogram(self, column, bins=20):
+        """(edges, counts) of one column over at most bins equal-width bins, built from the fine grid."""
+        i = self.columns.index(column)
+        keys, counts = self.bins[i], self.counts[i]
+        if not len(keys):
+            return np.array([0.0, 1.0]), np.zeros(1, dtype=np.int64)
+        group = max(1, -(-(int(keys[-1]) - int(keys[0]) + 1) // bins))
+        coarse = (keys - keys[0]) // group
+        edges = self.shift[i] + (keys[0] + group * np.arange(coarse[-1] + 2)) * self.width[i]
+        return edges, np.bincount(coarse, weights=counts, minlength=coarse[-1] + 1).astype(np.int64)
+
+
+def rollup(store, columns, block=65_536):
+    """{set: SetStats} for every set, from one scan of the leaf sets' rows."""
+    sample = np.unique(np.linspace(0, max(store.n - 1, 0), min(store.n, SAMPLE)).astype(np.int64))
+    grid = SetStats.for_block(columns, store.matrix(columns, sample).astype(np.float64))
+    leaves = {}
+    with stage('rollup scan') as s:
+        for leaf in keto_data.LEAF_ORDER:
+            rows = store.set_slice(leaf)
+            leaves[leaf] = grid._like()
+            for start in range(rows.start, rows.stop, block):
+                leaves[leaf].add(store.matrix(columns, slice(start, min(start + block, rows.stop))).astype(np.float64))
+        s.items = store.n
+    nodes = dict(leaves)
+    covered = {leaf: {leaf} for leaf in leaves}
+    with stage('rollup merge', len(HIERARCHY)):
+        for parent, children in HIERARCHY:
+            nodes[parent] = nodes[children[0]].merge(*(nodes[c] for c in children[1:]))
+            covered[parent] = set().union(*(covered[c] for c in children))
+    for name, leaf_names in keto_data.SET_LEAVES.items():
+        if covered.get(name) != set(leaf_names):
+            raise ValueError(f'HIERARCHY gives {name} the leaves {sorted(covered.get(name, ()))}, '
+                             f'keto_data.SET_LEAVES has {sorted(leaf_names)}')
+    return nodes
+
+
+def iter_results(nodes, sets=keto_data.SET_NAMES, n_visits=2, min_n=4):
+    """regression_mine result chunks (RESULT_COLUMNS), one per set, from rolled-up statistics."""
+    fam = regression_mine.family_of(n_visits)
+    for set_name in sets:
+        stats = nodes[set_name]
+        with stage('rollup fit') as s:
+            fits = stats.regressions(min_n)
+            keep = np.isfinite(fits['slope'])
+            np.fill_diagonal(keep, False)
+            frame = regression_mine.chunk_frame(set_name, stats.columns, stats.columns, fits, keep, fam)[0]
+            s.items = len(frame)
+        yield frame
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-set statistics from one scan, merged up the set hierarchy.')
+    parser.add_argument('--families', nargs='*', default=None, help='column families (default: all)')
+    parser.add_argument('--sets', nargs='*', default=list(keto_data.SET_NAMES))
+    parser.add_argument('--min-n', type=int, default=4)
+    parser.add_argument('--block', type=int, default=65_536, help='participants per scanned block')
+    parser.add_argument('--out', default=DEFAULT_ROLLUP, help="regressions of every set ('none' to skip)")
+    parser.add_argument('--summary', default=None, help='per-set column summaries')
+    parser.add_argument('--histogram', nargs='*', default=[], help='columns whose per-set histograms to print')
+    parser.add_argument('--bins', type=int, default=10)
+    parser.add_argument('--synthetic', type=int, default=0)
+    args = parser.parse_args()
+
+    store = keto_data.synthetic_cohort(args.synthetic) if args.synthetic else keto_data.load()
+    columns = regression_mine.all_columns(store.n_visits, args.families)
+    nodes = rollup(store, columns, args.block)
+    print(f'{store.n} participants, {len(columns)} columns: one scan of {len(keto_data.LEAF_ORDER)} leaf sets, '
+          f'{len(HIERARCHY)} merges')
+
+    if args.out.lower() != 'none':
+        rows = regression_mine.write_results(iter_results(nodes, args.sets, store.n_visits, args.min_n), args.out)
+        print(f"{rows} regressions written to '{args.out}'")
+    if args.summary:
+        frames = [nodes[s].summary().reset_index().assign(set=s) for s in args.sets]
+        summary = pd.concat(frames, ignore_index=True)
+        summary[['set', 'column', 'n', 'mean', 'sd', 'min', 'max']].to_csv(args.summary, index=False,
+                                                                          float_format='%.6g')
+        print(f"Column summaries written to '{args.summary}'")
+    for column in args.histogram:
+        print(f'\n{column}:')
+        for s in args.sets:
+            edges, counts = nodes[s].histogram(column, args.bins)
+            print(f'  {s:<10} {edges[0]:>10.4g} .. {edges[-1]:<10.4g} ' + ' '.join(f'{c:>6}' for c in counts))
+
+
+if __name__ == '__main__':
+    main()
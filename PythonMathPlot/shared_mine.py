@@ -0,0 +1,195 @@
+"""
+Shared-memory parallel regression mining.
+
+The store's mined columns are packed once into a single
+multiprocessing.shared_memory block, a (columns x participants) matrix in
+family order. Every set is a contiguous run of participants and every
+family a contiguous run of columns, so a work unit (set, regressor family,
+dependent block) sees its data as two plain slices. Worker processes get
+only the small handle, attach to the block without copying, fit their
+units with regression_mine.ols_matrix (plus Theil-Sen when robust), and
+send result frames back through a bounded queue. When the consumer falls
+behind, the workers block instead of piling up results.
+
+Frames arrive in completion order, so row order differs from
+regression_mine.iter_mine, but the rows are the same.
+
+    python shared_mine.py --workers 8 --out mined_regressions.csv
+"""
+import argparse
+import multiprocessing as mp
+import os
+import traceback
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import keto_data
+import regression_mine
+from robust_regression import theil_sen_pairs
+from stage_profile import stage
+
+
+class SharedColumns:
+    """A ColumnStore's columns as one shared (columns x participants) array."""
+
+    def __init__(self, shm, names, dtype, slices, owner):
+        self.shm = shm
+        self.names = list(names)
+        self.slices = slices
+        self.owner = owner
+        self.array = np.ndarray((len(self.names), slices['Omega'].stop), dtype=dtype, buffer=shm.buf)
+
+    @classmethod
+    def publish(cls, store, names):
+        """Copies the columns into a new shared block; columns derived only for this are dropped again."""
+        names = list(names)
+        dtype = store.dtype
+        cached = {n for n in names if store.is_cached(n)}
+        shm = shared_memory.SharedMemory(create=True, size=max(len(names) * store.n * dtype.itemsize, 1))
+        shared = cls(shm, names, dtype, {s: store.set_slice(s) for s in keto_data.SET_NAMES}, owner=True)
+        with stage('shared publish', len(names) * store.n):
+            for i, name in enumerate(names):
+                shared.array[i] = store.column(name)
+            store.drop([n for n in names if n not in cached])
+        return shared
+
+    @property
+    def handle(self):
+        return {'name': self.shm.name, 'names': self.names, 'dtype': self.array.dtype.str, 'slices': self.slices}
+
+    @classmethod
+    def attach(cls, handle):
+        # Workers are children of the publisher and share its resource tracker, so the block
+        # stays registered once and is unlinked only by the owner
+        shm = shared_memory.SharedMemory(name=handle['name'])
+        return cls(shm, handle['names'], np.dtype(handle['dtype']), handle['slices'], owner=False)
+
+    def block(self, start, stop, set_name):
+        """Columns start:stop over one set's participants, a view into shared memory."""
+        return self.array[start:stop, self.slices[set_name]]
+
+    def close(self):
+        del self.array
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def work_units(columns, fam, sets, block):
+    """(set, regressor start, regressor stop, dependent start, dependent stop) for every unit."""
+    bounds = {}
+    for i, name in enumerate(columns):
+        f = fam.get(name, 'other')
+        lo, _ = bounds.get(f, (i, i))
+        bounds[f] = (lo, i + 1)
+    for set_name in sets:
+        for r_lo, r_hi in bounds.values():
+            for d_lo in range(0, len(columns), block):
+                yield set_name, r_lo, r_hi, d_lo, min(d_lo + block, len(columns))
+
+
+def _run_unit(shared, unit, fam, min_n, robust):
+    set_name, r_lo, r_hi, d_lo, d_hi = unit
+    X = shared.block(r_lo, r_hi, set_name).astype(np.float64, copy=False)
+    Y = shared.block(d_lo, d_hi, set_name).astype(np.float64, copy=False)
+    regs, deps = shared.names[r_lo:r_hi], shared.names[d_lo:d_hi]
+    fits = regression_mine.ols_matrix(Y, X, min_n)
+    keep = np.isfinite(fits['slope'])
+    keep &= np.asarray(deps, dtype=object)[:, None] != np.asarray(regs, dtype=object)[None, :]
+    frame, d_idx, r_idx = regression_mine.chunk_frame(set_name, deps, regs, fits, keep, fam)
+    if robust:
+        ts = theil_sen_pairs(X, Y, zip(d_idx.tolist(), r_idx.tolist()))
+        frame['ts_slope'] = ts[:, 0]
+        frame['ts_intercept'] = ts[:, 1]
+    return frame
+
+
+def _worker(handle, tasks, results, fam, min_n, robust):
+    shared = SharedColumns.attach(handle)
+    try:
+        while True:
+            unit = tasks.get()
+            if unit is None:
+                break
+            frame = _run_unit(shared, unit, fam, min_n, robust)
+            if len(frame):
+                results.put(frame)
+    except Exception:
+        results.put(RuntimeError(traceback.format_exc()))
+    finally:
+        shared.close()
+        results.put(None)
+
+
+def iter_mine_shared(store, sets=keto_data.SET_NAMES, families=None, min_n=4, robust=False,
+                     workers=None, block=64, queue_size=None):
+    """
+    regression_mine.iter_mine over a process pool sharing one copy of the
+    columns. Every selected column is both dependent and regressor.
+    """
+    workers = workers or os.cpu_count()
+    columns = regression_mine.all_columns(store.n_visits, families)
+    fam = regression_mine.family_of(store.n_visits)
+    sets = [s for s in sets if store.view(s).n >= min_n]
+    ctx = mp.get_context()
+    with SharedColumns.publish(store, columns) as shared:
+        tasks = ctx.Queue()
+        results = ctx.Queue(maxsize=queue_size or 2 * workers)
+        units = list(work_units(columns, fam, sets, block))
+        for unit in units:
+            tasks.put(unit)
+        for _ in range(workers):
+            tasks.put(None)
+        procs = [ctx.Process(target=_worker, args=(shared.handle, tasks, results, fam, min_n, robust), daemon=True)
+                 for _ in range(workers)]
+        for p in procs:
+            p.start()
+        try:
+            running = workers
+            with stage('shared mine', len(units)):
+                while running:
+                    item = results.get()
+                    if item is None:
+                        running -= 1
+                    elif isinstance(item, Exception):
+                        raise item
+                    else:
+                        yield item
+        finally:
+            for p in procs:
+                if p.is_alive():
+                    p.terminate()
+                p.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mine simple regressions on a shared-memory process pool.')
+    parser.add_argument('--out', default=regression_mine.DEFAULT_RESULTS)
+    parser.add_argument('--sets', nargs='*', default=list(keto_data.SET_NAMES))
+    parser.add_argument('--families', nargs='*', default=None)
+    parser.add_argument('--min-n', type=int, default=4)
+    parser.add_argument('--robust', action='store_true')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--block', type=int, default=64, help='dependents per work unit')
+    parser.add_argument('--queue-size', type=int, default=None, help='result frames in flight (default 2 per worker)')
+    parser.add_argument('--synthetic', type=int, default=0)
+    parser.add_argument('--float32', action='store_true')
+    args = parser.parse_args()
+
+    dtype = np.float32 if args.float32 else np.float64
+    store = keto_data.synthetic_cohort(args.synthetic, dtype=dtype) if args.synthetic else keto_data.load(dtype=dtype)
+    chunks = iter_mine_shared(store, args.sets, args.families, args.min_n, args.robust,
+                              args.workers, args.block, args.queue_size)
+    rows = regression_mine.write_results(chunks, args.out)
+    print(f"{rows} regressions written to '{args.out}' by {args.workers} workers")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+"""
+Data-driven set divisions: the threshold on any column that best splits a
+set for a target regression, searched exhaustively and grown into a
+division tree.
+
+The README hierarchy was drawn by hand (Eta and Theta, for one, split Beta
+at DCac = 10). Here a split "column <= threshold" is scored by how much
+better the target regression (dependent ~ regressor, or the dependent's
+mean with no regressor) fits when each side gets its own line: the Chow F
+test of the pooled fit against the two side fits.
+
+Every threshold of a candidate column is scored at once. The column is
+sorted once and the cumulative sums of the regression moments (count, x,
+y, x^2, xy, y^2) along that order are the moments of every left side; the
+right side is the total minus the left. Each side's SSE is then closed
+form, so a column costs one sort and six cumulative sums, O(n log n), for
+all of its n - 1 thresholds. Columns are processed in blocks of one
+argsort each.
+
+Columns computed from the target's own attributes (DCac, TdCac, Cac1/Cac0
+for Cac1 ~ Cac0) are left out by default: a split on them divides the set
+by its own outcome. allow_related=True (--allow-related) keeps them.
+
+Participants with a missing split value always go to the '>' side. Only
+thresholds with at least min_leaf regression points on each side count.
+Growing the tree stops when the best split's Bonferroni p (over the
+candidate columns; the threshold search itself is not corrected for)
+exceeds alpha.
+
+    python split_search.py --set Beta --dependent Cac1 --regressor Cac0 --rule DCac 10
+    python split_search.py --set Omega --regressor none --dependent LnDNcpv --max-depth 3 --synthetic 1000000
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+import keto_data
+import regression_mine
+from stage_profile import stage
+
+DEFAULT_TREE = 'split_tree.csv'
+SPLIT_COLUMNS = ('column', 'threshold', 'n_left', 'n_right', 'gain', 'f_stat', 'p_value')
+TREE_COLUMNS = ('node', 'parent', 'depth', 'rule', 'n', 'slope', 'intercept', 'r2', 'split_column', 'threshold',
+                'gain', 'f_stat', 'p_value', 'p_adjusted')
+
+
+def _moments(x, y):
+    """
+    (6, n) per-participant regression moments (1, x, y, x^2, xy, y^2) with
+    x and y centred on the pooled means; rows missing x or y weigh 0.
+    x None is the mean model (x = 0).
+    """
+    w = np.isfinite(y) if x is None else np.isfinite(y) & np.isfinite(x)
+    y0 = np.where(w, y - (y[w].mean() if w.any() else 0), 0.0)
+    x0 = np.zeros_like(y0) if x is None else np.where(w, x - (x[w].mean() if w.any() else 0), 0.0)
+    return np.stack([w.astype(np.float64), x0, y0, x0 * x0, x0 * y0, y0 * y0])
+
+
+def _sse(m, fit_slope):
+    """Residual sum of squares of moments m (6, ...); NaN where the line is undefined."""
+    n, sx, sy, sxx, sxy, syy = m
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cyy = syy - sy * sy / n
+        if not fit_slope:
+            return np.where(n > 0, np.maximum(cyy, 0), np.nan)
+        cxx = sxx - sx * sx / n
+        cxy = sxy - sx * sy / n
+        sse = np.maximum(cyy - cxy * cxy / cxx, 0)
+    return np.where(cxx > 1e-12 * np.maximum(sxx, 1e-300), sse, np.nan)
+
+
+def _chow(pooled, split, n, k):
+    """Chow F statistic of k-parameter side fits against the pooled fit."""
+    dof = n - 2 * k
+    with np.errstate(invalid='ignore', divide='ignore'):
+        f = (pooled - split) / k / (split / dof)
+    return np.where(split > 0, f, np.where(pooled > split, np.inf, 0.0))
+
+
+def _fit(m):
+    """Slope and R^2 of the pooled moments (6,)."""
+    n, sx, sy, sxx, sxy, syy = m
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cxx, cxy, cyy = sxx - sx * sx / n, sxy - sx * sy / n, syy - sy * sy / n
+        slope = cxy / cxx if cxx > 0 else np.nan
+        return slope, cxy * cxy / (cxx * cyy) if cxx > 0 and cyy > 0 else np.nan
+
+
+def best_splits(S, moments, fit_slope=True, min_leaf=5):
+    """
+    The best threshold of every row of S (columns, n) for the target
+    moments (6, n), as a dict of SPLIT_COLUMNS arrays (without 'column').
+    Rows with no admissible threshold come back with NaN scores.
+    """
+    k = 2 if fit_slope else 1
+    c, n = S.shape
+    total = moments.sum(axis=1)
+    pooled = _sse(total, fit_slope)
+    with stage('split sort', S.size):
+        order = np.argsort(S, axis=1, kind='stable')
+        ordered = np.take_along_axis(S, order, axis=1)
+        # A threshold sits between two different finite values
+        cut = np.zeros((c, n), dtype=bool)
+        cut[:, :-1] = (ordered[:, 1:] != ordered[:, :-1]) & np.isfinite(ordered[:, 1:])
+    with stage('split prefix sums', 6 * S.size):
+        left = np.cumsum(moments[:, order], axis=2)
+        right = total[:, None, None] - left
+        cut &= (left[0] >= min_leaf) & (right[0] >= min_leaf)
+        gain = pooled - (_sse(left, fit_slope) + _sse(right, fit_slope))
+    gain = np.where(cut & np.isfinite(gain), gain, -np.inf)
+    best = gain.argmax(axis=1)
+    at = np.arange(c)
+    found = np.isfinite(gain[at, best])
+    n_total = total[0]
+    best_gain = np.where(found, gain[at, best], np.nan)
+    split = pooled - best_gain
+    f = np.where(found, _chow(pooled, split, n_total, k), np.nan)
+    with np.errstate(invalid='ignore'):
+        p = np.where(found, stats.f.sf(f, k, n_total - 2 * k), np.nan)
+    return {
+        'threshold': np.where(found, ordered[at, best], np.nan),
+        'n_left': np.where(found, left[0, at, best], 0).astype(np.int64),
+        'n_right': np.where(found, right[0, at, best], 0).astype(np.int64),
+        'gain': best_gain,
+        'f_stat': f,
+        'p_value': p,
+    }
+
+
+def rule_score(split_values, threshold, moments, fit_slope=True):
+    """Gain, Chow F and p of the fixed rule 'split <= threshold' (a hand-drawn division)."""
+    k = 2 if fit_slope else 1
+    with np.errstate(invalid='ignore'):
+        on_left = split_values <= threshold
+    total = moments.sum(axis=1)
+    left = moments[:, on_left].sum(axis=1)
+    pooled = _sse(total, fit_slope)
+    split = _sse(left, fit_slope) + _sse(total - left, fit_slope)
+    f = float(_chow(pooled, split, total[0], k))
+    return {'threshold': threshold, 'n_left': int(left[0]), 'n_right': int(total[0] - left[0]),
+            'gain': float(pooled - split), 'f_stat': f, 'p_value': float(stats.f.sf(f, k, total[0] - 2 * k))}
+
+
+def candidates(columns, dependent, regressor=None, allow_related=False):
+    """The split columns other than the target's; unless allow_related, none sharing an attribute with it."""
+    target = {dependent, regressor} - {None}
+    related = set().union(*map(keto_data.attributes_of, target))
+    return [c for c in columns if c not in target and (allow_related or not keto_data.attributes_of(c) & related)]
+
+
+def search(store, rows, dependent, regressor=None, columns=None, min_leaf=5, block=16, budget=50_000_000,
+           allow_related=False):
+    """
+    Best split of the participants at rows (indices into store) on every
+    candidate column, one row per column with SPLIT_COLUMNS, best first.
+    """
+    columns = candidates(columns or regression_mine.all_columns(store.n_visits), dependent, regressor, allow_related)
+    y = store.column(dependent)[rows].astype(np.float64)
+    x = None if regressor is None else store.column(regressor)[rows].astype(np.float64)
+    moments = _moments(x, y)
+    # The prefix sums hold six (columns, n) arrays at a time
+    step = max(1, min(block, budget // (8 * max(len(y), 1))))
+    frames = []
+    for start in range(0, len(columns), step):
+        names = columns[start:start + step]
+        S = store.matrix(names, rows).astype(np.float64, copy=False)
+        frames.append(pd.DataFrame({'column': names, **best_splits(S, moments, x is not None, min_leaf)}))
+    frame = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=SPLIT_COLUMNS)
+    return frame.sort_values(['p_value', 'gain'], ascending=[True, False], na_position='last',
+                             ignore_index=True)
+
+
+def grow(store, rows, dependent, regressor=None, columns=None, min_leaf=5, max_depth=3, alpha=0.05,
+         allow_related=False):
+    """
+    Division tree grown from the participants at rows: every node is split
+    on its best column while the Bonferroni-adjusted p stays <= alpha.
+    Returns one TREE_COLUMNS row per node, depth first.
+    """
+    nodes = []
+    pending = [(np.asarray(rows), 0, -1, '')]
+    while pending:
+        node_rows, depth, parent, rule = pending.pop()
+        node = len(nodes)
+        y = store.column(dependent)[node_rows].astype(np.float64)
+        x = None if regressor is None else store.column(regressor)[node_rows].astype(np.float64)
+        moments = _moments(x, y)
+        total = moments.sum(axis=1)
+        slope, r2 = _fit(total) if x is not None else (np.nan, np.nan)
+        w = moments[0] > 0
+        intercept = y[w].mean() - slope * x[w].mean() if x is not None and w.any() else np.nan
+        row = {'node': node, 'parent': parent, 'depth': depth, 'rule': rule or '(all)', 'n': int(total[0]),
+               'slope': slope, 'intercept': intercept, 'r2': r2, 'split_column': None, 'threshold': np.nan,
+               'gain': np.nan, 'f_stat': np.nan, 'p_value': np.nan, 'p_adjusted': np.nan}
+        nodes.append(row)
+        if depth >= max_depth or total[0] < 2 * min_leaf:
+            continue
+        with stage('split search', len(node_rows)):
+            found = search(store, node_rows, dependent, regressor, columns, min_leaf, allow_related=allow_related)
+        found = found[found['p_value'].notna()]
+        if not len(found):
+            continue
+        best = found.iloc[0]
+        p_adjusted = min(1.0, best['p_value'] * len(found))
+        row.update(split_column=best['column'], threshold=best['threshold'], gain=best['gain'],
+                   f_stat=best['f_stat'], p_value=best['p_value'], p_adjusted=p_adjusted)
+        if p_adjusted > alpha:
+            continue
+        values = store.column(best['column'])[node_rows]
+        with np.errstate(invalid='ignore'):
+            on_left = values <= best['threshold']
+        prefix = f'{rule} & ' if rule else ''
+        name, t = best['column'], f"{best['threshold']:.6g}"
+        # Pushed right first so the '<=' branch is numbered first
+        pending.append((node_rows[~on_left], depth + 1, node, f'{prefix}{name} > {t}'))
+        pending.append((node_rows[on_left], depth + 1, node, f'{prefix}{name} <= {t}'))
+    return pd.DataFrame(nodes, columns=TREE_COLUMNS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Search every column for the threshold that best divides a set.')
+    parser.add_argument('--set', default='Omega', choices=keto_data.SET_NAMES)
+    parser.add_argument('--dependent', default='Cac1')
+    parser.add_argument('--regressor', default='Cac0', help="'none' scores splits of the dependent's mean")
+    parser.add_argument('--families', nargs='*', default=None, help='candidate split columns')
+    parser.add_argument('--allow-related', action='store_true',
+                        help="also split on columns computed from the target's attributes (DCac for Cac1 ~ Cac0)")
+    parser.add_argument('--min-leaf', type=int, default=5)
+    parser.add_argument('--max-depth', type=int, default=2)
+    parser.add_argument('--alpha', type=float, default=0.05)
+    parser.add_argument('--rule', nargs=2, metavar=('COLUMN', 'THRESHOLD'), default=None,
+                        help='also score a hand-drawn division, e.g. DCac 10')
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--out', default=DEFAULT_TREE)
+    parser.add_argument('--synthetic', type=int, default=0)
+    args = parser.parse_args()
+
+    store = keto_data.synthetic_cohort(args.synthetic) if args.synthetic else keto_data.load()
+    regressor = None if args.regressor.lower() == 'none' else args.regressor
+    columns = regression_mine.all_columns(store.n_visits, args.families)
+    span = store.set_slice(args.set)
+    rows = np.arange(span.start, span.stop)
+    target = f'{args.dependent} ~ {regressor}' if regressor else f'mean of {args.dependent}'
+
+    found = search(store, rows, args.dependent, regressor, columns, args.min_leaf, allow_related=args.allow_related)
+    print(f'Best single splits of {args.set} (n={len(rows)}) for {target}:')
+    with pd.option_context('display.width', 200):
+        print(found.head(args.top).to_string(index=False, float_format=lambda v: f'{v:.4g}'))
+    if args.rule:
+        column, threshold = args.rule[0], float(args.rule[1])
+        y = store.column(args.dependent)[rows].astype(np.float64)
+        x = None if regressor is None else store.column(regressor)[rows].astype(np.float64)
+        score = rule_score(store.column(column)[rows], threshold, _moments(x, y), regressor is not None)
+        rank = int((found['gain'] > score['gain']).sum()) + 1
+        print(f"\nHand-drawn {column} <= {threshold:g}: n {score['n_left']}/{score['n_right']}, "
+              f"F = {score['f_stat']:.4g}, p = {score['p_value']:.3g} "
+              f"(beaten by the best split of {rank - 1} of {len(found)} columns)")
+
+    tree = grow(store, rows, args.dependent, regressor, columns, args.min_leaf, args.max_depth, args.alpha,
+                args.allow_related)
+    tree.to_csv(args.out, index=False, float_format='%.10g')
+    print(f"\nDivision tree ({len(tree)} nodes) written to '{args.out}':")
+    for node in tree.itertuples():
+        fit = f', slope {node.slope:.4g}, R^2 {node.r2:.3f}' if regressor else ''
+        split = (f'  -> split on {node.split_column} <= {node.threshold:.6g} (p_adj {node.p_adjusted:.3g})'
+                 if isinstance(node.split_column, str) and node.p_adjusted <= args.alpha else '')
+        print(f"{'  ' * node.depth}{node.rule.split(' & ')[-1]}: n={node.n}{fit}{split}")
+
+
+if __name__ == '__main__':
+    main()
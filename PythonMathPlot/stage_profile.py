@@ -0,0 +1,263 @@
+"""
+Stage-level profiling for the plotting and mining scripts.
+
+Wrap a pipeline stage with `stage()`; nothing is recorded unless profiling
+is switched on, either with enable() or by setting KETO_PROFILE=1 in the
+environment. Each stage records wall time, CPU time, peak RSS and an item
+count. The records export as Chrome trace JSON (open in chrome://tracing or
+https://ui.perfetto.dev) plus a per-stage summary table.
+
+    with stage('csv parse') as s:
+        rows = load()
+        s.items = len(rows)
+
+    @stage('fit')
+    def fit(...): ...
+
+    setup = stage('draw').start()
+    ...
+    setup.items = n
+    setup.stop()
+
+Environment switches:
+    KETO_PROFILE=1                  record and report at interpreter exit
+    KETO_PROFILE_TRACE=path.json    trace file (default profile_trace.json)
+"""
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+_enabled = False
+_trace_path = None
+_records = []
+_lock = threading.Lock()
+_local = threading.local()
+_t0 = time.perf_counter()
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB (None if unavailable)."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in KB on Linux and in bytes on macOS
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) / (1024 * 1024)
+    return None
+
+
+def _cpu_time():
+    # Worker threads get their own clock so concurrent stages don't double count
+    if threading.current_thread() is threading.main_thread():
+        return time.process_time()
+    return time.thread_time()
+
+
+def enable(trace_path=None, report_at_exit=True):
+    global _enabled, _trace_path
+    if not _enabled and report_at_exit:
+        atexit.register(report)
+    _enabled = True
+    _trace_path = trace_path or _trace_path
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    with _lock:
+        _records.clear()
+
+
+def records():
+    with _lock:
+        return list(_records)
+
+
+class StageRecord:
+    __slots__ = ('name', 'items', 'start', 'wall', 'cpu', 'peak_rss_mb', 'rss_growth_mb', 'depth', 'thread')
+
+    def __init__(self, name, items=None):
+        self.name = name
+        self.items = items
+        self.start = 0.0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak_rss_mb = None
+        self.rss_growth_mb = None
+        self.depth = 0
+        self.thread = threading.get_ident()
+
+
+class _NullStage:
+    """Returned when profiling is off, so `s.items = n` still works."""
+    items = None
+
+
+class stage:
+    """Context manager and decorator timing one pipeline stage."""
+
+    def __init__(self, name, items=None):
+        self.name = name
+        self.items = items
+        self._record = None
+        self._cpu0 = self._rss0 = None
+
+    def __enter__(self):
+        if not _enabled:
+            return _NullStage()
+        rec = self._record = StageRecord(self.name, self.items)
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        rec.depth = len(stack)
+        stack.append(rec)
+        self._rss0 = peak_rss_mb()
+        self._cpu0 = _cpu_time()
+        rec.start = time.perf_counter()
+        return rec
+
+    def __exit__(self, *exc):
+        rec = self._record
+        if rec is None:
+            return False
+        rec.wall = time.perf_counter() - rec.start
+        rec.cpu = _cpu_time() - self._cpu0
+        rec.peak_rss_mb = peak_rss_mb()
+        if rec.peak_rss_mb is not None and self._rss0 is not None:
+            rec.rss_growth_mb = rec.peak_rss_mb - self._rss0
+        _local.stack.pop()
+        with _lock:
+            _records.append(rec)
+        self._record = None
+        return False
+
+    def start(self):
+        """For stages that span straight-line script code rather than a block."""
+        self.__enter__()
+        return self
+
+    def stop(self):
+        # start() hands back the stage itself, so an item count set on it goes to the record here
+        if self._record is not None and self.items is not None:
+            self._record.items = self.items
+        self.__exit__(None, None, None)
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(self.name, self.items):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+def wrap_method(obj, method_name, stage_name):
+    """Times every call of obj.method_name, e.g. an animation writer's grab_frame/finish."""
+    method = getattr(obj, method_name)
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        with stage(stage_name, 1):
+            return method(*args, **kwargs)
+
+    setattr(obj, method_name, wrapper)
+    return obj
+
+
+def chrome_trace():
+    """Records as a Chrome trace-event document (complete 'X' events, microseconds)."""
+    pid = os.getpid()
+    events = []
+    for rec in records():
+        events.append({
+            'name': rec.name,
+            'cat': 'stage',
+            'ph': 'X',
+            'ts': (rec.start - _t0) * 1e6,
+            'dur': rec.wall * 1e6,
+            'pid': pid,
+            'tid': rec.thread,
+            'args': {
+                'cpu_ms': round(rec.cpu * 1e3, 3),
+                'items': rec.items,
+                'peak_rss_mb': rec.peak_rss_mb,
+                'rss_growth_mb': rec.rss_growth_mb,
+            },
+        })
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def export_chrome_trace(path='profile_trace.json'):
+    with open(path, 'w') as f:
+        json.dump(chrome_trace(), f)
+    return path
+
+
+def summary():
+    """Per stage name: calls, total wall/CPU seconds, items, items/s and max peak RSS."""
+    rows = {}
+    for rec in records():
+        row = rows.setdefault(rec.name, {'stage': rec.name, 'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0,
+                                         'items': 0, 'peak_rss_mb': None, 'first': rec.start})
+        row['calls'] += 1
+        row['wall_s'] += rec.wall
+        row['cpu_s'] += rec.cpu
+        row['items'] += rec.items or 0
+        if rec.peak_rss_mb is not None:
+            row['peak_rss_mb'] = max(row['peak_rss_mb'] or 0.0, rec.peak_rss_mb)
+    out = sorted(rows.values(), key=lambda r: r.pop('first'))
+    for row in out:
+        row['items_per_s'] = row['items'] / row['wall_s'] if row['items'] and row['wall_s'] > 0 else None
+    return out
+
+
+def summary_table():
+    rows = summary()
+    if not rows:
+        return 'No stages recorded.'
+    total = sum(rec.wall for rec in records() if rec.depth == 0) or 1.0
+    width = max(len('Stage'), max(len(r['stage']) for r in rows))
+    lines = [f"{'Stage':<{width}}  {'Calls':>5}  {'Wall s':>9}  {'CPU s':>9}  {'Wall %':>6}  "
+             f"{'Items':>10}  {'Items/s':>11}  {'Peak RSS MB':>11}"]
+    lines.append('-' * len(lines[0]))
+    for r in rows:
+        rate = f"{r['items_per_s']:11.1f}" if r['items_per_s'] else f"{'-':>11}"
+        rss = f"{r['peak_rss_mb']:11.1f}" if r['peak_rss_mb'] is not None else f"{'-':>11}"
+        lines.append(f"{r['stage']:<{width}}  {r['calls']:>5}  {r['wall_s']:9.3f}  {r['cpu_s']:9.3f}  "
+                     f"{100 * r['wall_s'] / total:6.1f}  {r['items']:>10}  {rate}  {rss}")
+    return '\n'.join(lines)
+
+
+def report(trace_path=None):
+    """Prints the summary table and writes the Chrome trace, if anything was recorded."""
+    if not records():
+        return None
+    path = export_chrome_trace(trace_path or _trace_path or 'profile_trace.json')
+    print(summary_table())
+    print(f"Chrome trace written to '{path}'")
+    return path
+
+
+if os.environ.get('KETO_PROFILE', '').lower() not in ('', '0', 'false', 'no'):
+    enable(os.environ.get('KETO_PROFILE_TRACE'))
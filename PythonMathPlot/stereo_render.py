@@ -0,0 +1,317 @@
+"""
+Off-axis stereo rendering of a single 3D scene.
+
+A Scene holds every point once. render_stereo() builds a left and a right
+camera (parallel axes, asymmetric frustums converging at a chosen distance),
+projects all points for both eyes in one batched matrix product, resolves
+depth with a shared z-buffer and produces the anaglyph, cross-eyed and
+parallel formats from the same two framebuffers.
+"""
+import numpy as np
+from PIL import Image
+
+import jit_kernels
+from stage_profile import stage
+
+WHITE = (255, 255, 255)
+
+# Matplotlib colour names used by the charts in this folder
+NAMED_COLORS = {
+    'orange': (255, 165, 0),
+    'purple': (128, 0, 128),
+    'green': (0, 128, 0),
+    'magenta': (255, 0, 255),
+    'red': (255, 0, 0),
+    'blue': (0, 0, 255),
+    'black': (0, 0, 0),
+    'gray': (128, 128, 128),
+    'teal': (0, 128, 128),
+    'brown': (165, 42, 42),
+    'grey': (128, 128, 128),
+    'white': (255, 255, 255),
+}
+
+
+def to_rgb(color):
+    if isinstance(color, str):
+        return NAMED_COLORS[color.lower()]
+    color = tuple(color)
+    if all(isinstance(c, float) for c in color):
+        return tuple(int(round(255 * c)) for c in color[:3])
+    return tuple(int(c) for c in color[:3])
+
+
+def stereo_coordinates(ratio0, ratio1, ln_cac1, depth_scale=1.0):
+    """
+    The ratio charts' 3D convention: x is the mean of the two visit ratios,
+    y is ln(CAC1 + 1) and z is the visit-to-visit disparity times depth_scale.
+    """
+    ratio0 = np.asarray(ratio0, dtype=float)
+    ratio1 = np.asarray(ratio1, dtype=float)
+    x_3d = (ratio0 + ratio1) / 2
+    y_3d = np.asarray(ln_cac1, dtype=float)
+    z_3d = depth_scale * (ratio0 - ratio1)
+    return x_3d, y_3d, z_3d
+
+
+def marker_offsets(marker, radius):
+    """Pixel offsets (dy, dx) covered by a marker of the given radius."""
+    r = int(max(radius, 0))
+    dy, dx = np.mgrid[-r:r + 1, -r:r + 1]
+    if marker in ('s', ','):
+        mask = np.ones_like(dy, dtype=bool)
+    elif marker == 'D':
+        mask = np.abs(dx) + np.abs(dy) <= r
+    elif marker == '^':
+        mask = (dy >= -r) & (np.abs(dx) * 2 <= dy + r)
+    elif marker == '*':
+        mask = (np.abs(dx) + np.abs(dy) <= r) & ((np.abs(dx) <= r // 3) | (np.abs(dy) <= r // 3)
+                                                 | (np.abs(np.abs(dx) - np.abs(dy)) <= max(r // 4, 1)))
+    else:  # 'o', '.' and anything else is a disc
+        mask = dx * dx + dy * dy <= r * r + r
+    return dy[mask], dx[mask]
+
+
+class Scene:
+    """Points (and sampled line segments) with per-point colour, marker and radius."""
+
+    def __init__(self):
+        self._points = []
+        self._colors = []
+        self._markers = []
+        self._radii = []
+        self.labels = []
+
+    def add_points(self, x, y, z, color='black', marker='o', radius=4, label=None):
+        xyz = np.column_stack([np.ravel(x), np.ravel(y), np.ravel(z)]).astype(float)
+        self._points.append(xyz)
+        self._colors.append(np.tile(np.array(to_rgb(color), dtype=np.uint8), (len(xyz), 1)))
+        self._markers.append(np.full(len(xyz), marker, dtype='<U1'))
+        self._radii.append(np.full(len(xyz), int(radius), dtype=np.int32))
+        if label is not None:
+            self.labels.append((label, to_rgb(color), marker))
+        return self
+
+    def add_segments(self, starts, ends, color='gray', samples=64):
+        """Line segments are drawn as densely sampled one pixel points."""
+        starts = np.atleast_2d(np.asarray(starts, dtype=float))
+        ends = np.atleast_2d(np.asarray(ends, dtype=float))
+        t = np.linspace(0.0, 1.0, samples)[None, :, None]
+        pts = (starts[:, None, :] * (1 - t) + ends[:, None, :] * t).reshape(-1, 3)
+        return self.add_points(pts[:, 0], pts[:, 1], pts[:, 2], color=color, marker='.', radius=0)
+
+    def add_box(self, color='gray', samples=64, lo=None, hi=None):
+        """Edges of the box lo..hi, by default the bounding box of the points added so far."""
+        if lo is None or hi is None:
+            lo, hi = self.bounds()
+        corners = np.array([[x, y, z] for x in (lo[0], hi[0]) for y in (lo[1], hi[1]) for z in (lo[2], hi[2])])
+        edges = [(a, b) for a in range(8) for b in range(a + 1, 8) if bin(a ^ b).count('1') == 1]
+        return self.add_segments(corners[[a for a, _ in edges]], corners[[b for _, b in edges]], color, samples)
+
+    @property
+    def points(self):
+        return np.concatenate(self._points) if self._points else np.zeros((0, 3))
+
+    @property
+    def colors(self):
+        return np.concatenate(self._colors) if self._colors else np.zeros((0, 3), dtype=np.uint8)
+
+    @property
+    def markers(self):
+        return np.concatenate(self._markers) if self._markers else np.zeros(0, dtype='<U1')
+
+    @property
+    def radii(self):
+        return np.concatenate(self._radii) if self._radii else np.zeros(0, dtype=np.int32)
+
+    def bounds(self):
+        pts = self.points
+        return pts.min(axis=0), pts.max(axis=0)
+
+    def model_matrix(self, box_aspect=(1.0, 1.0, 1.0)):
+        """Maps the scene's bounding box onto a centred box of half-widths box_aspect."""
+        lo, hi = self.bounds()
+        span = np.where(hi - lo > 0, hi - lo, 1.0)
+        scale = 2.0 * np.asarray(box_aspect, dtype=float) / span
+        m = np.eye(4)
+        m[:3, :3] = np.diag(scale)
+        m[:3, 3] = -(lo + hi) / 2 * scale
+        return m
+
+
+class StereoCamera:
+    """
+    Two parallel cameras separated by eye_separation along the camera's right
+    axis, with off-axis frustums so the plane at convergence is at zero parallax.
+    Azimuth and elevation follow matplotlib's view_init convention (z is up).
+    """
+
+    def __init__(self, azimuth=-60.0, elevation=30.0, distance=4.0, convergence=None,
+                 eye_separation=None, fov=40.0, near=0.1, far=100.0, target=(0.0, 0.0, 0.0)):
+        self.azimuth = azimuth
+        self.elevation = elevation
+        self.distance = distance
+        self.convergence = distance if convergence is None else convergence
+        # Common rule of thumb: interaxial distance is 1/30 of the convergence distance
+        self.eye_separation = self.convergence / 30.0 if eye_separation is None else eye_separation
+        self.fov = fov
+        self.near = near
+        self.far = far
+        self.target = np.asarray(target, dtype=float)
+
+    def position(self):
+        az, el = np.radians(self.azimuth), np.radians(self.elevation)
+        direction = np.array([np.cos(el) * np.cos(az), np.cos(el) * np.sin(az), np.sin(el)])
+        return self.target + self.distance * direction
+
+    def _basis(self):
+        eye = self.position()
+        forward = self.target - eye
+        forward /= np.linalg.norm(forward)
+        up = np.array([0.0, 0.0, 1.0])
+        if abs(forward @ up) > 0.999:
+            up = np.array([0.0, 1.0, 0.0])
+        right = np.cross(forward, up)
+        right /= np.linalg.norm(right)
+        return eye, forward, right, np.cross(right, forward)
+
+    def view_matrices(self):
+        """(2, 4, 4) view matrices, left eye first."""
+        eye, forward, right, up = self._basis()
+        views = np.zeros((2, 4, 4))
+        for e, side in enumerate((-1.0, 1.0)):
+            position = eye + side * self.eye_separation / 2 * right
+            views[e, 0, :3], views[e, 0, 3] = right, -right @ position
+            views[e, 1, :3], views[e, 1, 3] = up, -up @ position
+            views[e, 2, :3], views[e, 2, 3] = -forward, forward @ position
+            views[e, 3, 3] = 1.0
+        return views
+
+    def projection_matrices(self, aspect):
+        """(2, 4, 4) asymmetric frustums, left eye first."""
+        n, f = self.near, self.far
+        top = n * np.tan(np.radians(self.fov) / 2)
+        half_width = top * aspect
+        projections = np.zeros((2, 4, 4))
+        for e, side in enumerate((-1.0, 1.0)):
+            shift = -side * self.eye_separation / 2 * n / self.convergence
+            left, right = -half_width + shift, half_width + shift
+            projections[e] = [
+                [2 * n / (right - left), 0, (right + left) / (right - left), 0],
+                [0, 2 * n / (2 * top), 0, 0],
+                [0, 0, -(f + n) / (f - n), -2 * f * n / (f - n)],
+                [0, 0, -1, 0],
+            ]
+        return projections
+
+
+@stage('stereo projection')
+def project(scene, camera, width, height, box_aspect=(1.0, 1.0, 1.0)):
+    """
+    Projects every scene point for both eyes at once.
+    Returns pixel x, pixel y and eye-space depth, each shaped (2, N).
+    """
+    mvp = camera.projection_matrices(width / height) @ camera.view_matrices() @ scene.model_matrix(box_aspect)
+    pts = scene.points
+    homogeneous = np.column_stack([pts, np.ones(len(pts))])
+    clip = np.einsum('eij,nj->eni', mvp, homogeneous)
+    w = clip[..., 3]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ndc_x = clip[..., 0] / w
+        ndc_y = clip[..., 1] / w
+    px = (ndc_x + 1) / 2 * (width - 1)
+    py = (1 - ndc_y) / 2 * (height - 1)
+    return px, py, w
+
+
+def splat(px, py, depth, markers, radii, width, height):
+    """
+    Splats every point's marker into (B, H, W) buffers holding the index of
+    the nearest point covering each pixel (-1 where empty). px, py and depth
+    are (B, N): one row per eye or animation frame, all resolved in a
+    single sort.
+    """
+    views = px.shape[0]
+    cx = np.rint(np.nan_to_num(px, nan=-1e9, posinf=-1e9, neginf=-1e9)).astype(np.int64)
+    cy = np.rint(np.nan_to_num(py, nan=-1e9, posinf=-1e9, neginf=-1e9)).astype(np.int64)
+    visible = (depth > 0) & np.isfinite(px) & np.isfinite(py)
+    groups = sorted(set(zip(markers.tolist(), radii.tolist())))
+
+    if jit_kernels.use_loops():
+        best = np.full(views * height * width, np.inf)
+        winner = np.full(views * height * width, -1, dtype=np.int32)
+        depth = np.ascontiguousarray(depth, dtype=np.float64)
+        for marker, radius in groups:
+            idx = np.flatnonzero((markers == marker) & (radii == radius))
+            dy, dx = marker_offsets(marker, radius)
+            jit_kernels.splat_group(cx, cy, depth, visible, idx, dy.astype(np.int64), dx.astype(np.int64),
+                                    width, height, best, winner)
+        return winner.reshape(views, height, width)
+
+    pix_parts, depth_parts, point_parts = [], [], []
+    for marker, radius in groups:
+        idx = np.flatnonzero((markers == marker) & (radii == radius))
+        dy, dx = marker_offsets(marker, radius)
+        v, p = np.nonzero(visible[:, idx])
+        p = idx[p]
+        fy = (cy[v, p][:, None] + dy[None, :]).ravel()
+        fx = (cx[v, p][:, None] + dx[None, :]).ravel()
+        inside = (fx >= 0) & (fx < width) & (fy >= 0) & (fy < height)
+        pix_parts.append(((np.repeat(v, len(dy)) * height + fy) * width + fx)[inside])
+        depth_parts.append(np.repeat(depth[v, p], len(dy))[inside])
+        point_parts.append(np.repeat(p, len(dy))[inside])
+
+    winner = np.full(views * height * width, -1, dtype=np.int32)
+    if pix_parts:
+        pix = np.concatenate(pix_parts)
+        order = np.lexsort((np.concatenate(depth_parts), pix))
+        pix, point = pix[order], np.concatenate(point_parts)[order]
+        first = np.ones(len(pix), dtype=bool)
+        first[1:] = pix[1:] != pix[:-1]
+        winner[pix[first]] = point[first]
+    return winner.reshape(views, height, width)
+
+
+@stage('stereo rasterize')
+def rasterize(scene, px, py, depth, width, height, background=WHITE):
+    """
+    Splats every point's marker into a (2, H, W, 3) framebuffer, nearest
+    fragment wins. Both eyes are resolved in a single sort.
+    """
+    winner = splat(px, py, depth, scene.markers, scene.radii, width, height)
+    palette = np.vstack([scene.colors, np.asarray(to_rgb(background), dtype=np.uint8)])
+    return palette[winner]
+
+
+@stage('stereo compose')
+def compose(left, right, gap=0, background=WHITE):
+    """Anaglyph (red from the left eye, green/blue from the right), cross-eyed and parallel pairs."""
+    anaglyph = right.copy()
+    anaglyph[..., 0] = left[..., 0]
+    spacer = np.empty((left.shape[0], gap, 3), dtype=np.uint8)
+    spacer[...] = np.asarray(to_rgb(background), dtype=np.uint8)
+    return {
+        'left': left,
+        'right': right,
+        'anaglyph': anaglyph,
+        'cross_eyed': np.concatenate([right, spacer, left], axis=1),
+        'parallel': np.concatenate([left, spacer, right], axis=1),
+    }
+
+
+def render_stereo(scene, camera=None, width=640, height=480, box_aspect=(1.0, 1.0, 1.0), gap=0, background=WHITE):
+    """Renders the scene once for both eyes and returns every stereo format as uint8 arrays."""
+    camera = camera or StereoCamera()
+    px, py, depth = project(scene, camera, width, height, box_aspect)
+    fb = rasterize(scene, px, py, depth, width, height, background)
+    return compose(fb[0], fb[1], gap, background)
+
+
+@stage('png encode')
+def save_stereo(frames, prefix='', formats=('anaglyph', 'cross_eyed', 'parallel')):
+    paths = []
+    for name in formats:
+        path = f'{prefix}{name}.png'
+        Image.fromarray(frames[name]).save(path)
+        paths.append(path)
+    return paths
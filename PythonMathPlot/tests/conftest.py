@@ -0,0 +1,26 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import keto_data  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def store():
+    """The Keto-CTA study data."""
+    return keto_data.load()
+
+
+@pytest.fixture(scope='session')
+def synthetic():
+    """A small bootstrap cohort with every set populated."""
+    return keto_data.synthetic_cohort(2_000, seed=1)
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
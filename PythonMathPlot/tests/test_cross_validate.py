@@ -0,0 +1,43 @@
+import numpy as np
+
+import cross_validate
+
+
+def _design(Z, rows, terms):
+    return np.column_stack([np.ones(len(rows)), Z[rows][:, terms]])
+
+
+def _refit_predict(y, Z, train, test, terms):
+    beta = np.linalg.lstsq(_design(Z, train, terms), y[train], rcond=None)[0]
+    return _design(Z, test, terms) @ beta
+
+
+def test_score_batch_matches_refits(rng):
+    n = 60
+    Z = rng.normal(size=(n, 4))
+    y = Z @ np.array([1.0, -0.5, 0.0, 2.0]) + rng.normal(size=n)
+    folds = cross_validate.fold_ids(n, 5)
+    candidates = [(0, 1), (1, 3), (0, 2)]
+    r2, kfold_rmse, loo_rmse = cross_validate.score_batch(y, Z, folds, candidates)
+
+    rows = np.arange(n)
+    for c, terms in enumerate(candidates):
+        terms = list(terms)
+        fitted = _refit_predict(y, Z, rows, rows, terms)
+        assert np.isclose(r2[c], 1 - np.sum((y - fitted) ** 2) / np.sum((y - y.mean()) ** 2))
+
+        sq = 0.0
+        for f in range(5):
+            test = rows[folds == f]
+            sq += np.sum((y[test] - _refit_predict(y, Z, rows[folds != f], test, terms)) ** 2)
+        assert np.isclose(kfold_rmse[c], np.sqrt(sq / n))
+
+        press = [y[i] - _refit_predict(y, Z, np.delete(rows, i), [i], terms)[0] for i in rows]
+        assert np.isclose(loo_rmse[c], np.sqrt(np.mean(np.square(press))))
+
+
+def test_cross_validate_ranks_by_kfold(store):
+    frame = cross_validate.cross_validate(store, targets=['Ncpv1'], predictors=['Ncpv0', 'Cac0', 'Tps0'],
+                                          max_terms=2)
+    assert len(frame) == 6
+    assert frame['kfold_rmse'].is_monotonic_increasing
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+from scipy import stats
+
+import influence
+
+
+def _fit(y, X):
+    Z = np.column_stack([np.ones(len(y)), X])
+    beta = np.linalg.lstsq(Z, y, rcond=None)[0]
+    resid = y - Z @ beta
+    return Z, beta, resid @ resid
+
+
+def _f_p(y, X):
+    _, _, sse = _fit(y, X)
+    sst = np.sum((y - y.mean()) ** 2)
+    p, dof = X.shape[1], len(y) - X.shape[1] - 1
+    return stats.f.sf((sst - sse) / p / (sse / dof), p, dof)
+
+
+def _brute_force(y, X):
+    """Leave-one-out refits: Cook's distance, DFBETAS, studentized residuals and the largest dropped p."""
+    n, p = X.shape
+    Z, beta, sse = _fit(y, X)
+    q = p + 1
+    s2 = sse / (n - q)
+    G_inv = np.linalg.inv(Z.T @ Z)
+    cooks, dfbetas, student, p_drop = [], [], [], []
+    for i in range(n):
+        keep = np.arange(n) != i
+        _, beta_i, sse_i = _fit(y[keep], X[keep])
+        d = beta - beta_i
+        cooks.append(d @ (Z.T @ Z) @ d / (q * s2))
+        s_i = np.sqrt(sse_i / (n - q - 1))
+        dfbetas.append(np.abs(d[1:] / (s_i * np.sqrt(np.diag(G_inv)[1:]))).max())
+        student.append(abs(y[i] - Z[i] @ beta_i) / (s_i * np.sqrt(1 + Z[i] @ np.linalg.inv(Z[keep].T @ Z[keep]) @ Z[i])))
+        p_drop.append(_f_p(y[keep], X[keep]))
+    return np.array(cooks), np.array(dfbetas), np.array(student), np.array(p_drop)
+
+
+@pytest.mark.parametrize('p', [1, 2])
+def test_influence_matches_refits(rng, p):
+    n = 40
+    X = rng.normal(size=(n, p))
+    y = X @ np.arange(1, p + 1) + rng.normal(size=n)
+    y[3] += 8  # one outlier
+    out = influence.influence(y[None, :], X[None, :, :])
+    cooks, dfbetas, student, p_drop = _brute_force(y, X)
+
+    assert out['max_cooks'][0] == pytest.approx(cooks.max(), rel=1e-8)
+    assert out['cooks_row'][0] == cooks.argmax()
+    assert out['max_abs_dfbetas'][0] == pytest.approx(dfbetas.max(), rel=1e-8)
+    assert out['max_abs_student'][0] == pytest.approx(student.max(), rel=1e-8)
+    assert out['p_full'][0] == pytest.approx(_f_p(y, X), rel=1e-8)
+    assert out['p_drop_max'][0] == pytest.approx(p_drop.max(), rel=1e-6)
+    assert out['drop_row'][0] == p_drop.argmax()
+    Z = np.column_stack([np.ones(n), X - X.mean(axis=0)])
+    assert out['max_leverage'][0] == pytest.approx(np.diag(Z @ np.linalg.inv(Z.T @ Z) @ Z.T).max())
+
+
+def test_influence_drops_missing_rows(rng):
+    X = rng.normal(size=(30, 1))
+    y = 2 * X[:, 0] + rng.normal(size=30)
+    y_nan = y.copy()
+    y_nan[[5, 17]] = np.nan
+    out = influence.influence(y_nan[None, :], X[None, :, :])
+    keep = np.isfinite(y_nan)
+    cooks = _brute_force(y[keep], X[keep])[0]
+    assert out['n'][0] == 28
+    assert out['max_cooks'][0] == pytest.approx(cooks.max(), rel=1e-8)
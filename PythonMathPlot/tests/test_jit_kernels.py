@@ -0,0 +1,85 @@
+"""
+The loop kernels against the NumPy paths they replace, on small inputs.
+The 'python' backend runs the loops uncompiled, so these run without numba;
+with numba installed the compiled loops are checked too.
+"""
+import numpy as np
+import pytest
+
+import growth_fit
+import jit_kernels
+import keto_data
+import robust_regression
+import stereo_render
+
+LOOP_BACKENDS = ['python'] + (['numba'] if jit_kernels.numba is not None else [])
+
+
+@pytest.fixture(params=LOOP_BACKENDS)
+def loops(request):
+    yield request.param
+    jit_kernels.set_backend('auto')
+
+
+def _with(backend, func):
+    jit_kernels.set_backend(backend)
+    try:
+        return func()
+    finally:
+        jit_kernels.set_backend('auto')
+
+
+def test_splat(rng, loops):
+    scene = stereo_render.Scene()
+    for marker, radius in (('o', 3), ('s', 2), ('^', 3), ('.', 0)):
+        scene.add_points(*rng.normal(size=(3, 150)), marker=marker, radius=radius)
+    px, py, depth = stereo_render.project(scene, stereo_render.StereoCamera(), 160, 120)
+    # Coarse depths force ties, so tie-breaking is checked too
+    depth = np.round(depth, 1)
+
+    def func():
+        return stereo_render.splat(px, py, depth, scene.markers, scene.radii, 160, 120)
+    np.testing.assert_array_equal(_with(loops, func), _with('numpy', func))
+
+
+def test_composite(rng, loops):
+    winner = rng.integers(-1, 50, size=(3, 40, 60)).astype(np.int32)
+    lut = rng.integers(0, 200, size=51).astype(np.uint8)
+    mask = rng.random((40, 60)) < 0.1
+    overlay = rng.integers(200, 256, size=(40, 60)).astype(np.uint8)
+    expected = lut[winner]
+    np.copyto(expected, overlay, where=mask)
+    out = np.empty(winner.shape, dtype=np.uint8)
+    _with(loops, lambda: jit_kernels.composite(winner, lut, overlay, mask, out))
+    np.testing.assert_array_equal(out, expected)
+
+
+def test_count_inversions(rng, loops):
+    keys = rng.integers(0, 20, size=300)
+    i, j = np.triu_indices(len(keys), 1)
+    assert _with(loops, lambda: jit_kernels.count_inversions(keys)) == np.count_nonzero(keys[j] < keys[i])
+
+
+def test_theil_sen(rng, loops):
+    x = np.round(rng.normal(size=200), 2)
+    y = 2 * x + rng.standard_t(2, size=200)
+    assert _with(loops, lambda: robust_regression.theil_sen(x, y)) == _with('numpy',
+                                                                            lambda: robust_regression.theil_sen(x, y))
+
+
+def test_gauss_newton(loops):
+    store = keto_data.synthetic_cohort(500, seed=3, waves=(0, 1, 2, 3.5))
+    values, years = store.visit('Ncpv'), store.years
+
+    def func():
+        return growth_fit.fit_gauss_newton(values, years)
+    got, expected = _with(loops, func), _with('numpy', func)
+    # Both stop within the fit tolerance of the same minimum: equal RSS, parameters close to it
+    np.testing.assert_allclose(got['rss'], expected['rss'], rtol=1e-9, atol=0)
+    np.testing.assert_allclose(got['rate'], expected['rate'], rtol=1e-4, atol=0)
+    np.testing.assert_allclose(got['amplitude'], expected['amplitude'], rtol=1e-4, atol=0)
+
+
+def test_set_backend_rejects_unknown():
+    with pytest.raises(ValueError):
+        jit_kernels.set_backend('fortran')
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+
+import mine_diff
+import regression_mine
+
+KEY = list(mine_diff.DEFAULT_KEY)
+
+
+def _runs(store, rng, tmp_path):
+    """Two overlapping result CSVs: rows dropped, rows added, and slopes and p-values moved."""
+    columns = regression_mine.all_columns(store.n_visits, ['visit', 'delta', 'ratio'])
+    old = regression_mine.mine(store, dependents=columns, regressors=columns)
+    new = old.sample(frac=1.0, random_state=1).reset_index(drop=True)
+    new = new.drop(index=rng.choice(len(new), 150, replace=False)).reset_index(drop=True)
+    moved = rng.choice(len(new), 300, replace=False)
+    new.loc[moved[:100], 'slope'] *= 1.5
+    new.loc[moved[100:200], 'slope'] *= -1
+    new.loc[moved[200:], 'p_value'] *= 1e-3
+    extra = regression_mine.mine(store, dependents=regression_mine.all_columns(store.n_visits, ['td']),
+                                 regressors=columns)
+    new = pd.concat([new, extra], ignore_index=True)
+    old = old.drop(index=rng.choice(len(old), 40, replace=False))
+    paths = str(tmp_path / 'old.csv'), str(tmp_path / 'new.csv')
+    old.to_csv(paths[0], index=False)
+    new.to_csv(paths[1], index=False)
+    return paths
+
+
+def _expected(old, new):
+    a, b = pd.read_csv(old), pd.read_csv(new)
+    joined = a.merge(b, on=KEY, how='outer', suffixes=('_a', '_b'), indicator=True)
+    both = joined[joined['_merge'] == 'both']
+    sa, sb = both['slope_a'], both['slope_b']
+    pa, pb = both['p_value_a'].clip(lower=1e-300), both['p_value_b'].clip(lower=1e-300)
+    changed = ((sb - sa).abs() > 0.1 * np.maximum(sa.abs(), sb.abs())) | (np.sign(sa) * np.sign(sb) < 0) \
+        | (sa.isna() != sb.isna()) | ((both['r2_b'] - both['r2_a']).abs() > 0.05) \
+        | ((np.log10(pb) - np.log10(pa)).abs() > 1.0) | ((both['p_value_a'] <= 0.05) != (both['p_value_b'] <= 0.05))
+    return {'added': int((joined['_merge'] == 'right_only').sum()),
+            'removed': int((joined['_merge'] == 'left_only').sum()),
+            'changed': int(changed.sum()), 'unchanged': int((~changed).sum())}
+
+
+def test_iter_diff_matches_outer_merge(store, rng, tmp_path):
+    old, new = _runs(store, rng, tmp_path)
+    expected = _expected(old, new)
+    assert min(expected.values()) > 0
+    # A tiny chunksize spills many runs per side and merges them block by block
+    diff = pd.concat(mine_diff.iter_diff(old, new, chunksize=97, keep_unchanged=True, tmpdir=str(tmp_path)),
+                     ignore_index=True)
+    assert diff['status'].value_counts().to_dict() == expected
+    keys = diff[KEY].astype(str).agg(mine_diff._SEP.join, axis=1)
+    assert keys.is_unique and keys.is_monotonic_increasing
+
+    changed_only = pd.concat(mine_diff.iter_diff(old, new, chunksize=97), ignore_index=True)
+    assert (changed_only['status'] != 'unchanged').all()
+    assert len(changed_only) == len(diff) - expected['unchanged']
+    # One chunk per side stays in memory and gives the same diff
+    single = pd.concat(mine_diff.iter_diff(old, new, keep_unchanged=True), ignore_index=True)
+    pd.testing.assert_frame_equal(single, diff)
@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+
+import keto_data
+import offset_sweep
+import regression_mine
+
+KEY = ['set', 'dependent', 'regressor']
+OFFSETS = (0.1, 1.0, 5.0)
+
+
+def _stacked_frame(stacked, k):
+    """The stacked fits at offset index k as one row per finite, non-self regression."""
+    rows = []
+    for set_name, parts in stacked.items():
+        for deps, regs, fits in parts:
+            keep = np.isfinite(fits['slope'][k])
+            keep &= np.asarray(deps, dtype=object)[:, None] != np.asarray(regs, dtype=object)[None, :]
+            d_idx, r_idx = np.nonzero(keep)
+            rows.append(pd.DataFrame({
+                'set': set_name,
+                'dependent': np.asarray(deps, dtype=object)[d_idx],
+                'regressor': np.asarray(regs, dtype=object)[r_idx],
+                **{key: fits[key][k][keep] for key in ('n', 'slope', 'intercept', 'r2', 'p_value')},
+            }))
+    return pd.concat(rows, ignore_index=True)
+
+
+def test_stacked_sweep_matches_remined(store):
+    columns = regression_mine.all_columns(store.n_visits, ['visit', 'ln_visit', 'delta', 'ln_delta', 'ln_td'])
+    ln_columns = set(offset_sweep.offset_dependent(store.with_ln_offsets(OFFSETS), columns))
+    assert ln_columns and ln_columns < set(columns)
+    stacked = {}
+    for _ in offset_sweep.iter_sweep(store, OFFSETS, columns=columns, block=7, stacked=stacked):
+        pass
+    for k, offset in enumerate(OFFSETS):
+        got = _stacked_frame(stacked, k)
+        expected = regression_mine.mine(keto_data.load(ln_offset=offset), dependents=columns, regressors=columns)
+        # Only regressions with an Ln side are refit
+        expected = expected[expected['dependent'].isin(ln_columns) | expected['regressor'].isin(ln_columns)]
+        both = expected.merge(got, on=KEY, how='outer', suffixes=('', '_sweep'), indicator=True)
+        assert (both['_merge'] == 'both').all(), offset
+        assert (both['n'] == both['n_sweep']).all()
+        for column in ('slope', 'intercept', 'r2', 'p_value'):
+            np.testing.assert_allclose(both[f'{column}_sweep'], both[column], rtol=1e-12, atol=1e-12)
+
+
+def test_summary_reference_row(store):
+    columns = regression_mine.all_columns(store.n_visits, ['delta', 'ln_delta'])
+    frame = pd.concat(offset_sweep.iter_sweep(store, OFFSETS, sets=['Omega'], columns=columns), ignore_index=True)
+    assert list(frame.columns) == list(offset_sweep.SWEEP_COLUMNS)
+    expected = regression_mine.mine(store, sets=['Omega'], dependents=columns, regressors=columns)
+    both = frame.merge(expected, on=KEY, suffixes=('', '_mined'))
+    assert len(both) == len(frame)
+    np.testing.assert_allclose(both['slope'], both['slope_mined'], rtol=1e-12)
+    assert (both['slope_min'] <= both['slope'] + 1e-15).all() and (both['slope'] <= both['slope_max'] + 1e-15).all()
+    assert (both['survives'] <= (both['p_value'] <= 0.05)).all()
+    assert both['significant_share'].between(0, 1).all()
+    assert (both['p_max'] >= both['p_value']).all()
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+import pvalue_fdr
+
+
+def _p_values(rng):
+    """Uniform p-values with heavy ties at 0, 0.5 and 1, a dense cluster near zero, and NaN."""
+    p = np.concatenate([rng.random(20_000), np.ones(7_000), np.zeros(3_000), rng.random(5_000) * 1e-5,
+                        np.full(4_000, 0.5), np.full(100, np.nan)])
+    return p[rng.permutation(len(p))]
+
+
+def _sorted_bh(p):
+    """Uncapped BH q-values by a full sort, NaN where p is NaN."""
+    ok = np.isfinite(p)
+    order = np.argsort(p[ok], kind='stable')
+    s = p[ok][order]
+    m = len(s)
+    rank = np.searchsorted(s, s, side='right')
+    qs = np.minimum.accumulate((m * s / rank)[::-1])[::-1]
+    q = np.full(len(p), np.nan)
+    q[np.flatnonzero(ok)[order]] = qs
+    return q
+
+
+def _spill(tmp_path, p):
+    spill_path = tmp_path / 'p.f8'
+    p.tofile(spill_path)
+    finite = p[np.isfinite(p)]
+    edges = pvalue_fdr.FINE_EDGES
+    fine = np.bincount(np.searchsorted(edges, finite, side='right') - 1, minlength=len(edges) - 1)
+    return str(spill_path), fine
+
+
+@pytest.mark.parametrize('max_rows', [250, 1_000, 10_000_000])
+def test_bh_qvalues_match_sort(tmp_path, rng, max_rows):
+    p = _p_values(rng)
+    spill_path, fine = _spill(tmp_path, p)
+    q_path = str(tmp_path / 'q.f8')
+    m = pvalue_fdr.bh_qvalues(spill_path, q_path, fine, max_rows, chunk_rows=777)
+    assert m == np.isfinite(p).sum()
+    q = np.fromfile(q_path, dtype=np.float64)
+    expected = _sorted_bh(p)
+    np.testing.assert_array_equal(np.isnan(q), np.isnan(p))
+    np.testing.assert_allclose(q, expected, rtol=1e-12, equal_nan=True)
+
+    # BY is BH scaled by c(m)
+    c_m = np.sum(1.0 / np.arange(1, m + 1))
+    assert pvalue_fdr.by_factor(m) == pytest.approx(c_m, rel=1e-12)
+    np.testing.assert_allclose(np.minimum(q * pvalue_fdr.by_factor(m), 1.0), np.minimum(expected * c_m, 1.0),
+                               rtol=1e-12, equal_nan=True)
+
+
+def test_plan_ranges_split_heavy_buckets(tmp_path, rng):
+    p = _p_values(rng)
+    spill_path, fine = _spill(tmp_path, p)
+    ranges = pvalue_fdr.plan_ranges(spill_path, fine, max_rows=250, chunk_rows=777)
+    assert sum(count for _, _, count in ranges) == np.isfinite(p).sum()
+    for lo, hi, count in ranges:
+        # A range holds at most max_rows p-values unless it is one tied value
+        assert count <= 250 or lo == hi
+    ties = {lo for lo, hi, _ in ranges if lo == hi}
+    assert {0.0, 0.5, 1.0} <= ties
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+import robust_regression
+
+
+@pytest.mark.parametrize('n', [64, 257, 1000])
+def test_theil_sen_matches_naive(rng, n):
+    # Rounded x and heavy-tailed y: tied x pairs (no slope) and tied slopes
+    x = np.round(rng.normal(size=n), 1)
+    y = 2 * x + rng.standard_t(2, size=n)
+    assert robust_regression.theil_sen(x, y) == pytest.approx(robust_regression.theil_sen_naive(x, y), abs=1e-12)
+
+
+def test_theil_sen_drops_missing(rng):
+    x, y = rng.normal(size=200), rng.normal(size=200)
+    x[::7], y[::11] = np.nan, np.nan
+    keep = np.isfinite(x) & np.isfinite(y)
+    assert robust_regression.theil_sen(x, y) == pytest.approx(robust_regression.theil_sen_naive(x[keep], y[keep]))
+
+
+def test_count_le_matches_brute_force(rng):
+    x, y = np.round(rng.normal(size=150), 1), rng.normal(size=150)
+    i, j = np.triu_indices(len(x), 1)
+    ok = x[i] != x[j]
+    slopes = np.sort((y[j] - y[i])[ok] / (x[j] - x[i])[ok])
+    selector = robust_regression.SlopeSelector(x, y)
+    # Midway between neighbouring slopes, where rounding in y - t*x cannot move a pair across t
+    picks = (np.array([0.0, 0.1, 0.5, 0.9]) * len(slopes)).astype(int)
+    for t in [slopes[0] - 1, *((slopes[picks] + slopes[picks + 1]) / 2), slopes[-1] + 1]:
+        assert selector.count_le(t) == np.count_nonzero(slopes <= t)
+
+
+def test_theil_sen_pairs(rng):
+    X, Y = rng.normal(size=(3, 120)), rng.normal(size=(2, 120))
+    pairs = [(d, r) for d in range(2) for r in range(3)]
+    fits = robust_regression.theil_sen_pairs(X, Y, pairs, batch=2)
+    expected = [robust_regression.theil_sen_naive(X[r], Y[d]) for d, r in pairs]
+    np.testing.assert_allclose(fits, expected, atol=1e-12)
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+from scipy import stats
+
+import set_compare
+
+
+def test_compare_matches_scipy(store):
+    columns = ['Ncpv0', 'Cac1', 'DCac', 'LnDNcpv']
+    frame = set_compare.compare(store, columns)
+    assert len(frame) == len(columns) * len(set_compare.disjoint_pairs(list(store.set_sizes())))
+    for row in frame.itertuples():
+        a = store.view(row.set_a).column(row.column)
+        b = store.view(row.set_b).column(row.column)
+        a, b = a[~np.isnan(a)], b[~np.isnan(b)]
+        assert (row.n_a, row.n_b) == (len(a), len(b))
+        welch = stats.ttest_ind(a, b, equal_var=False)
+        if np.isfinite(welch.statistic):
+            assert row.welch_t == pytest.approx(welch.statistic, rel=1e-9)
+            assert row.welch_p == pytest.approx(welch.pvalue, rel=1e-9, abs=1e-300)
+        if len(a) and len(b) and np.ptp(np.concatenate([a, b])) > 0:
+            mw = stats.mannwhitneyu(a, b, use_continuity=True, method='asymptotic')
+            assert row.mw_u == pytest.approx(mw.statistic)
+            assert row.mw_p == pytest.approx(mw.pvalue, rel=1e-9, abs=1e-300)
+
+
+def test_disjoint_pairs_share_no_leaf():
+    for a, b in set_compare.disjoint_pairs(['Omega', 'Alpha', 'Beta', 'Zeta', 'Gamma', 'Theta', 'Eta']):
+        assert 'Omega' not in (a, b)
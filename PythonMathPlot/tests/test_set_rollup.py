@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import keto_data
+import regression_mine
+import set_rollup
+
+KEY = ['set', 'dependent', 'regressor']
+
+
+def _rolled_up(store, columns):
+    nodes = set_rollup.rollup(store, columns, block=37)
+    return nodes, pd.concat(set_rollup.iter_results(nodes, n_visits=store.n_visits), ignore_index=True)
+
+
+@pytest.mark.parametrize('data', ['store', 'synthetic'])
+def test_rollup_matches_regression_mine(request, data):
+    store = request.getfixturevalue(data)
+    columns = regression_mine.all_columns(store.n_visits, ['visit', 'delta', 'ratio'])
+    _, got = _rolled_up(store, columns)
+    expected = regression_mine.mine(store, dependents=columns, regressors=columns)
+    both = expected.merge(got, on=KEY, how='outer', suffixes=('', '_rollup'), indicator=True)
+    assert (both['_merge'] == 'both').all()
+    assert (both['n'] == both['n_rollup']).all()
+    for column in ('slope', 'intercept', 'r2', 'p_value'):
+        np.testing.assert_allclose(both[f'{column}_rollup'], both[column], rtol=1e-7, atol=1e-9)
+
+
+def test_summary_and_histogram(store):
+    columns = ['Cac0', 'LnNcpv1', 'DCac', 'Qangio0']
+    nodes, _ = _rolled_up(store, columns)
+    for set_name in keto_data.SET_NAMES:
+        frame = store.view(set_name).to_frame(columns)
+        summary = nodes[set_name].summary()
+        pd.testing.assert_series_equal(summary['n'], frame[columns].count().rename_axis('column').rename('n'),
+                                       check_dtype=False)
+        np.testing.assert_allclose(summary['mean'], frame[columns].mean(), rtol=1e-9)
+        np.testing.assert_allclose(summary['sd'], frame[columns].std(), rtol=1e-7, atol=1e-12)
+        np.testing.assert_array_equal(summary['min'], frame[columns].min())
+        for column in columns:
+            edges, counts = nodes[set_name].histogram(column, 10)
+            values = frame[column].dropna()
+            assert counts.sum() == len(values)
+            if len(values):
+                assert edges[0] <= values.min() and values.max() < edges[-1]
+
+
+def test_hierarchy_covers_the_readme_sets():
+    assert {name for name, _ in set_rollup.HIERARCHY} | set(keto_data.LEAF_ORDER) == set(keto_data.SET_NAMES)
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+import keto_data
+import regression_mine
+import split_search
+
+
+def _sse(x, y, fit_slope):
+    if not fit_slope:
+        return ((y - y.mean()) ** 2).sum()
+    A = np.column_stack([np.ones_like(x), x])
+    return ((y - A @ np.linalg.lstsq(A, y, rcond=None)[0]) ** 2).sum()
+
+
+def _brute_force(s, x, y, fit_slope, min_leaf):
+    """(threshold, gain) of the best 'split <= threshold' by refitting both sides at every threshold."""
+    w = np.isfinite(y) if x is None else np.isfinite(y) & np.isfinite(x)
+    x = np.zeros_like(y) if x is None else x
+    pooled = _sse(x[w], y[w], fit_slope)
+    best = (np.nan, -np.inf)
+    for t in np.unique(s[np.isfinite(s)])[:-1]:
+        with np.errstate(invalid='ignore'):
+            left = (s <= t) & w
+        right = ~(s <= t) & w
+        if left.sum() < min_leaf or right.sum() < min_leaf:
+            continue
+        gain = pooled - _sse(x[left], y[left], fit_slope) - _sse(x[right], y[right], fit_slope)
+        if gain > best[1]:
+            best = (t, gain)
+    return best
+
+
+@pytest.mark.parametrize('fit_slope', [True, False])
+def test_best_splits_match_brute_force(rng, fit_slope):
+    n = 160
+    x = rng.normal(size=n)
+    s = np.stack([rng.normal(size=n), rng.integers(0, 6, n).astype(np.float64), rng.random(n), np.full(n, 2.0)])
+    y = 1 + 0.5 * x + np.where(s[0] > 0.3, 2 * x, 0) + rng.normal(scale=0.5, size=n)
+    x[rng.choice(n, 9, replace=False)] = np.nan
+    y[rng.choice(n, 7, replace=False)] = np.nan
+    s[0, rng.choice(n, 11, replace=False)] = np.nan
+    s[1, rng.choice(n, 5, replace=False)] = np.nan
+    xs = x if fit_slope else None
+    got = split_search.best_splits(s, split_search._moments(xs, y), fit_slope, min_leaf=8)
+    for i in range(3):
+        threshold, gain = _brute_force(s[i], xs, y, fit_slope, 8)
+        assert got['threshold'][i] == threshold
+        assert got['gain'][i] == pytest.approx(gain, rel=1e-9)
+        with np.errstate(invalid='ignore'):
+            on_left = s[i] <= threshold
+        w = np.isfinite(y) & (np.isfinite(x) if fit_slope else True)
+        assert (got['n_left'][i], got['n_right'][i]) == ((on_left & w).sum(), (~on_left & w).sum())
+    # A constant column has no threshold
+    assert np.isnan(got['threshold'][3]) and np.isnan(got['p_value'][3])
+
+
+def test_related_columns_excluded(store):
+    columns = regression_mine.all_columns(store.n_visits)
+    kept = split_search.candidates(columns, 'Cac1', 'Cac0')
+    for name in ('Cac1', 'Cac0', 'DCac', 'TdCac', 'LnDCac', 'Cac1/Cac0', 'MaxCac', 'CacPredict'):
+        assert name in columns and name not in kept
+    assert not any(keto_data.attributes_of(c) & {'Cac'} for c in kept)
+    assert {'DNcpv', 'Ncpv1', 'TdPav'} <= set(kept)
+    assert {'DCac', 'TdCac'} <= set(split_search.candidates(columns, 'Cac1', 'Cac0', allow_related=True))
+
+    span = store.set_slice('Beta')
+    rows = np.arange(span.start, span.stop)
+    found = split_search.search(store, rows, 'Cac1', 'Cac0', columns)
+    assert set(found['column']) == set(kept)
+    assert 'DCac' in set(split_search.search(store, rows, 'Cac1', 'Cac0', columns, allow_related=True)['column'])
@@ -0,0 +1,290 @@
+"""
+Monte Carlo projection of multi-year Cac / Ncpv / Pav trajectories.
+
+CacPredict and NcpvPredict (MathUtils.DblPredict) move the last visit one
+year along the participant's own Td. Here the growth rates are uncertain.
+Every participant's rates come from their set's fitted rate distribution,
+and the trajectories are projected over N years:
+
+- per-participant rates k are the log-linear fits of growth_fit.py over
+  the real visit times;
+- each set's rates of all attributes are fitted jointly as a multivariate
+  normal (mean and covariance), so correlated Cac/Ncpv growth stays
+  correlated in the draws;
+- a chunk of participants gets a (participants x draws x attributes)
+  block of rate draws, and value = last visit * exp(k t) becomes one
+  (participants x draws x years) array per attribute;
+- each chunk reduces to per-year histograms of ln(value + 1) and a
+  histogram of the time to reach each threshold, solved exactly as
+  ln(threshold / last) / k. Histograms add, so chunks can run on any
+  number of worker processes and the result is the same.
+
+Fan charts show every set's 5/25/50/75/95% bands per attribute. The
+time-to-threshold summary gives the share already past the threshold,
+the chance that the others cross within the horizon, and their median
+crossing time. A threshold is absolute (Cac=100) or a
+multiple of the last visit (Ncpv=2x). A zero last visit stays at zero
+under exponential growth.
+
+    python trajectory_sim.py --draws 10000 --years 10 --plot trajectory_fans.png
+    python trajectory_sim.py --thresholds Cac=400 Ncpv=1.5x --sets Theta Eta --workers 4
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import growth_fit
+import keto_data
+from stage_profile import stage
+
+ATTRIBUTES = ('Cac', 'Ncpv', 'Pav')
+DEFAULT_THRESHOLDS = ('Cac=100', 'Ncpv=2x', 'Pav=2x')
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+DEFAULT_FANS = 'trajectory_fans.csv'
+VALUE_BINS = 2048
+# Time-to-threshold resolution, in years
+TIME_STEP = 0.05
+
+
+def parse_thresholds(specs):
+    """'Cac=100' / 'Ncpv=2x' -> {attribute: (value, relative)}."""
+    out = {}
+    for spec in specs:
+        attr, _, value = spec.partition('=')
+        relative = value.lower().endswith('x')
+        out[attr] = (float(value[:-1] if relative else value), relative)
+    return out
+
+
+def rate_model(view, attributes=ATTRIBUTES):
+    """Mean and covariance of a set's log-linear growth rates, over participants with every rate finite."""
+    rates = np.column_stack([growth_fit.fit_loglinear(view.visit(a), view.years)['rate'] for a in attributes])
+    rates = rates[np.isfinite(rates).all(axis=1)]
+    if len(rates) < 2:
+        raise ValueError(f'{view.name}: {len(rates)} participants with every growth rate, need 2')
+    return rates.mean(axis=0), np.atleast_2d(np.cov(rates, rowvar=False)), len(rates)
+
+
+def _cholesky(cov):
+    """Lower Cholesky factor, with a little jitter for singular (e.g. all-zero) covariances."""
+    jitter = 0.0
+    for _ in range(10):
+        try:
+            return np.linalg.cholesky(cov + jitter * np.eye(len(cov)))
+        except np.linalg.LinAlgError:
+            jitter = max(jitter * 10, 1e-12 * max(np.trace(cov), 1e-12))
+    return np.diag(np.sqrt(np.maximum(np.diag(cov), 0)))
+
+
+class Histograms:
+    """Per-year ln(value + 1) histograms and time-to-threshold histograms of one set, per attribute."""
+
+    def __init__(self, attributes, years, log_top, horizon):
+        self.attributes = list(attributes)
+        self.years = np.asarray(years, dtype=np.float64)
+        # A zero-width first bin holds exact zeros (a zero last visit), so they are not spread over a bin
+        self.value_edges = {a: np.concatenate([[0.0], np.linspace(0, log_top[a], VALUE_BINS + 1)])
+                            for a in self.attributes}
+        self.time_edges = np.arange(0, horizon + TIME_STEP / 2, TIME_STEP)
+        self.values = {a: np.zeros((len(self.years), VALUE_BINS + 1), dtype=np.int64) for a in self.attributes}
+        # Time bins, then one for 'beyond the horizon or never'; already counts those at or past it at year 0
+        self.times = {a: np.zeros(len(self.time_edges), dtype=np.int64) for a in self.attributes}
+        self.already = dict.fromkeys(self.attributes, 0)
+
+    def add(self, other):
+        for a in self.attributes:
+            self.values[a] += other.values[a]
+            self.times[a] += other.times[a]
+            self.already[a] += other.already[a]
+        return self
+
+
+def _simulate_chunk(task):
+    """Rate draws, trajectories and their histograms for one chunk of participants."""
+    last, target, mean, chol, draws, hist, seed = task
+    rng = np.random.default_rng(seed)
+    n, n_attr = last.shape
+    k = mean + rng.standard_normal((n, draws, n_attr)) @ chol.T
+    years = hist.years
+    for i, a in enumerate(hist.attributes):
+        v0 = last[:, i][:, None, None]
+        values = v0 * np.exp(k[:, :, i, None] * years)
+        edges = hist.value_edges[a]
+        width = edges[2] - edges[1]
+        bins = np.where(values > 0, 1 + np.clip((np.log1p(values) / width).astype(np.int64), 0, VALUE_BINS - 1), 0)
+        # Year index folded into the bin number so one bincount fills every year
+        flat = (bins + np.arange(len(years)) * (VALUE_BINS + 1)).ravel()
+        hist.values[a] += np.bincount(flat, minlength=len(years) * (VALUE_BINS + 1)).reshape(len(years), -1)
+
+        t_v0 = last[:, i][:, None]
+        thr = target[:, i][:, None]
+        rate = k[:, :, i]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = np.where((t_v0 >= thr) & (t_v0 > 0), 0.0, np.where((rate > 0) & (t_v0 > 0), np.log(thr / t_v0) / rate, np.inf))
+        slot = np.minimum(np.floor(t / TIME_STEP), len(hist.time_edges) - 1)
+        slot = np.where(t > hist.time_edges[-1], len(hist.time_edges) - 1, slot).astype(np.int64)
+        hist.times[a] += np.bincount(slot.ravel(), minlength=len(hist.time_edges))
+        hist.already[a] += int(np.count_nonzero(t == 0))
+    return hist
+
+
+def _chunk_rows(draws, years, n_attr, budget=32 << 20):
+    """Participants per chunk so one chunk's arrays stay near budget bytes."""
+    return max(1, budget // (8 * draws * (len(years) + 2 * n_attr)))
+
+
+def simulate(store, sets=keto_data.LEAF_ORDER, attributes=ATTRIBUTES, thresholds=None, draws=10_000, years=10,
+             seed=0, workers=None):
+    """
+    {set: (Histograms, rate model)} of draws trajectories per participant,
+    projected from the last visit at years 0..years.
+    """
+    thresholds = parse_thresholds(DEFAULT_THRESHOLDS if thresholds is None else thresholds)
+    grid = np.arange(years + 1, dtype=np.float64)
+    pool = ProcessPoolExecutor(max_workers=workers) if workers and workers > 1 else None
+    out = {}
+    try:
+        for s_index, set_name in enumerate(sets):
+            view = store.view(set_name)
+            mean, cov, fitted = rate_model(view, attributes)
+            chol = _cholesky(cov)
+            last = np.column_stack([view.visit(a)[:, -1] for a in attributes]).astype(np.float64)
+            last = np.where(np.isfinite(last), np.maximum(last, 0), 0.0)
+            target = np.column_stack([last[:, i] * thresholds[a][0] if thresholds.get(a, (0, False))[1]
+                                      else np.full(view.n, thresholds.get(a, (np.inf, False))[0])
+                                      for i, a in enumerate(attributes)])
+            # ln(value + 1) range: the largest start grown at a 6-sigma rate for the whole horizon
+            top_rate = np.maximum(mean + 6 * np.sqrt(np.diag(cov)), 0)
+            log_top = {a: max(np.log1p(last[:, i].max()) + top_rate[i] * years, 1.0) for i, a in enumerate(attributes)}
+            rows = _chunk_rows(draws, grid, len(attributes))
+            tasks = [(last[start:start + rows], target[start:start + rows], mean, chol, draws,
+                      Histograms(attributes, grid, log_top, years), [seed, s_index, start])
+                     for start in range(0, view.n, rows)]
+            with stage('trajectory simulation', view.n * draws):
+                total = Histograms(attributes, grid, log_top, years)
+                for part in (pool.map(_simulate_chunk, tasks) if pool else map(_simulate_chunk, tasks)):
+                    total.add(part)
+            out[set_name] = (total, {'mean': mean, 'cov': cov, 'fitted': fitted, 'n': view.n})
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return out
+
+
+def _hist_quantiles(counts, edges, quantiles):
+    """Quantiles of binned data, interpolated linearly within the bin."""
+    cum = np.cumsum(counts)
+    if not len(cum) or cum[-1] == 0:
+        return np.full(len(quantiles), np.nan)
+    target = np.asarray(quantiles) * cum[-1]
+    i = np.minimum(np.searchsorted(cum, target, side='left'), len(counts) - 1)
+    before = np.where(i > 0, cum[np.maximum(i - 1, 0)], 0)
+    frac = np.where(counts[i] > 0, (target - before) / np.maximum(counts[i], 1), 0)
+    return edges[i] + frac * (edges[i + 1] - edges[i])
+
+
+def fan_table(results, quantiles=QUANTILES, thresholds=None):
+    """Per (set, attribute, year): value quantiles and the share of trajectories past the threshold."""
+    rows = []
+    for set_name, (hist, _) in results.items():
+        for a in hist.attributes:
+            edges = hist.value_edges[a]
+            times = hist.times[a]
+            total = times.sum()
+            for y, year in enumerate(hist.years):
+                q = np.expm1(_hist_quantiles(hist.values[a][y], edges, quantiles))
+                crossed = times[:int(round(year / TIME_STEP))].sum() if year > 0 else hist.already[a]
+                rows.append({'set': set_name, 'attribute': a, 'year': year,
+                             **{f'q{int(round(p * 100)):02d}': v for p, v in zip(quantiles, q)},
+                             'p_threshold': crossed / total if total else np.nan})
+    return pd.DataFrame(rows)
+
+
+def threshold_table(results):
+    """
+    Per (set, attribute): the share of trajectories already past the
+    threshold at the last visit, the share of the others that cross within
+    the horizon (p_new), and the crossing-time quantiles of those that do.
+    """
+    rows = []
+    for set_name, (hist, model) in results.items():
+        for a in hist.attributes:
+            times = hist.times[a]
+            total = times.sum()
+            already = hist.already[a]
+            # Those already past sit at t = 0 in the first slot; only new crossings count from here
+            within = times[:-1].copy()
+            within[0] -= already
+            q = _hist_quantiles(within, hist.time_edges, (0.1, 0.5, 0.9))
+            rest = total - already
+            rows.append({'set': set_name, 'attribute': a, 'n': model['n'], 'rate_fits': model['fitted'],
+                         'mean_rate': model['mean'][hist.attributes.index(a)],
+                         'already': already / total if total else np.nan,
+                         'p_new': within.sum() / rest if rest else np.nan,
+                         't10': q[0], 't50': q[1], 't90': q[2]})
+    return pd.DataFrame(rows)
+
+
+def plot_fans(fans, path, styles=None):
+    """One panel per attribute: each set's median with its 50% and 90% bands, on a log(value + 1) axis."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    if styles is None:
+        from chart_build import SET_STYLES as styles
+
+    attributes = list(dict.fromkeys(fans['attribute']))
+    fig, axes = plt.subplots(1, len(attributes), figsize=(6 * len(attributes), 5), squeeze=False)
+    for ax, a in zip(axes[0], attributes):
+        for set_name, frame in fans[fans['attribute'] == a].groupby('set', sort=False):
+            color = styles[set_name][0]
+            ax.fill_between(frame['year'], frame['q05'], frame['q95'], color=color, alpha=0.12, linewidth=0)
+            ax.fill_between(frame['year'], frame['q25'], frame['q75'], color=color, alpha=0.3, linewidth=0)
+            ax.plot(frame['year'], frame['q50'], color=color, label=set_name)
+        positive = fans.loc[(fans['attribute'] == a) & (fans['q25'] > 0), 'q25']
+        ax.set_yscale('symlog', linthresh=10 ** np.floor(np.log10(positive.min())) if len(positive) else 1)
+        ax.set_xlabel('Years after last visit')
+        ax.set_ylabel(a)
+        ax.set_title(f'{a}: median, 50% and 90% bands')
+        ax.grid(True)
+        ax.legend()
+    fig.tight_layout()
+    fig.savefig(path, dpi=100)
+    plt.close(fig)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Monte Carlo projection of Cac/Ncpv/Pav trajectories per set.')
+    parser.add_argument('--sets', nargs='*', default=list(keto_data.LEAF_ORDER))
+    parser.add_argument('--attributes', nargs='*', default=list(ATTRIBUTES))
+    parser.add_argument('--thresholds', nargs='*', default=list(DEFAULT_THRESHOLDS),
+                        help="absolute ('Cac=100') or relative to the last visit ('Ncpv=2x')")
+    parser.add_argument('--draws', type=int, default=10_000, help='rate draws per participant')
+    parser.add_argument('--years', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--out', default=DEFAULT_FANS)
+    parser.add_argument('--plot', default=None, help='fan chart image')
+    parser.add_argument('--synthetic', type=int, default=0)
+    args = parser.parse_args()
+
+    store = keto_data.synthetic_cohort(args.synthetic) if args.synthetic else keto_data.load()
+    results = simulate(store, args.sets, args.attributes, args.thresholds, args.draws, args.years, args.seed,
+                       args.workers)
+    fans = fan_table(results)
+    fans.to_csv(args.out, index=False, float_format='%.6g')
+    print(f"{len(fans)} fan rows ({args.draws} draws x {args.years} years) written to '{args.out}'")
+    with pd.option_context('display.width', 200, 'display.float_format', '{:.4g}'.format):
+        print(f"Time to threshold ({', '.join(args.thresholds)}) within {args.years} years:")
+        print(threshold_table(results).to_string(index=False))
+    if args.plot:
+        with stage('fan plot', len(fans)):
+            plot_fans(fans, args.plot)
+        print(f"Fan chart written to '{args.plot}'")
+
+
+if __name__ == '__main__':
+    main()